@@ -0,0 +1,48 @@
+# analysis.py
+import asyncio
+from langchain_core.prompts import ChatPromptTemplate
+
+from models import DocumentAnalysis
+from metrics import span
+
+# Number of leading chunks used for a quicker analysis
+ANALYSIS_CHUNKS = 4
+
+summary_prompt = ChatPromptTemplate.from_template(
+    "Provide a concise, professional summary (around 100-150 words) of the following document content: \n\n{document}"
+)
+actions_prompt = ChatPromptTemplate.from_template(
+    "Extract the 3 to 5 most important, actionable tasks from the following document. Present them as a bulleted list. If no clear action items exist, respond with 'None'. \n\n{document}"
+)
+role_prompt = ChatPromptTemplate.from_template(
+    "Read the document and determine the single most relevant employee role to handle it. Choose ONLY from this list: [Finance Manager, Customer Manager, Safety Manager, HR Coordinator, Legal Counsel, Rolling Stock Engineer]. Respond with ONLY the role name. Document: \n\n{document}"
+)
+
+
+async def analyze_document(llm, analysis_text: str) -> DocumentAnalysis:
+    """LLM analysis for summary, actions and role."""
+    # Create chains by piping prompts into the LLM
+    summary_chain = summary_prompt | llm
+    actions_chain = actions_prompt | llm
+    role_chain = role_prompt | llm
+
+    # Asynchronously run all analysis chains
+    with span("ingest", "analysis"):
+        summary_result, actions_result, role_result = await asyncio.gather(
+            summary_chain.ainvoke({"document": analysis_text}),
+            actions_chain.ainvoke({"document": analysis_text}),
+            role_chain.ainvoke({"document": analysis_text})
+        )
+
+    # Process the action items string into a clean list
+    action_items_list = [
+        line.strip().lstrip('-* ').strip() for line in actions_result.split('\n')
+        if line.strip() and "none" not in line.lower()
+    ]
+
+    # Create the final analysis object with real data
+    return DocumentAnalysis(
+        summary=summary_result.strip(),
+        action_items=action_items_list,
+        assigned_role=role_result.strip().replace("'", "").replace('"', '')
+    )
@@ -0,0 +1,145 @@
+# answer_cache.py
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Iterable, List, Optional, Set
+
+import numpy as np
+from langchain_core.documents import Document
+
+
+@dataclass
+class CachedAnswer:
+    vector: np.ndarray  # unit-length embedding of the standalone question
+    scope: Optional[str]  # filter_source the question was asked with, None for global search
+    history: Optional[str]  # fingerprint of the chat history in the answer prompt, None without history
+    answer: str
+    context: List[Document]
+    sources: Set[str] = field(default_factory=set)
+    created_at: float = field(default_factory=time.monotonic)
+
+
+class AnswerCache:
+    """
+    Semantic cache of chat answers. A question hits when its standalone form embeds within
+    `threshold` cosine similarity of a cached question asked with the same scope and the
+    same chat history (the answer prompt includes it, so answers given with one session's
+    history are not served to another), and returns the cached answer and context without
+    retrieval, reranking or generation.
+
+    Entries expire after `ttl_seconds` and the least recently used are evicted beyond
+    `max_entries`. Index changes invalidate the entries they can affect (see invalidate),
+    and bump `generation` so answers computed against the old corpus are not stored.
+    """
+
+    def __init__(self, max_entries: int = 1000, ttl_seconds: float = 3600, threshold: float = 0.95):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.threshold = threshold
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[int, CachedAnswer]" = OrderedDict()
+        self._next_key = 0
+        self._lock = threading.Lock()
+        # Stacked vectors of all entries, rebuilt lazily after changes
+        self._keys: List[int] = []
+        self._matrix: Optional[np.ndarray] = None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def _normalize(vector) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _drop(self, key: int):
+        del self._entries[key]
+        self._matrix = None
+
+    def _stacked(self):
+        if self._matrix is None:
+            self._keys = list(self._entries)
+            self._matrix = np.stack([self._entries[key].vector for key in self._keys]) if self._keys else None
+        return self._keys, self._matrix
+
+    def lookup(self, vector, scope: Optional[str], history: Optional[str] = None) -> Optional[CachedAnswer]:
+        query = self._normalize(vector)
+        with self._lock:
+            keys, matrix = self._stacked()
+            if matrix is not None:
+                similarities = matrix @ query
+                for position in np.argsort(-similarities):
+                    if similarities[position] < self.threshold:
+                        break
+                    entry = self._entries[keys[position]]
+                    if entry.scope != scope or entry.history != history:
+                        continue
+                    if time.monotonic() - entry.created_at > self.ttl_seconds:
+                        # A less similar entry may still be fresh
+                        self._drop(keys[position])
+                        continue
+                    self._entries.move_to_end(keys[position])
+                    self.hits += 1
+                    return entry
+            self.misses += 1
+            return None
+
+    def put(self, vector, scope: Optional[str], answer: str, context: List[Document], generation: int,
+            history: Optional[str] = None):
+        """Caches an answer, unless the index changed since `generation` was read."""
+        entry = CachedAnswer(
+            vector=self._normalize(vector), scope=scope, history=history, answer=answer, context=list(context),
+            sources={
+                source for doc in context
+                for source in doc.metadata.get("sources") or [doc.metadata.get("source", "N/A")]
+            },
+        )
+        with self._lock:
+            if generation != self.generation:
+                return
+            self._entries[self._next_key] = entry
+            self._next_key += 1
+            self._matrix = None
+            if len(self._entries) > self.max_entries:
+                now = time.monotonic()
+                for key in [key for key, cached in self._entries.items() if now - cached.created_at > self.ttl_seconds]:
+                    self._drop(key)
+                while len(self._entries) > self.max_entries:
+                    self._drop(next(iter(self._entries)))
+
+    def invalidate(self, sources: Iterable[str], include_global: bool = False) -> int:
+        """
+        Drops answers scoped to, or citing, any of `sources`. Adding a document can also
+        change what global search finds, so uploads pass include_global=True; a delete
+        only affects the answers that used the deleted document. Returns the number dropped.
+        """
+        sources = set(sources)
+        with self._lock:
+            self.generation += 1
+            stale = [
+                key for key, entry in self._entries.items()
+                if entry.scope in sources or entry.sources & sources or (include_global and entry.scope is None)
+            ]
+            for key in stale:
+                self._drop(key)
+        return len(stale)
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+def history_fingerprint(messages: Iterable) -> Optional[str]:
+    """Identifies the chat history sent with a question; None when there is none."""
+    digest = hashlib.sha1()
+    empty = True
+    for message in messages:
+        empty = False
+        digest.update(f"{message.type}\0{message.content}\0".encode("utf-8"))
+    return None if empty else digest.hexdigest()
@@ -0,0 +1,359 @@
+"""
+End-to-end latency / throughput benchmark for the API, runnable offline.
+
+Starts the app under uvicorn in a subprocess with deterministic fake backends (hashed
+bag-of-words embeddings, a token-overlap reranker and a canned LLM), so the numbers
+measure this service rather than Ollama or the reranker model. Then:
+
+  1. uploads the files in sampledata/ and a synthetic corpus (--synthetic-chunks in total)
+     through /api/upload-and-process,
+  2. restarts the server to time startup with the corpus loaded,
+  3. runs /api/documents, /api/chat (global and filter_source) and /api/chat/stream at
+     --concurrency, and finally deletes the synthetic documents.
+
+Reports per-scenario p50/p95/p99 latency and requests per second, startup times and the
+server's peak RSS, and writes them as JSON for comparison between releases.
+
+    python benchmarks/api_benchmark.py --synthetic-chunks 100000 --output results.json
+    python benchmarks/api_benchmark.py --synthetic-chunks 5000 --requests 100 --compare results.json
+"""
+import os
+import re
+import sys
+import json
+import time
+import zlib
+import socket
+import signal
+import asyncio
+import argparse
+import platform
+import tempfile
+import subprocess
+from typing import Dict, List, Optional
+
+import httpx
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLEDATA_DIR = os.path.join(os.path.dirname(BACKEND_DIR), "sampledata")
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+# --- Fake backends, used inside the server process ---
+def install_fake_backends(dimension: int):
+    # main.py imports the model classes when it loads them, so patch them where they are defined
+    import langchain_ollama
+    import langchain_community.cross_encoders
+    from langchain_core.embeddings import Embeddings
+    from langchain_core.language_models import FakeListLLM
+    from langchain_community.cross_encoders.base import BaseCrossEncoder
+
+    class HashEmbeddings(Embeddings):
+        """Hashed bag of words: deterministic, cheap, and similar texts get similar vectors."""
+
+        def _embed(self, text: str) -> List[float]:
+            tokens = _TOKEN.findall(text.lower()) or [""]
+            counts = np.bincount([zlib.crc32(token.encode()) % dimension for token in tokens], minlength=dimension)
+            vector = counts.astype(np.float32)
+            return (vector / np.linalg.norm(vector)).tolist()
+
+        def embed_documents(self, texts: List[str]) -> List[List[float]]:
+            return [self._embed(text) for text in texts]
+
+        def embed_query(self, text: str) -> List[float]:
+            return self._embed(text)
+
+    class OverlapCrossEncoder(BaseCrossEncoder):
+        def __init__(self, **kwargs):
+            pass
+
+        def score(self, text_pairs):
+            return [float(len(set(_TOKEN.findall(query.lower())) & set(_TOKEN.findall(doc.lower()))))
+                    for query, doc in text_pairs]
+
+    answer = "The documents state the requested details. - Review the order\n- Confirm the schedule"
+    langchain_ollama.OllamaLLM = lambda **kwargs: FakeListLLM(responses=[answer, "Safety Manager"])
+    langchain_ollama.OllamaEmbeddings = lambda **kwargs: HashEmbeddings()
+    langchain_community.cross_encoders.HuggingFaceCrossEncoder = OverlapCrossEncoder
+
+
+def serve(port: int, dimension: int):
+    sys.path.insert(0, BACKEND_DIR)
+    import uvicorn
+    import main
+    install_fake_backends(dimension)
+    uvicorn.run(main.app, host="127.0.0.1", port=port, log_level="warning")
+
+
+# --- Synthetic corpus ---
+def vocabulary() -> List[str]:
+    words = set()
+    for name in sorted(os.listdir(SAMPLEDATA_DIR)):
+        if name.endswith(".txt"):
+            with open(os.path.join(SAMPLEDATA_DIR, name), encoding="utf-8", errors="ignore") as f:
+                words.update(word for word in _TOKEN.findall(f.read().lower()) if len(word) > 2)
+    return sorted(words)
+
+
+def synthetic_document(rng: np.random.Generator, words: List[str], n_chars: int) -> str:
+    # Each document leans on its own topic words, so retrieval has something to find
+    topic = rng.choice(words, size=40, replace=False)
+    sentences, length = [], 0
+    while length < n_chars:
+        pool = topic if rng.random() < 0.5 else words
+        sentence = " ".join(rng.choice(pool, size=int(rng.integers(8, 20)))).capitalize() + "."
+        sentences.append(sentence)
+        length += len(sentence) + 1
+    return "\n".join(" ".join(sentences[i:i + 6]) for i in range(0, len(sentences), 6))
+
+
+def questions(rng: np.random.Generator, words: List[str], count: int) -> List[str]:
+    return [f"What does the document say about {' '.join(rng.choice(words, size=int(rng.integers(2, 5))))}?"
+            for _ in range(count)]
+
+
+# --- Measurement ---
+def summarize(latencies: List[float], errors: int, elapsed: float) -> Dict[str, float]:
+    result = {"requests": len(latencies) + errors, "errors": errors,
+              "rps": round((len(latencies) + errors) / elapsed, 2) if elapsed else 0.0}
+    if latencies:
+        result.update({f"p{p}_ms": round(float(np.percentile(latencies, p)), 2) for p in (50, 95, 99)})
+        result["mean_ms"] = round(float(np.mean(latencies)), 2)
+    return result
+
+
+async def run_scenario(client: httpx.AsyncClient, requests: List[dict], concurrency: int) -> Dict[str, float]:
+    """
+    Sends `requests` (httpx.request kwargs) with at most `concurrency` in flight. Error
+    statuses and transport failures (timeouts, dropped connections) count as errors.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, errors = [], 0
+
+    async def send(kwargs):
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                response = await client.request(**kwargs)
+                await response.aread()
+            except httpx.HTTPError:
+                errors += 1
+                return
+            if response.status_code >= 400:
+                errors += 1
+            else:
+                latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(send(kwargs) for kwargs in requests))
+    return summarize(latencies, errors, time.perf_counter() - started)
+
+
+class Server:
+    """The app in a subprocess, so startup time and RSS are its own."""
+
+    def __init__(self, workdir: str, port: int, dimension: int):
+        self.workdir, self.port, self.dimension = workdir, port, dimension
+        self.url = f"http://127.0.0.1:{port}"
+        self.process: Optional[subprocess.Popen] = None
+
+    def start(self, timeout: float = 600) -> float:
+        """Starts the server and returns the seconds until it answers requests."""
+        started = time.perf_counter()
+        os.makedirs(self.workdir, exist_ok=True)
+        log = open(os.path.join(self.workdir, "server.log"), "a")
+        self.process = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "--serve", "--port", str(self.port), "--dim", str(self.dimension)],
+            cwd=self.workdir, stdout=log, stderr=subprocess.STDOUT,
+        )
+        while time.perf_counter() - started < timeout:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"Server exited during startup, see {log.name}")
+            try:
+                if httpx.get(f"{self.url}/api/documents", timeout=1).status_code == 200:
+                    return time.perf_counter() - started
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.05)
+        raise TimeoutError("Server did not start in time")
+
+    def peak_rss_mb(self) -> Optional[float]:
+        # Linux only: the high-water mark of the server's resident set
+        try:
+            with open(f"/proc/{self.process.pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmHWM:"):
+                        return round(int(line.split()[1]) / 1024, 1)
+        except OSError:
+            return None
+        return None
+
+    def stop(self):
+        # SIGINT lets the lifespan shutdown run, which snapshots the index
+        self.process.send_signal(signal.SIGINT)
+        try:
+            self.process.wait(timeout=300)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def upload_request(filename: str, content: bytes) -> dict:
+    return {"method": "POST", "url": "/api/upload-and-process", "files": {"file": (filename, content)}}
+
+
+async def benchmark(args, server: Server) -> Dict:
+    rng = np.random.default_rng(args.seed)
+    words = vocabulary()
+    results: Dict = {"scenarios": {}}
+    scenarios = results["scenarios"]
+
+    async with httpx.AsyncClient(base_url=server.url, timeout=None) as client:
+        # --- Ingest ---
+        sample_files = sorted(name for name in os.listdir(SAMPLEDATA_DIR) if not name.lower().endswith(".md"))
+        sample_uploads = []
+        for name in sample_files:
+            with open(os.path.join(SAMPLEDATA_DIR, name), "rb") as f:
+                sample_uploads.append(upload_request(name, f.read()))
+        scenarios["upload_sampledata"] = await run_scenario(client, sample_uploads, 1)
+
+        synthetic_names = []
+        if args.synthetic_chunks:
+            # The splitter makes ~1000-character chunks with 150 characters of overlap
+            n_docs = max(1, args.synthetic_chunks // args.chunks_per_doc)
+            chars = args.chunks_per_doc * 850
+            uploads = []
+            for i in range(n_docs):
+                name = f"synthetic-{i:05d}.txt"
+                synthetic_names.append(name)
+                uploads.append(upload_request(name, synthetic_document(rng, words, chars).encode()))
+            started = time.perf_counter()
+            scenarios["upload_synthetic"] = await run_scenario(client, uploads, args.upload_concurrency)
+            scenarios["upload_synthetic"]["chunks_per_second"] = round(
+                n_docs * args.chunks_per_doc / (time.perf_counter() - started), 1
+            )
+
+    metrics_text = httpx.get(f"{server.url}/metrics").text
+    chunks = re.search(r'rag_corpus_size\{unit="chunks"\} ([0-9.e+]+)', metrics_text)
+    results["corpus_chunks"] = int(float(chunks.group(1))) if chunks else None
+
+    results["peak_rss_ingest_mb"] = server.peak_rss_mb()
+
+    # --- Startup with the corpus loaded ---
+    server.stop()
+    results["startup_loaded_s"] = round(server.start(), 3)
+
+    async with httpx.AsyncClient(base_url=server.url, timeout=None) as client:
+        # --- Reads and chat ---
+        scenarios["list_documents"] = await run_scenario(
+            client, [{"method": "GET", "url": "/api/documents"}] * args.requests, args.concurrency
+        )
+        chat_questions = questions(rng, words, args.requests)
+        scenarios["chat_global"] = await run_scenario(client, [
+            {"method": "POST", "url": "/api/chat", "json": {"query": question, "session_id": f"bench-{i}"}}
+            for i, question in enumerate(chat_questions)
+        ], args.concurrency)
+        sources = synthetic_names or sample_files
+        scenarios["chat_filter_source"] = await run_scenario(client, [
+            {"method": "POST", "url": "/api/chat",
+             "json": {"query": question, "session_id": f"bench-scoped-{i}", "filter_source": sources[i % len(sources)]}}
+            for i, question in enumerate(questions(rng, words, args.requests))
+        ], args.concurrency)
+        scenarios["chat_stream"] = await run_scenario(client, [
+            {"method": "POST", "url": "/api/chat/stream", "json": {"query": question, "session_id": f"bench-stream-{i}"}}
+            for i, question in enumerate(questions(rng, words, args.requests))
+        ], args.concurrency)
+        # The same questions again, as answered from the answer cache
+        scenarios["chat_repeated"] = await run_scenario(client, [
+            {"method": "POST", "url": "/api/chat", "json": {"query": question, "session_id": f"bench-repeat-{i}"}}
+            for i, question in enumerate(chat_questions)
+        ], args.concurrency)
+
+        # --- Deletes ---
+        deletes = synthetic_names[:args.deletes] or sample_files[:args.deletes]
+        scenarios["delete_document"] = await run_scenario(
+            client, [{"method": "DELETE", "url": f"/api/documents/{name}"} for name in deletes], 1
+        )
+
+    results["peak_rss_mb"] = server.peak_rss_mb()
+    return results
+
+
+def compare(results: Dict, baseline_path: str, tolerance: float):
+    """Prints the p95 latencies and throughputs that regressed by more than `tolerance` against a saved run."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    if baseline.get("config") != results["config"]:
+        print(f"\nWarning: {baseline_path} was run with different options, the comparison may not be meaningful.")
+    regressions = []
+    for name, current in results["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if not previous:
+            continue
+        if "p95_ms" in previous and current.get("p95_ms", 0) > previous["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {previous['p95_ms']} -> {current['p95_ms']} ms")
+        if previous.get("rps") and current["rps"] < previous["rps"] * (1 - tolerance):
+            regressions.append(f"{name}: {previous['rps']} -> {current['rps']} requests/s")
+    for key in ("startup_empty_s", "startup_loaded_s", "peak_rss_ingest_mb", "peak_rss_mb"):
+        if baseline.get(key) and results.get(key) and results[key] > baseline[key] * (1 + tolerance):
+            regressions.append(f"{key}: {baseline[key]} -> {results[key]}")
+    print("\nRegressions against", baseline_path, "\n  " + "\n  ".join(regressions) if regressions else "\nNo regressions.")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--synthetic-chunks", type=int, default=100_000, help="Approximate chunks in the synthetic corpus")
+    parser.add_argument("--chunks-per-doc", type=int, default=500)
+    parser.add_argument("--upload-concurrency", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=500, help="Requests per read / chat scenario")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--deletes", type=int, default=10)
+    parser.add_argument("--dim", type=int, default=256, help="Fake embedding dimension")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", help="Where the server keeps its data (default: a new temporary directory)")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--compare", help="A previous results file to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed slowdown before flagging a regression")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, default=0, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.port, args.dim)
+        return
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="rag-benchmark-")
+    server = Server(workdir, free_port(), args.dim)
+    results = {
+        "config": {key: value for key, value in vars(args).items() if key not in ("serve", "port", "output", "compare")},
+        "environment": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "startup_empty_s": round(server.start(), 3),
+    }
+    try:
+        results.update(asyncio.run(benchmark(args, server)))
+    finally:
+        server.stop()
+
+    print(f"Startup: {results['startup_empty_s']}s empty, {results.get('startup_loaded_s')}s with "
+          f"{results.get('corpus_chunks')} chunks; peak RSS {results.get('peak_rss_ingest_mb')} MB ingesting, "
+          f"{results.get('peak_rss_mb')} MB serving")
+    for name, scenario in results.get("scenarios", {}).items():
+        print(f"  {name:<20} " + " ".join(f"{key}={value}" for key, value in scenario.items()))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        sys.exit(1 if compare(results, args.compare, args.tolerance) else 0)
+
+
+if __name__ == "__main__":
+    main()
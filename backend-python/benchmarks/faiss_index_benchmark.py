@@ -0,0 +1,119 @@
+"""
+Recall / throughput / memory benchmark for the FAISS index types in faiss_index.py.
+
+Builds each index type on a synthetic, clustered corpus (embeddings are not uniformly
+random, so clustered data gives realistic IVF behaviour), then reports, per search
+setting, recall@k against exact Flat search, queries per second and index size.
+
+    python benchmarks/faiss_index_benchmark.py --sizes 10000 100000 1000000 --dim 1024
+    python benchmarks/faiss_index_benchmark.py --types HNSW --ef-search 32 64 128 --output hnsw.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+import faiss
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from faiss_index import INDEX_TYPES, apply_search_params, build_index, make_id_index, memory_bytes
+
+
+def synthetic_corpus(n_vectors: int, dimension: int, n_queries: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    n_clusters = max(8, int(np.sqrt(n_vectors)))
+    centers = rng.standard_normal((n_clusters, dimension), dtype=np.float32)
+    assignments = rng.integers(0, n_clusters, n_vectors)
+    vectors = centers[assignments] + 0.5 * rng.standard_normal((n_vectors, dimension), dtype=np.float32)
+    # Queries are perturbed corpus points, like questions about an indexed chunk
+    picks = rng.integers(0, n_vectors, n_queries)
+    queries = vectors[picks] + 0.3 * rng.standard_normal((n_queries, dimension), dtype=np.float32)
+    return vectors, queries
+
+
+def recall_at_k(found: np.ndarray, truth: np.ndarray) -> float:
+    hits = sum(len(set(f[f >= 0]) & set(t)) for f, t in zip(found, truth))
+    return hits / truth.size
+
+
+def timed_search(index, queries: np.ndarray, k: int):
+    started = time.perf_counter()
+    # One query at a time, like the chat endpoint
+    results = np.vstack([index.search(queries[i:i + 1], k)[1] for i in range(len(queries))])
+    elapsed = time.perf_counter() - started
+    return results, len(queries) / elapsed
+
+
+def run(args) -> list:
+    faiss.omp_set_num_threads(args.threads)
+    results = []
+    params = {"hnsw_m": args.hnsw_m, "hnsw_ef_construction": args.ef_construction,
+              "ivf_nlist": args.nlist, "pq_m": args.pq_m, "pq_nbits": args.pq_nbits}
+
+    for n_vectors in args.sizes:
+        vectors, queries = synthetic_corpus(n_vectors, args.dim, args.queries)
+        ids = np.arange(n_vectors, dtype=np.int64)
+
+        exact = faiss.IndexFlatL2(args.dim)
+        exact.add(vectors)
+        _, truth = exact.search(queries, args.k)
+
+        for index_type in args.types:
+            started = time.perf_counter()
+            index = make_id_index(build_index(index_type, vectors, **params))
+            train_s = time.perf_counter() - started
+            index.add_with_ids(vectors, ids)
+            build_s = time.perf_counter() - started
+
+            if index_type == "HNSW":
+                settings_grid = [{"ef_search": ef} for ef in args.ef_search]
+            elif index_type.startswith("IVF"):
+                settings_grid = [{"nprobe": nprobe} for nprobe in args.nprobe]
+            else:
+                settings_grid = [{}]
+
+            size = memory_bytes(index)
+            for search_settings in settings_grid:
+                apply_search_params(index, **search_settings)
+                found, qps = timed_search(index, queries, args.k)
+                row = {
+                    "n_vectors": n_vectors, "dim": args.dim, "index_type": index_type, **search_settings,
+                    f"recall@{args.k}": round(recall_at_k(found, truth), 4),
+                    "qps": round(qps, 1), "memory_mb": round(size / 2**20, 1),
+                    "train_s": round(train_s, 2), "build_s": round(build_s, 2),
+                }
+                results.append(row)
+                print(json.dumps(row))
+        del vectors, exact
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--dim", type=int, default=1024, help="mxbai-embed-large produces 1024-d vectors")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=30, help="the chat pipeline retrieves k=30 candidates")
+    parser.add_argument("--types", nargs="+", default=list(INDEX_TYPES), choices=INDEX_TYPES)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[4, 16, 64])
+    parser.add_argument("--ef-search", type=int, nargs="+", default=[32, 64, 128])
+    parser.add_argument("--nlist", type=int, default=0, help="0 picks ~4*sqrt(n)")
+    parser.add_argument("--hnsw-m", type=int, default=32)
+    parser.add_argument("--ef-construction", type=int, default=200)
+    parser.add_argument("--pq-m", type=int, default=16)
+    parser.add_argument("--pq-nbits", type=int, default=8)
+    parser.add_argument("--threads", type=int, default=1)
+    parser.add_argument("--output", help="write all rows to this JSON file")
+    args = parser.parse_args()
+
+    results = run(args)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+A stand-in Ollama server for load-testing the gateway in ollama_gateway.py without a GPU.
+
+Implements the endpoints the backend uses, /api/embed and /api/generate (streamed or
+not), with configurable latency, and records what reached it at GET /stats: requests,
+peak concurrency and embedding batch sizes.
+
+    python benchmarks/fake_ollama.py --port 11435 --embed-ms 20 --token-ms 10
+    OLLAMA_BASE_URL=http://localhost:11435 python main.py
+"""
+import json
+import time
+import hashlib
+import argparse
+import threading
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+
+class FakeOllamaState:
+    def __init__(self, dimension: int, embed_ms: float, token_ms: float, tokens: int):
+        self.dimension = dimension
+        self.embed_ms = embed_ms
+        self.token_ms = token_ms
+        self.tokens = tokens
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.requests = {"embed": 0, "generate": 0}
+        self.embedded_texts = 0
+
+    def enter(self, kind: str):
+        with self.lock:
+            self.requests[kind] += 1
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def exit(self):
+        with self.lock:
+            self.in_flight -= 1
+
+    def embed(self, text: str):
+        # Deterministic unit vector per text, so repeated texts embed identically
+        seed = int.from_bytes(hashlib.sha1(text.encode("utf-8")).digest()[:8], "little")
+        vector = np.random.default_rng(seed).standard_normal(self.dimension)
+        return (vector / np.linalg.norm(vector)).round(6).tolist()
+
+    def stats(self):
+        with self.lock:
+            embeds = self.requests["embed"]
+            return {
+                "requests": dict(self.requests),
+                "in_flight": self.in_flight,
+                "peak_in_flight": self.peak_in_flight,
+                "embedded_texts": self.embedded_texts,
+                "avg_embed_batch": round(self.embedded_texts / embeds, 2) if embeds else 0.0,
+            }
+
+
+def make_handler(state: FakeOllamaState):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # Keep-alive, like Ollama
+
+        def log_message(self, *args):
+            pass
+
+        def _send_json(self, payload, status: int = 200):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == "/stats":
+                self._send_json(state.stats())
+            elif self.path == "/api/tags":
+                self._send_json({"models": []})
+            else:
+                self._send_json({"error": "not found"}, 404)
+
+        def do_POST(self):
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            if self.path == "/api/embed":
+                self._embed(request)
+            elif self.path == "/api/generate":
+                self._generate(request)
+            else:
+                self._send_json({"error": "not found"}, 404)
+
+        def _embed(self, request):
+            texts = request.get("input", [])
+            texts = [texts] if isinstance(texts, str) else texts
+            state.enter("embed")
+            try:
+                # A batch costs a little more than one text, far less than one request each
+                time.sleep(state.embed_ms * (1 + 0.05 * (len(texts) - 1)) / 1000)
+                with state.lock:
+                    state.embedded_texts += len(texts)
+                self._send_json({"model": request.get("model"), "embeddings": [state.embed(text) for text in texts]})
+            finally:
+                state.exit()
+
+        def _generate(self, request):
+            state.enter("generate")
+            try:
+                words = [f"word{i} " for i in range(state.tokens)]
+                created_at = datetime.now(timezone.utc).isoformat()
+                if not request.get("stream", True):
+                    time.sleep(state.token_ms * state.tokens / 1000)
+                    self._send_json({"model": request.get("model"), "created_at": created_at,
+                                     "response": "".join(words), "done": True, "done_reason": "stop"})
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for word in words + [None]:
+                    time.sleep(state.token_ms / 1000 if word else 0)
+                    part = {"model": request.get("model"), "created_at": created_at, "response": word or "",
+                            "done": word is None}
+                    if word is None:
+                        part["done_reason"] = "stop"
+                    line = (json.dumps(part) + "\n").encode("utf-8")
+                    self.wfile.write(b"%x\r\n%s\r\n" % (len(line), line))
+                    self.wfile.flush()
+                self.wfile.write(b"0\r\n\r\n")
+            finally:
+                state.exit()
+
+    return Handler
+
+
+def serve(port: int = 0, dimension: int = 1024, embed_ms: float = 20, token_ms: float = 10, tokens: int = 20):
+    """Starts the server on a background thread. Returns (server, state); the port is server.server_port."""
+    state = FakeOllamaState(dimension, embed_ms, token_ms, tokens)
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(state))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-ollama", daemon=True).start()
+    return server, state
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--dim", type=int, default=1024)
+    parser.add_argument("--embed-ms", type=float, default=20, help="Latency of one embedding request")
+    parser.add_argument("--token-ms", type=float, default=10, help="Latency per generated token")
+    parser.add_argument("--tokens", type=int, default=20, help="Tokens per generation")
+    args = parser.parse_args()
+
+    server, _ = serve(args.port, args.dim, args.embed_ms, args.token_ms, args.tokens)
+    print(f"Fake Ollama listening on http://127.0.0.1:{server.server_port}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Load test for the Ollama gateway against the fake server in fake_ollama.py.
+
+Simulates concurrent chat turns (a query embedding, then a streamed answer) through the
+same clients main.py builds, with and without query batching, and reports latency
+percentiles, the embedding requests that reached the server, its peak concurrency
+(which must stay within the limits) and how many turns were rejected with a 503.
+
+    python benchmarks/ollama_gateway_benchmark.py --concurrency 8 32 128 --max-queue 64
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+
+import numpy as np
+from langchain_ollama import OllamaEmbeddings, OllamaLLM
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_ollama import serve
+from ollama_gateway import BatchingEmbeddings, ConcurrencyLimiter, OllamaOverloadedError, client_kwargs
+
+
+def build_clients(base_url: str, args, batching: bool):
+    llm_limiter = ConcurrencyLimiter("generation", args.max_generations, args.max_queue)
+    embedding_limiter = ConcurrencyLimiter("embedding", args.max_embeddings, args.max_queue)
+    llm = OllamaLLM(model="fake", base_url=base_url, **client_kwargs(llm_limiter, args.max_generations))
+    embeddings = OllamaEmbeddings(model="fake", base_url=base_url, **client_kwargs(embedding_limiter, args.max_embeddings))
+    if batching:
+        embeddings = BatchingEmbeddings(embeddings, window_ms=args.window_ms, max_batch=args.max_batch)
+    return llm, embeddings, llm_limiter, embedding_limiter
+
+
+async def run(base_url: str, args, concurrency: int, batching: bool):
+    llm, embeddings, llm_limiter, embedding_limiter = build_clients(base_url, args, batching)
+    latencies, rejected = [], 0
+
+    async def turn(i: int):
+        nonlocal rejected
+        started = time.perf_counter()
+        try:
+            await embeddings.aembed_query(f"question {i}")
+            async for _ in llm.astream(f"answer question {i}"):
+                pass
+            latencies.append((time.perf_counter() - started) * 1000)
+        except OllamaOverloadedError:
+            rejected += 1
+
+    started = time.perf_counter()
+    for start in range(0, args.turns, concurrency):
+        await asyncio.gather(*(turn(i) for i in range(start, min(start + concurrency, args.turns))))
+    elapsed = time.perf_counter() - started
+    if isinstance(embeddings, BatchingEmbeddings):
+        embeddings.close()
+
+    result = {
+        "concurrency": concurrency,
+        "query_batching": batching,
+        "turns_per_second": round(args.turns / elapsed, 1),
+        "rejected": rejected,
+        "generation": llm_limiter.stats(),
+        "embedding": embedding_limiter.stats(),
+    }
+    if latencies:
+        result.update({f"p{p}_ms": round(float(np.percentile(latencies, p)), 1) for p in (50, 95, 99)})
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[8, 32, 128])
+    parser.add_argument("--turns", type=int, default=256)
+    parser.add_argument("--max-generations", type=int, default=4)
+    parser.add_argument("--max-embeddings", type=int, default=4)
+    parser.add_argument("--max-queue", type=int, default=64)
+    parser.add_argument("--window-ms", type=float, default=5)
+    parser.add_argument("--max-batch", type=int, default=32)
+    parser.add_argument("--embed-ms", type=float, default=20)
+    parser.add_argument("--token-ms", type=float, default=2)
+    parser.add_argument("--tokens", type=int, default=20)
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    args = parser.parse_args()
+
+    results = []
+    for concurrency in args.concurrency:
+        for batching in (False, True):
+            # A fresh server per run, so its counters belong to this run only
+            server, state = serve(embed_ms=args.embed_ms, token_ms=args.token_ms, tokens=args.tokens, dimension=256)
+            result = asyncio.run(run(f"http://127.0.0.1:{server.server_port}", args, concurrency, batching))
+            server.shutdown()
+            result["server"] = state.stats()
+            results.append(result)
+            print(
+                f"concurrency={concurrency:<4} batching={str(batching):<5} "
+                f"p50={result.get('p50_ms', 0):>8.1f}ms p99={result.get('p99_ms', 0):>8.1f}ms "
+                f"turns/s={result['turns_per_second']:>7.1f} rejected={result['rejected']:<4} "
+                f"embed_requests={result['server']['requests']['embed']:<4} "
+                f"server_peak={result['server']['peak_in_flight']}"
+            )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+# bm25_index.py
+import os
+import json
+import math
+import heapq
+from collections import Counter
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from pydantic import ConfigDict
+
+BM25_INDEX_FILE = "bm25_index.json"
+
+
+def default_preprocess(text: str) -> List[str]:
+    # Same tokenization as langchain's BM25Retriever, so scores line up with the old index.
+    return text.split()
+
+
+class IncrementalBM25:
+    """
+    An Okapi BM25 inverted index that supports adding and removing chunks in place.
+
+    Scoring follows rank_bm25.BM25Okapi (k1=1.5, b=0.75, epsilon=0.25), which is what
+    BM25Retriever used, so the ranking seen by the EnsembleRetriever does not change.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75, epsilon: float = 0.25):
+        self.k1 = k1
+        self.b = b
+        self.epsilon = epsilon
+        self.postings: Dict[str, Dict[str, int]] = {}  # term -> {chunk_id: term frequency}
+        self.doc_lengths: Dict[str, int] = {}          # chunk_id -> number of tokens
+        self.total_length = 0
+        # Cached IDF statistics, recomputed lazily after the corpus changes
+        self._idf: Dict[str, float] = {}
+        self._average_idf = 0.0
+        self._dirty = True
+
+    def __len__(self) -> int:
+        return len(self.doc_lengths)
+
+    def __contains__(self, chunk_id: str) -> bool:
+        return chunk_id in self.doc_lengths
+
+    @property
+    def average_length(self) -> float:
+        return self.total_length / len(self.doc_lengths) if self.doc_lengths else 0.0
+
+    def add(self, chunk_id: str, tokens: List[str]):
+        if chunk_id in self.doc_lengths:
+            self.remove([chunk_id])
+        for term, freq in Counter(tokens).items():
+            self.postings.setdefault(term, {})[chunk_id] = freq
+        self.doc_lengths[chunk_id] = len(tokens)
+        self.total_length += len(tokens)
+        self._dirty = True
+
+    def remove(self, chunk_ids: Iterable[str], tokens_by_id: Optional[Dict[str, List[str]]] = None):
+        """
+        Removes chunks from the index. When the chunk tokens are known only their
+        postings are touched, otherwise every posting list is scanned.
+        """
+        ids = {chunk_id for chunk_id in chunk_ids if chunk_id in self.doc_lengths}
+        if not ids:
+            return
+        if tokens_by_id is not None and ids.issubset(tokens_by_id):
+            terms = {term for chunk_id in ids for term in tokens_by_id[chunk_id]}
+        else:
+            terms = list(self.postings)
+        for term in terms:
+            posting = self.postings.get(term)
+            if not posting:
+                continue
+            for chunk_id in ids:
+                posting.pop(chunk_id, None)
+            if not posting:
+                del self.postings[term]
+        for chunk_id in ids:
+            self.total_length -= self.doc_lengths.pop(chunk_id)
+        self._dirty = True
+
+    def _refresh_idf(self):
+        if not self._dirty:
+            return
+        corpus_size = len(self.doc_lengths)
+        idf, negative_terms, idf_sum = {}, [], 0.0
+        for term, posting in self.postings.items():
+            freq = len(posting)
+            value = math.log(corpus_size - freq + 0.5) - math.log(freq + 0.5)
+            idf[term] = value
+            idf_sum += value
+            if value < 0:
+                negative_terms.append(term)
+        self._average_idf = idf_sum / len(idf) if idf else 0.0
+        eps = self.epsilon * self._average_idf
+        for term in negative_terms:
+            idf[term] = eps
+        self._idf = idf
+        self._dirty = False
+
+    def top_n(self, query_tokens: List[str], n: int) -> List[Tuple[str, float]]:
+        """Returns up to n (chunk_id, score) pairs for chunks matching at least one query term."""
+        if not self.doc_lengths:
+            return []
+        self._refresh_idf()
+        k1, b, avgdl = self.k1, self.b, self.average_length
+        scores: Dict[str, float] = {}
+        # Repeated query terms count once per occurrence, as in BM25Okapi.get_scores
+        for term in query_tokens:
+            posting = self.postings.get(term)
+            if not posting:
+                continue
+            idf = self._idf[term]
+            for chunk_id, freq in posting.items():
+                norm = k1 * (1 - b + b * self.doc_lengths[chunk_id] / avgdl)
+                scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * (freq * (k1 + 1) / (freq + norm))
+        return heapq.nlargest(n, scores.items(), key=lambda item: item[1])
+
+    # --- Persistence ---
+    def to_dict(self) -> dict:
+        return {
+            "params": {"k1": self.k1, "b": self.b, "epsilon": self.epsilon},
+            "doc_lengths": self.doc_lengths,
+            "postings": self.postings,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "IncrementalBM25":
+        index = cls(**data.get("params", {}))
+        index.doc_lengths = {k: int(v) for k, v in data["doc_lengths"].items()}
+        index.postings = data["postings"]
+        index.total_length = sum(index.doc_lengths.values())
+        return index
+
+    def save(self, folder_path: str):
+        os.makedirs(folder_path, exist_ok=True)
+        path = os.path.join(folder_path, BM25_INDEX_FILE)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, folder_path: str) -> Optional["IncrementalBM25"]:
+        path = os.path.join(folder_path, BM25_INDEX_FILE)
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return cls.from_dict(json.load(f))
+
+
+class BM25IndexRetriever(BaseRetriever):
+    """
+    Keyword retriever backed by an IncrementalBM25 index. Chunk text is not duplicated
+    here, matching chunks are resolved through `get_document` (usually the FAISS docstore).
+    """
+
+    index: IncrementalBM25
+    get_document: Callable[[str], Optional[Document]]
+    preprocess_func: Callable[[str], List[str]] = default_preprocess
+    k: int = 4
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    def add_documents(self, ids: List[str], documents: List[Document]):
+        for chunk_id, doc in zip(ids, documents):
+            self.index.add(chunk_id, self.preprocess_func(doc.page_content))
+
+    def delete(self, ids: List[str], documents: Optional[List[Document]] = None):
+        tokens_by_id = None
+        if documents is not None:
+            tokens_by_id = {
+                chunk_id: self.preprocess_func(doc.page_content)
+                for chunk_id, doc in zip(ids, documents) if doc is not None
+            }
+        self.index.remove(ids, tokens_by_id)
+
+    def search_with_scores(self, query: str, k: int) -> List[Tuple[Document, float]]:
+        """The `k` best keyword matches as (doc, BM25 score), best first."""
+        results = []
+        for chunk_id, score in self.index.top_n(self.preprocess_func(query), k):
+            doc = self.get_document(chunk_id)
+            if doc is not None:
+                results.append((doc, score))
+        return results
+
+    def search(self, query: str, k: int) -> List[Document]:
+        """The `k` best keyword matches, overriding the retriever's default depth."""
+        return [doc for doc, _ in self.search_with_scores(query, k)]
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        return self.search(query, self.k)
+
+
+def docstore_lookup(vector_store) -> Callable[[str], Optional[Document]]:
+    """Returns a chunk_id -> Document resolver over the vector store's docstore."""
+    def get_document(chunk_id: str) -> Optional[Document]:
+        doc = vector_store.docstore.search(chunk_id)
+        return doc if isinstance(doc, Document) else None
+    return get_document
+
+
+def load_or_build_bm25(vector_store, folder_path: str, k: int = 4) -> Tuple[Optional[BM25IndexRetriever], bool]:
+    """
+    Loads the persisted BM25 index saved next to the FAISS index. If it is missing or out
+    of sync with the vector store (e.g. a store created before the index existed), it is
+    rebuilt from the chunk store. Returns the retriever and whether it was rebuilt, in
+    which case the caller saves it (to a new snapshot, never over the one it came from).
+    """
+    chunk_ids = set(vector_store.index_to_docstore_id.values())
+    if not chunk_ids:
+        return None, False
+
+    index = IncrementalBM25.load(folder_path)
+    rebuilt = index is None or set(index.doc_lengths) != chunk_ids
+    if rebuilt:
+        print("🔨 Building BM25 index from the docstore...")
+        index = IncrementalBM25()
+        for chunk_id, doc in vector_store.docstore.items(chunk_ids):
+            index.add(chunk_id, default_preprocess(doc.page_content))
+
+    return BM25IndexRetriever(index=index, get_document=docstore_lookup(vector_store), k=k), rebuilt
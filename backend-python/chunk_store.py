@@ -0,0 +1,130 @@
+# chunk_store.py
+import json
+import sqlite3
+import threading
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from langchain_community.docstore.base import AddableMixin, Docstore
+from langchain_core.documents import Document
+
+CHUNK_STORE_FILE = "chunks.sqlite3"
+# SQLite limits the number of bound parameters per statement
+_LOOKUP_BATCH_SIZE = 500
+
+
+class ChunkStore(Docstore, AddableMixin):
+    """
+    Docstore keeping chunk text and metadata in SQLite instead of a pickled dict in RAM.
+
+    Reads go through SQLite's memory-mapped I/O, so only the pages of chunks that are
+    actually looked up (retrieval and reranking results) are brought into memory, and
+    startup does not deserialize the corpus. Metadata is stored as JSON, never pickled.
+    Adds and deletes are idempotent, so write-ahead log replay can repeat them safely.
+
+    It also records which documents have each chunk (the source index's links, which a
+    deduplicated chunk's metadata cannot tell), so a source index can be rebuilt from it.
+    """
+
+    def __init__(self, db_path: str, mmap_bytes: int = 1024 * 1024 * 1024):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # Changes are applied after the write-ahead log records them; syncing each commit
+        # keeps the store from losing what a later snapshot will no longer replay
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.execute(f"PRAGMA mmap_size={int(mmap_bytes)}")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunks (id TEXT PRIMARY KEY, text TEXT NOT NULL, metadata TEXT NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS links (source TEXT NOT NULL, chunk_id TEXT NOT NULL, PRIMARY KEY (source, chunk_id))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_links_chunk_id ON links (chunk_id)")
+        self._conn.commit()
+
+    @staticmethod
+    def _to_document(chunk_id: str, text: str, metadata: str) -> Document:
+        return Document(id=chunk_id, page_content=text, metadata=json.loads(metadata))
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def search(self, search: str) -> Union[str, Document]:
+        with self._lock:
+            row = self._conn.execute("SELECT id, text, metadata FROM chunks WHERE id = ?", (search,)).fetchone()
+        if row is None:
+            return f"ID {search} not found."
+        return self._to_document(*row)
+
+    def mget(self, ids: Iterable[str]) -> Dict[str, Document]:
+        """Looks up many chunks at once. Missing IDs are left out of the result."""
+        ids = list(dict.fromkeys(ids))
+        found = {}
+        with self._lock:
+            for i in range(0, len(ids), _LOOKUP_BATCH_SIZE):
+                batch = ids[i:i + _LOOKUP_BATCH_SIZE]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT id, text, metadata FROM chunks WHERE id IN ({placeholders})", batch
+                ).fetchall()
+                for row in rows:
+                    found[row[0]] = self._to_document(*row)
+        return found
+
+    def add(self, texts: Dict[str, Document]) -> None:
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO chunks (id, text, metadata) VALUES (?, ?, ?)",
+                [(chunk_id, doc.page_content, json.dumps(doc.metadata)) for chunk_id, doc in texts.items()]
+            )
+            self._conn.commit()
+
+    def delete(self, ids: List) -> None:
+        with self._lock:
+            self._conn.executemany("DELETE FROM chunks WHERE id = ?", [(chunk_id,) for chunk_id in ids])
+            self._conn.executemany("DELETE FROM links WHERE chunk_id = ?", [(chunk_id,) for chunk_id in ids])
+            self._conn.commit()
+
+    # --- Links (source -> chunk IDs) ---
+    def link(self, links: Dict[str, List[str]]):
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO links (source, chunk_id) VALUES (?, ?)",
+                [(source, chunk_id) for source, chunk_ids in links.items() for chunk_id in chunk_ids]
+            )
+            self._conn.commit()
+
+    def unlink(self, links: Dict[str, List[str]]):
+        with self._lock:
+            self._conn.executemany(
+                "DELETE FROM links WHERE source = ? AND chunk_id = ?",
+                [(source, chunk_id) for source, chunk_ids in links.items() for chunk_id in chunk_ids]
+            )
+            self._conn.commit()
+
+    def links(self) -> Dict[str, List[str]]:
+        """Each document's chunk IDs, in the order they were linked."""
+        sources: Dict[str, List[str]] = {}
+        with self._lock:
+            for source, chunk_id in self._conn.execute("SELECT source, chunk_id FROM links ORDER BY rowid"):
+                sources.setdefault(source, []).append(chunk_id)
+        return sources
+
+    def has_links(self) -> bool:
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM links LIMIT 1").fetchone() is not None
+
+    def ids(self) -> List[str]:
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT id FROM chunks")]
+
+    def items(self, ids: Optional[Iterable[str]] = None) -> Iterator[Tuple[str, Document]]:
+        """Iterates over (chunk_id, Document), for all chunks or just `ids`, in batches."""
+        ids = self.ids() if ids is None else list(ids)
+        for i in range(0, len(ids), _LOOKUP_BATCH_SIZE):
+            yield from self.mget(ids[i:i + _LOOKUP_BATCH_SIZE]).items()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,93 @@
+# components.py
+import time
+import asyncio
+import traceback
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Sequence
+
+
+class ComponentUnavailableError(Exception):
+    """Raised when waiting for a component that failed to load."""
+
+
+@dataclass
+class Component:
+    name: str
+    loader: Callable[[], None]
+    requires: Sequence[str] = ()
+    essential: bool = True  # Whether the app is ready only once it is loaded
+    state: str = "pending"  # pending, loading, ready or failed
+    error: Optional[str] = None
+    load_ms: Optional[float] = None
+    loaded: asyncio.Event = field(default_factory=asyncio.Event)  # Set once ready or failed
+
+
+class ComponentRegistry:
+    """
+    Loads the app's heavy components (models, clients, the knowledge base) in the
+    background after startup, each in a thread as soon as the components it requires are
+    ready, so independent ones load concurrently and the server accepts traffic at once.
+    Requests that need a component wait for it; /health/ready reports when the essential
+    ones are loaded, while the others (the app degrades without them) may still be loading.
+    """
+
+    def __init__(self):
+        self._components: Dict[str, Component] = {}
+        self._tasks: List[asyncio.Task] = []
+        self.started_at = time.time()
+
+    def register(self, name: str, loader: Callable[[], None], requires: Sequence[str] = (), essential: bool = True):
+        """`loader` is blocking and stores what it builds in app_store."""
+        self._components[name] = Component(name, loader, tuple(requires), essential)
+
+    def start(self):
+        self.started_at = time.time()
+        self._tasks = [asyncio.create_task(self._load(component)) for component in self._components.values()]
+
+    async def _load(self, component: Component):
+        try:
+            for name in component.requires:
+                dependency = self._components[name]
+                await dependency.loaded.wait()
+                if dependency.state != "ready":
+                    raise ComponentUnavailableError(f"requires '{name}', which failed to load")
+            component.state = "loading"
+            started = time.perf_counter()
+            await asyncio.to_thread(component.loader)
+            component.load_ms = round((time.perf_counter() - started) * 1000, 1)
+            component.state = "ready"
+            print(f"✅ Loaded {component.name} in {component.load_ms} ms.")
+        except Exception as e:
+            component.state, component.error = "failed", str(e)
+            print(f"❌ Failed to load {component.name}: {e}")
+            if not isinstance(e, ComponentUnavailableError):
+                print(traceback.format_exc())
+        finally:
+            component.loaded.set()
+
+    async def wait(self, *names: str):
+        """Waits until the named components are loaded; raises ComponentUnavailableError if one failed."""
+        for name in names:
+            component = self._components[name]
+            await component.loaded.wait()
+            if component.state != "ready":
+                raise ComponentUnavailableError(f"The {name} component failed to load: {component.error}")
+
+    def is_ready(self, *names: str) -> bool:
+        """Whether the named components, or by default all essential ones, are loaded."""
+        components = [self._components[name] for name in names] if names else [
+            component for component in self._components.values() if component.essential
+        ]
+        return all(component.state == "ready" for component in components)
+
+    def status(self) -> Dict[str, Dict]:
+        return {
+            name: {"state": component.state, "essential": component.essential,
+                   "load_ms": component.load_ms, "error": component.error}
+            for name, component in self._components.items()
+        }
+
+    async def stop(self):
+        # A loader thread cannot be interrupted, so let in-flight loads finish before teardown
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
@@ -1,4 +1,5 @@
 # config.py
+from pydantic import model_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from typing import List, Optional
 import json
@@ -11,14 +12,129 @@ class Settings(BaseSettings):
     EMBEDDING_MODEL: str = "mxbai-embed-large:335m"
     LLM_MODEL: str = "llama3"
     RERANKER_MODEL: str = "BAAI/bge-reranker-base"
+    # "torch", or "onnx" / "openvino" for faster CPU inference (needs sentence-transformers[onnx]
+    # or [openvino]). RERANKER_MODEL_FILE picks a variant, e.g. "onnx/model_qint8_avx512_vnni.onnx".
+    RERANKER_BACKEND: str = "torch"
+    RERANKER_MODEL_FILE: str = ""
 
     # Application Paths
     FAISS_PATH: str = "vector_store.faiss"
     UPLOAD_DIRECTORY: str = "uploaded_files"
 
+    # FAISS Index
+    # One of Flat, HNSW, IVFFlat, IVFPQ. IVF types stay Flat until FAISS_TRAIN_MIN_VECTORS
+    # chunks exist, and are retrained each time the corpus grows by FAISS_RETRAIN_GROWTH.
+    FAISS_INDEX_TYPE: str = "Flat"
+    FAISS_TRAIN_MIN_VECTORS: int = 10_000
+    FAISS_RETRAIN_GROWTH: float = 2.0
+    FAISS_IVF_NLIST: int = 0  # 0 picks ~4*sqrt(n) lists at training time
+    FAISS_IVF_NPROBE: int = 16
+    FAISS_HNSW_M: int = 32
+    FAISS_HNSW_EF_CONSTRUCTION: int = 200
+    FAISS_HNSW_EF_SEARCH: int = 64
+    # Deleted HNSW vectors are skipped at search time; the graph is rebuilt once they reach this share
+    FAISS_HNSW_MAX_DELETED_RATIO: float = 0.2
+    FAISS_PQ_M: int = 16  # Sub-quantizers, must divide the embedding dimension
+    FAISS_PQ_NBITS: int = 8  # IVFPQ needs FAISS_TRAIN_MIN_VECTORS >= 2**FAISS_PQ_NBITS
+
+    # Persistence
+    # Changes are appended to a write-ahead log under FAISS_PATH; the log is compacted into
+    # a new snapshot once it grows past WAL_COMPACT_BYTES.
+    WAL_COMPACT_BYTES: int = 64 * 1024 * 1024
+    WAL_FSYNC: bool = True
+    # Memory-map the FAISS index at startup; it is read into RAM on the first change
+    FAISS_MMAP: bool = True
+    # Chunk text is read from SQLite through a memory map of up to this size
+    CHUNK_STORE_MMAP_MB: int = 1024
+
+    # Embedding Cache (set the path to an empty string to disable)
+    EMBEDDING_CACHE_PATH: str = "embedding_cache.sqlite3"
+    EMBEDDING_CACHE_MAX_ENTRIES: int = 500_000
+
+    # Document Extraction
+    # Processes for PDF parsing and OCR (0 uses one per CPU)
+    EXTRACTION_WORKERS: int = 0
+    PDF_PAGES_PER_TASK: int = 8
+
+    # Chunk Deduplication
+    # A chunk whose word 3-shingles overlap an indexed chunk's by DEDUP_SIMILARITY (estimated
+    # Jaccard similarity) or more, and has the same numbers, is linked to it instead of stored
+    # again. Chunks under DEDUP_MIN_TOKENS words are only deduplicated when identical.
+    DEDUP_ENABLED: bool = True
+    DEDUP_SIMILARITY: float = 0.85
+    DEDUP_MIN_TOKENS: int = 10
+
+    # Ingestion Jobs
+    INGEST_WORKERS: int = 2
+    # How long the indexer waits for more finished uploads to merge into one batch
+    INGEST_BATCH_WINDOW_MS: int = 200
+    INGEST_BATCH_MAX_CHUNKS: int = 2000
+    # Finished jobs kept for /api/jobs/{id}
+    INGEST_JOB_HISTORY: int = 1000
+
+    # Ollama Gateway
+    OLLAMA_BASE_URL: Optional[str] = None  # None uses OLLAMA_HOST or http://localhost:11434
+    # Requests in flight to Ollama; further ones wait in a queue of up to OLLAMA_MAX_QUEUE,
+    # beyond which chat requests get a 503 (ingestion always waits)
+    OLLAMA_MAX_CONCURRENT_GENERATIONS: int = 4
+    OLLAMA_MAX_CONCURRENT_EMBEDDINGS: int = 4
+    OLLAMA_MAX_QUEUE: int = 64
+    # Concurrent query embeddings arriving within this window are sent as one request
+    OLLAMA_EMBED_BATCH_WINDOW_MS: float = 5
+    OLLAMA_EMBED_MAX_BATCH: int = 32
+
+    # Startup: prime the embedding model and reranker before reporting ready on /health/ready
+    STARTUP_WARMUP: bool = False
+
+    # Chat Pipeline
+    # Threads for blocking retrieval and reranking work, so it stays off the event loop
+    RAG_WORKER_THREADS: int = 4
+
+    # Chat Sessions (set the path to an empty string to keep sessions in memory only)
+    SESSION_DB_PATH: str = "chat_sessions.sqlite3"
+    SESSION_MAX_COUNT: int = 10_000
+    SESSION_IDLE_TTL_SECONDS: int = 86_400
+    # History older than this many (estimated) tokens is dropped from the prompts
+    SESSION_HISTORY_TOKEN_BUDGET: int = 2000
+
+    # Reranking: fused candidates with a BM25 score within RERANK_KEYWORD_SCORE_RATIO of the best,
+    # or a vector distance within RERANK_VECTOR_DISTANCE_MARGIN (relative) of the nearest, are
+    # reranked, never fewer than RERANK_MIN_CANDIDATES or more than RERANK_MAX_CANDIDATES
+    RERANK_MIN_CANDIDATES: int = 12
+    RERANK_MAX_CANDIDATES: int = 40
+    RERANK_KEYWORD_SCORE_RATIO: float = 0.4
+    RERANK_VECTOR_DISTANCE_MARGIN: float = 0.25
+    RERANK_BATCH_SIZE: int = 16
+    RERANK_SCORE_CACHE_SIZE: int = 50_000
+
+    # Rewrites of follow-up questions cached per (session, question, last turn)
+    REWRITE_CACHE_SIZE: int = 10_000
+
+    # Answer Cache (set the max entries to 0 to disable)
+    ANSWER_CACHE_MAX_ENTRIES: int = 1000
+    ANSWER_CACHE_TTL_SECONDS: int = 3600
+    # Cosine similarity between standalone questions needed to reuse an answer
+    ANSWER_CACHE_SIMILARITY: float = 0.95
+
+    # Profiling: this fraction of requests is profiled into PROFILE_DIR (0 disables), sampling
+    # the stacks of every thread each PROFILE_INTERVAL_MS
+    PROFILE_SAMPLE_RATE: float = 0.0
+    PROFILE_DIR: str = "profiles"
+    PROFILE_INTERVAL_MS: float = 5.0
+
     # n8n Integration
     N8N_WEBHOOK_URLS_JSON: Optional[str] = '[]'
 
+    @model_validator(mode="after")
+    def _check_pq_training_size(self):
+        # Each PQ sub-quantizer learns 2**FAISS_PQ_NBITS centroids and cannot train on fewer vectors
+        if self.FAISS_INDEX_TYPE == "IVFPQ" and self.FAISS_TRAIN_MIN_VECTORS < 2 ** self.FAISS_PQ_NBITS:
+            raise ValueError(
+                f"FAISS_TRAIN_MIN_VECTORS ({self.FAISS_TRAIN_MIN_VECTORS}) must be at least "
+                f"2**FAISS_PQ_NBITS ({2 ** self.FAISS_PQ_NBITS}) for IVFPQ indexes."
+            )
+        return self
+
     @property
     def N8N_WEBHOOK_URLS(self) -> List[str]:
         return json.loads(self.N8N_WEBHOOK_URLS_JSON or '[]')
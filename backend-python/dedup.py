@@ -0,0 +1,186 @@
+# dedup.py
+import re
+import zlib
+import sqlite3
+import hashlib
+import threading
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+import numpy as np
+
+SIGNATURES_FILE = "signatures.sqlite3"
+SHINGLE_SIZE = 3
+PERMUTATIONS = 64
+ROWS_PER_BAND = 4
+_WORD = re.compile(r"\w+")
+_DIGIT = re.compile(r"\d")
+
+# Fixed seeds: stored signatures must stay comparable with new ones across restarts
+_PERMUTATION_RNG = np.random.default_rng(0x5EED)
+_A = _PERMUTATION_RNG.integers(1, 2 ** 63, size=PERMUTATIONS, dtype=np.uint64) | np.uint64(1)
+_B = _PERMUTATION_RNG.integers(0, 2 ** 63, size=PERMUTATIONS, dtype=np.uint64)
+
+
+class Signature(NamedTuple):
+    digest: str  # Hash of the normalized text, for exact duplicates
+    minhash: bytes  # PERMUTATIONS uint32 minimums over the word shingles, for near duplicates
+    tokens: int
+    numbers: str  # Hash of the words with digits, in order; near duplicates must agree on it
+
+
+def _mix(x: np.ndarray) -> np.ndarray:
+    # splitmix64 finalizer, spreads 32-bit token hashes over 64 bits
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def signature(text: str) -> Signature:
+    """
+    Exact and near-duplicate signature of a chunk. Text is normalized to lowercase words,
+    so whitespace, punctuation and case differences do not count. The MinHash of its word
+    3-shingles estimates the share of shingles two chunks have in common (their Jaccard
+    similarity) as the share of equal minimums.
+    """
+    tokens = _WORD.findall(text.lower())
+    digest = hashlib.sha1(" ".join(tokens).encode("utf-8")).hexdigest()
+    numbers = hashlib.sha1(" ".join(token for token in tokens if _DIGIT.search(token)).encode("utf-8")).hexdigest()
+    words = _mix(np.fromiter(map(zlib.crc32, map(str.encode, tokens or [""])), dtype=np.uint64))
+    count = max(1, len(words) - SHINGLE_SIZE + 1)
+    shingles = words[:count]
+    for offset in range(1, min(SHINGLE_SIZE, len(words))):
+        shingles = _mix(shingles ^ words[offset:offset + count] * np.uint64(offset * 2 + 1))
+    shingles = np.unique(shingles)
+    # One multiply-shift hash per permutation; the minimum over the shingles is kept
+    minimums = ((shingles[:, None] * _A + _B) >> np.uint64(32)).min(axis=0).astype(np.uint32)
+    return Signature(digest, minimums.tobytes(), len(tokens), numbers)
+
+
+def similarity(a: Signature, b: Signature) -> float:
+    """Estimated Jaccard similarity of the two chunks' word shingles."""
+    return float(np.mean(np.frombuffer(a.minhash, dtype=np.uint32) == np.frombuffer(b.minhash, dtype=np.uint32)))
+
+
+class SignatureIndex:
+    """
+    Finds chunks whose text duplicates, or nearly duplicates, a given signature. Exact
+    duplicates match on the digest. Near duplicates share at least `threshold` of their
+    word shingles: the MinHash is split into bands of ROWS_PER_BAND values, and only
+    chunks equal on a whole band (likely above about half the threshold) are compared.
+    Chunks shorter than `min_tokens` words only match exactly, as a few changed words
+    in a short text change its meaning. Near duplicates must also have the same words
+    with digits in the same order: a chunk that differs by a price, date or reference
+    number says something else, and linking it would lose that text.
+
+    With a `db_path` the signatures are also kept in SQLite, so they are not recomputed
+    for the whole corpus at startup.
+    """
+
+    def __init__(self, threshold: float = 0.9, min_tokens: int = 10, db_path: Optional[str] = None):
+        self.threshold = threshold
+        self.min_tokens = min_tokens
+        self._signatures: Dict[str, Signature] = {}
+        self._by_digest: Dict[str, Set[str]] = {}
+        self._by_band: List[Dict[bytes, Set[str]]] = [{} for _ in range(PERMUTATIONS // ROWS_PER_BAND)]
+        self._lock = threading.Lock()
+        self._conn = None
+        if db_path:
+            self._conn = sqlite3.connect(db_path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS signatures (chunk_id TEXT PRIMARY KEY, digest TEXT NOT NULL, "
+                "minhash BLOB NOT NULL, tokens INTEGER NOT NULL, numbers TEXT)"
+            )
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(signatures)")}
+            if "numbers" not in columns:
+                self._conn.execute("ALTER TABLE signatures ADD COLUMN numbers TEXT")
+            # Signatures stored before numbers were recorded; they are recomputed from the chunk text
+            self._conn.execute("DELETE FROM signatures WHERE numbers IS NULL")
+            self._conn.commit()
+            rows = self._conn.execute("SELECT chunk_id, digest, minhash, tokens, numbers FROM signatures")
+            self._index({
+                chunk_id: Signature(digest, bytes(minhash), tokens, numbers)
+                for chunk_id, digest, minhash, tokens, numbers in rows
+            })
+
+    def __len__(self) -> int:
+        return len(self._signatures)
+
+    def __contains__(self, chunk_id: str) -> bool:
+        return chunk_id in self._signatures
+
+    def ids(self) -> List[str]:
+        with self._lock:
+            return list(self._signatures)
+
+    @staticmethod
+    def _band_keys(minhash: bytes) -> List[bytes]:
+        width = ROWS_PER_BAND * 4
+        return [minhash[start:start + width] for start in range(0, len(minhash), width)]
+
+    def _index(self, signatures: Dict[str, Signature]):
+        for chunk_id, sig in signatures.items():
+            self._signatures[chunk_id] = sig
+            self._by_digest.setdefault(sig.digest, set()).add(chunk_id)
+            if sig.tokens >= self.min_tokens:
+                for band, key in zip(self._by_band, self._band_keys(sig.minhash)):
+                    band.setdefault(key, set()).add(chunk_id)
+
+    def match(self, sig: Signature) -> Optional[Tuple[str, str]]:
+        """(chunk ID, "exact" or "near") of a stored duplicate of `sig`, or None."""
+        with self._lock:
+            exact = self._by_digest.get(sig.digest)
+            if exact:
+                return min(exact), "exact"
+            if sig.tokens < self.min_tokens:
+                return None
+            candidates = {
+                chunk_id
+                for band, key in zip(self._by_band, self._band_keys(sig.minhash)) for chunk_id in band.get(key, ())
+                if self._signatures[chunk_id].numbers == sig.numbers
+            }
+            # The most similar match, ties broken by chunk ID so the choice is repeatable
+            scored = sorted((-similarity(sig, self._signatures[chunk_id]), chunk_id) for chunk_id in candidates)
+            if scored and -scored[0][0] >= self.threshold:
+                return scored[0][1], "near"
+            return None
+
+    def add(self, signatures: Dict[str, Signature]):
+        if not signatures:
+            return
+        with self._lock:
+            self._index(signatures)
+            if self._conn is not None:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO signatures (chunk_id, digest, minhash, tokens, numbers) VALUES (?, ?, ?, ?, ?)",
+                    [(chunk_id, sig.digest, sig.minhash, sig.tokens, sig.numbers) for chunk_id, sig in signatures.items()]
+                )
+                self._conn.commit()
+
+    def remove(self, chunk_ids: Iterable[str]):
+        with self._lock:
+            removed = []
+            for chunk_id in chunk_ids:
+                sig = self._signatures.pop(chunk_id, None)
+                if sig is None:
+                    continue
+                removed.append(chunk_id)
+                self._by_digest[sig.digest].discard(chunk_id)
+                if not self._by_digest[sig.digest]:
+                    del self._by_digest[sig.digest]
+                for band, key in zip(self._by_band, self._band_keys(sig.minhash)):
+                    members = band.get(key)
+                    if members is not None:
+                        members.discard(chunk_id)
+                        if not members:
+                            del band[key]
+            if self._conn is not None and removed:
+                self._conn.executemany("DELETE FROM signatures WHERE chunk_id = ?", [(chunk_id,) for chunk_id in removed])
+                self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
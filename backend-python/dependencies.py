@@ -1,15 +1,39 @@
 from fastapi import HTTPException
 from state import app_store
+from components import ComponentUnavailableError
 
-def get_llm(): return app_store["llm"]
-def get_embeddings(): return app_store["embeddings"]
-def get_reranker(): return app_store["reranker"]
+async def wait_for(*names: str):
+    """Waits for components still loading at startup; a failed one is a 503."""
+    try:
+        await app_store["components"].wait(*names)
+    except ComponentUnavailableError as e:
+        raise HTTPException(status_code=503, detail=str(e))
 
-def get_retrievers():
-    if not app_store.get("vector_store"):
+async def get_llm():
+    await wait_for("llm")
+    return app_store["llm"]
+
+async def get_embeddings():
+    await wait_for("embeddings")
+    return app_store["embeddings"]
+
+async def get_reranker():
+    await wait_for("reranker")
+    return app_store["reranker"]
+
+def get_ingest_queue(): return app_store["ingest_queue"]
+def get_sessions(): return app_store["sessions"]
+
+async def knowledge_base_ready():
+    await wait_for("knowledge_base")
+
+async def pipeline_ready():
+    # Index changes rebuild the pipeline, so they also need the models loaded
+    await wait_for("pipeline")
+
+async def get_rag_pipeline():
+    await wait_for("pipeline")
+    if not app_store.get("rag_pipeline"):
         raise HTTPException(status_code=404, detail="Knowledge Base is empty. Please upload a document.")
     
-    return {
-        "vector": app_store["vector_store"].as_retriever(search_kwargs={"k": 30}),
-        "keyword": app_store.get("bm25_retriever")
-    }
+    return app_store["rag_pipeline"]
@@ -0,0 +1,143 @@
+# extraction.py
+import os
+import time
+import asyncio
+import functools
+from collections import deque
+from concurrent.futures import Executor
+from typing import AsyncIterator, List, Tuple
+
+from fastapi import HTTPException, UploadFile
+from langchain_core.documents import Document
+
+from config import settings
+from metrics import observe
+
+SPOOL_CHUNK_SIZE = 1024 * 1024
+PDF_EXTENSIONS = {".pdf"}
+TEXT_EXTENSIONS = {".txt", ".md"}
+IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg"}
+SUPPORTED_EXTENSIONS = PDF_EXTENSIONS | TEXT_EXTENSIONS | IMAGE_EXTENSIONS
+
+
+@functools.lru_cache(maxsize=None)
+def text_splitter():
+    # langchain's text splitters are slow to import, so they load with the first upload
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+    return RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=150)
+
+
+def split_documents(docs: List[Document]) -> List[Document]:
+    return text_splitter().split_documents(docs)
+
+
+async def spool_upload(file: UploadFile, destination: str) -> int:
+    """
+    Streams an upload to disk in fixed-size chunks instead of reading it into memory.
+    The file is written next to its destination and renamed into place once complete.
+    Disk writes run in the default executor, so a slow disk does not hold up the event loop.
+    """
+    loop = asyncio.get_running_loop()
+    part_path = destination + ".part"
+    size = 0
+    f = await loop.run_in_executor(None, open, part_path, "wb")
+    try:
+        while chunk := await file.read(SPOOL_CHUNK_SIZE):
+            await loop.run_in_executor(None, f.write, chunk)
+            size += len(chunk)
+    finally:
+        await loop.run_in_executor(None, f.close)
+    await loop.run_in_executor(None, os.replace, part_path, destination)
+    return size
+
+
+# --- Worker functions (run in the extraction process pool) ---
+def count_pdf_pages(path: str) -> int:
+    from PyPDF2 import PdfReader
+    return len(PdfReader(path).pages)
+
+
+def extract_pdf_pages(path: str, start: int, stop: int) -> List[Tuple[int, str]]:
+    from PyPDF2 import PdfReader
+    reader = PdfReader(path)
+    return [(i + 1, reader.pages[i].extract_text() or "") for i in range(start, stop)]
+
+
+def ocr_image(path: str) -> str:
+    from PIL import Image
+    import pytesseract
+    with Image.open(path) as image:
+        return pytesseract.image_to_string(image)
+
+
+def read_text_file(path: str) -> str:
+    with open(path, "rb") as f:
+        return f.read().decode("utf-8", errors="ignore")
+
+
+# --- Pipeline ---
+async def _extract_pages(path: str, filename: str, pool: Executor, pages_per_task: int) -> AsyncIterator[List[Document]]:
+    """Yields page documents for each extracted batch, in page order."""
+    loop = asyncio.get_running_loop()
+    extension = os.path.splitext(filename)[1].lower()
+
+    if extension in TEXT_EXTENSIONS:
+        text = await loop.run_in_executor(None, read_text_file, path)
+        yield [Document(page_content=text, metadata={"source": filename})]
+    elif extension in IMAGE_EXTENSIONS:
+        text = await loop.run_in_executor(pool, ocr_image, path)
+        if text.strip():
+            yield [Document(page_content=text, metadata={"source": filename})]
+    elif extension in PDF_EXTENSIONS:
+        page_count = await loop.run_in_executor(pool, count_pdf_pages, path)
+        ranges = deque((start, min(start + pages_per_task, page_count)) for start in range(0, page_count, pages_per_task))
+        # Keep every worker busy while results are consumed in order; the pool is sized in main.py
+        max_in_flight = (settings.EXTRACTION_WORKERS or os.cpu_count() or 1) * 2
+        in_flight = deque()
+        while ranges or in_flight:
+            while ranges and len(in_flight) < max_in_flight:
+                start, stop = ranges.popleft()
+                in_flight.append(loop.run_in_executor(pool, extract_pdf_pages, path, start, stop))
+            pages = await in_flight.popleft()
+            page_docs = [
+                Document(page_content=page_text, metadata={"source": filename, "page": page_number})
+                for page_number, page_text in pages if page_text.strip()
+            ]
+            if page_docs:
+                yield page_docs
+
+
+async def extract_chunks(path: str, filename: str, pool: Executor, pages_per_task: int = 8) -> AsyncIterator[List[Document]]:
+    """
+    Extracts text from a spooled upload and yields it as batches of chunks as soon as each
+    batch is ready, so embedding can start before extraction has finished. PDF pages and
+    OCR run in `pool` (a process pool), so large scans do not hold up the event loop.
+    """
+    extension = os.path.splitext(filename)[1].lower()
+    if extension not in SUPPORTED_EXTENSIONS:
+        raise HTTPException(status_code=400, detail=f"Unsupported file type: {extension}")
+
+    loop = asyncio.get_running_loop()
+    produced = False
+    # Extraction and chunking time, excluding the time the consumer spends on each batch
+    extract_seconds = chunk_seconds = 0.0
+    pages = _extract_pages(path, filename, pool, pages_per_task).__aiter__()
+    while True:
+        started = time.perf_counter()
+        try:
+            page_docs = await pages.__anext__()
+        except StopAsyncIteration:
+            break
+        chunking_started = time.perf_counter()
+        extract_seconds += chunking_started - started
+        # Splitting (and the splitter's first import) is CPU work, kept off the event loop
+        chunks = await loop.run_in_executor(None, split_documents, page_docs)
+        chunk_seconds += time.perf_counter() - chunking_started
+        if chunks:
+            produced = True
+            yield chunks
+    observe("ingest", "extract", extract_seconds)
+    observe("ingest", "chunk", chunk_seconds)
+
+    if not produced:
+        raise HTTPException(status_code=400, detail=f"Could not extract any text from '{filename}'.")
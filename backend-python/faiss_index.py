@@ -0,0 +1,260 @@
+# faiss_index.py
+import os
+import json
+import math
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import faiss
+import numpy as np
+
+from config import settings
+
+INDEX_TYPES = ("Flat", "HNSW", "IVFFlat", "IVFPQ")
+TRAINED_INDEX_TYPES = ("IVFFlat", "IVFPQ")
+INDEX_META_FILE = "index_meta.json"
+INDEX_FILE = "index.faiss"
+DOCSTORE_IDS_FILE = "docstore_ids.json"
+# Zero-copy mapping of flat vector storage; older faiss versions only map IVF lists
+MMAP_FLAG = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+
+
+def index_params_from_settings() -> Dict:
+    return {
+        "hnsw_m": settings.FAISS_HNSW_M,
+        "hnsw_ef_construction": settings.FAISS_HNSW_EF_CONSTRUCTION,
+        "ivf_nlist": settings.FAISS_IVF_NLIST,
+        "pq_m": settings.FAISS_PQ_M,
+        "pq_nbits": settings.FAISS_PQ_NBITS,
+    }
+
+
+def search_params_from_settings() -> Dict:
+    return {"nprobe": settings.FAISS_IVF_NPROBE, "ef_search": settings.FAISS_HNSW_EF_SEARCH}
+
+
+def auto_nlist(n_vectors: int) -> int:
+    # The usual rule of thumb, ~4*sqrt(n) lists, keeping at least 39 training points per list
+    return max(1, min(int(4 * math.sqrt(n_vectors)), n_vectors // 39, 65536))
+
+
+def factory_string(index_type: str, dimension: int, n_vectors: int, hnsw_m: int = 32, ivf_nlist: int = 0,
+                   pq_m: int = 16, pq_nbits: int = 8, **_) -> str:
+    if index_type == "Flat":
+        return "Flat"
+    if index_type == "HNSW":
+        return f"HNSW{hnsw_m},Flat"
+    nlist = ivf_nlist or auto_nlist(n_vectors)
+    if index_type == "IVFFlat":
+        return f"IVF{nlist},Flat"
+    if index_type == "IVFPQ":
+        if dimension % pq_m:
+            raise ValueError(f"FAISS_PQ_M ({pq_m}) must divide the embedding dimension ({dimension}).")
+        return f"IVF{nlist},PQ{pq_m}x{pq_nbits}"
+    raise ValueError(f"Unknown FAISS index type '{index_type}'. Choose one of {INDEX_TYPES}.")
+
+
+def build_index(index_type: str, vectors: np.ndarray, metric: int = faiss.METRIC_L2, **params) -> faiss.Index:
+    """
+    Creates an (unwrapped) index of the given type and trains it on `vectors` if the type
+    needs training. The vectors are not added.
+    """
+    dimension = vectors.shape[1]
+    index = faiss.index_factory(dimension, factory_string(index_type, dimension, len(vectors), **params), metric)
+    if index_type == "HNSW":
+        faiss.downcast_index(index).hnsw.efConstruction = params.get("hnsw_ef_construction", 200)
+    if not index.is_trained:
+        ivf = faiss.extract_index_ivf(index)
+        # Train on a sample: 256 points per list is plenty for k-means
+        sample_size = min(len(vectors), ivf.nlist * 256)
+        sample = vectors[np.random.default_rng(0).choice(len(vectors), sample_size, replace=False)] if sample_size < len(vectors) else vectors
+        index.train(sample)
+    if index_type in TRAINED_INDEX_TYPES:
+        # Lets vectors be looked up and removed by ID (scoped search, deletes, rebuilds)
+        faiss.extract_index_ivf(index).set_direct_map_type(faiss.DirectMap.Hashtable)
+    return index
+
+
+def make_id_index(index: faiss.Index) -> faiss.Index:
+    """
+    Gives an index stable, caller-chosen IDs. IVF indexes store IDs natively; others are
+    wrapped in IndexIDMap2, whose compaction on removal matches Flat's.
+    """
+    if isinstance(index, faiss.IndexIVF):
+        return index
+    return faiss.IndexIDMap2(index)
+
+
+def has_stable_ids(index: faiss.Index) -> bool:
+    return isinstance(index, (faiss.IndexIDMap, faiss.IndexIVF))
+
+
+def base_index(index: faiss.Index) -> faiss.Index:
+    """The index inside an IndexIDMap wrapper, downcast to its concrete type."""
+    if isinstance(index, faiss.IndexIDMap):
+        index = index.index
+    return faiss.downcast_index(index)
+
+
+def index_type_of(index: faiss.Index) -> str:
+    base = base_index(index)
+    if isinstance(base, faiss.IndexHNSW):
+        return "HNSW"
+    if isinstance(base, faiss.IndexIVFPQ):
+        return "IVFPQ"
+    if isinstance(base, faiss.IndexIVF):
+        return "IVFFlat"
+    return "Flat"
+
+
+def is_lossy(index: faiss.Index) -> bool:
+    # Compressed codes cannot give back the original vectors
+    return index_type_of(index) == "IVFPQ"
+
+
+def apply_search_params(index: faiss.Index, nprobe: Optional[int] = None, ef_search: Optional[int] = None):
+    base = base_index(index)
+    if isinstance(base, faiss.IndexIVF):
+        if nprobe:
+            base.nprobe = nprobe
+        if base.direct_map.type != faiss.DirectMap.Hashtable:
+            base.set_direct_map_type(faiss.DirectMap.Hashtable)
+    elif isinstance(base, faiss.IndexHNSW) and ef_search:
+        base.hnsw.efSearch = ef_search
+
+
+def target_index_type(n_vectors: int) -> str:
+    """
+    The index type the corpus should use. Types that need training stay Flat until the
+    corpus is large enough to train them well.
+    """
+    index_type = settings.FAISS_INDEX_TYPE
+    if index_type in TRAINED_INDEX_TYPES and n_vectors < settings.FAISS_TRAIN_MIN_VECTORS:
+        return "Flat"
+    return index_type
+
+
+def needs_rebuild(index: faiss.Index, trained_size: int, deleted: int = 0) -> bool:
+    """True if the index type no longer matches the config, a trained index has grown
+    enough since training that its clustering should be refreshed, or `deleted` (HNSW
+    tombstones) vectors make up too much of the graph."""
+    n_vectors = index.ntotal - deleted
+    if n_vectors <= 0:
+        return False
+    target = target_index_type(n_vectors)
+    if index_type_of(index) != target:
+        return True
+    if deleted and deleted >= index.ntotal * settings.FAISS_HNSW_MAX_DELETED_RATIO:
+        return True
+    return target in TRAINED_INDEX_TYPES and n_vectors >= trained_size * settings.FAISS_RETRAIN_GROWTH
+
+
+def rebuild_id_index(vectors: np.ndarray, faiss_ids: np.ndarray, metric: int = faiss.METRIC_L2) -> faiss.Index:
+    """Builds (and trains if needed) a fresh index of the configured type with stable IDs."""
+    index_type = target_index_type(len(vectors))
+    index = make_id_index(build_index(index_type, vectors, metric, **index_params_from_settings()))
+    index.add_with_ids(vectors, faiss_ids)
+    apply_search_params(index, **search_params_from_settings())
+    return index
+
+
+class Tombstones:
+    """
+    Vectors deleted from an HNSW graph, which cannot remove vectors short of a full
+    rebuild. They stay in the graph and searches skip them through an ID selector, until
+    they make up FAISS_HNSW_MAX_DELETED_RATIO of it and the index is rebuilt (built
+    outside the index write lock, then swapped in). Changed under the write lock only.
+    """
+
+    def __init__(self, ids: Iterable[int] = ()):
+        self.ids: Set[int] = {int(faiss_id) for faiss_id in ids}
+        self._selector = None
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def add(self, faiss_ids: Iterable[int]):
+        self.ids.update(int(faiss_id) for faiss_id in faiss_ids)
+        self._selector = None
+
+    def clear(self):
+        self.ids.clear()
+        self._selector = None
+
+    def search_params(self, index: faiss.Index) -> Optional[faiss.SearchParameters]:
+        """Parameters that skip the deleted vectors, or None if there are none."""
+        if not self.ids:
+            return None
+        if self._selector is None:
+            batch = faiss.IDSelectorBatch(np.array(sorted(self.ids), dtype=np.int64))
+            # The inner selector is kept referenced, the outer one only holds a pointer to it
+            self._selector = (faiss.IDSelectorNot(batch), batch)
+        # A new object per search: IndexIDMap swaps in a translated selector while it searches
+        return faiss.SearchParametersHNSW(sel=self._selector[0], efSearch=base_index(index).hnsw.efSearch)
+
+    @classmethod
+    def of(cls, index: faiss.Index, index_to_docstore_id: Dict[int, str]) -> "Tombstones":
+        """The vectors of a loaded HNSW index that no chunk maps to any more."""
+        if index_type_of(index) != "HNSW" or index.ntotal == len(index_to_docstore_id):
+            return cls()
+        live = np.fromiter(index_to_docstore_id, dtype=np.int64, count=len(index_to_docstore_id))
+        return cls(np.setdiff1d(faiss.vector_to_array(index.id_map), live))
+
+
+def remove_ids(index: faiss.Index, faiss_ids: List[int], tombstones: Tombstones) -> faiss.Index:
+    """
+    Removes vectors by ID. HNSW graphs do not support removal, so for HNSW the vectors are
+    added to `tombstones` instead. Returns the index to use from now on.
+    """
+    if index_type_of(index) == "HNSW":
+        tombstones.add(faiss_ids)
+        return index
+    index.remove_ids(np.array(faiss_ids, dtype=np.int64))
+    return index
+
+
+def memory_bytes(index: faiss.Index) -> int:
+    return int(faiss.serialize_index(index).nbytes)
+
+
+# --- Persistence ---
+def save_index(folder_path: str, index: faiss.Index, index_to_docstore_id: Dict[int, str]):
+    """Writes the index in faiss's own format and the FAISS ID -> chunk ID map as JSON."""
+    faiss.write_index(index, os.path.join(folder_path, INDEX_FILE))
+    with open(os.path.join(folder_path, DOCSTORE_IDS_FILE), "w", encoding="utf-8") as f:
+        json.dump([[int(faiss_id), chunk_id] for faiss_id, chunk_id in index_to_docstore_id.items()], f)
+
+
+def load_index(folder_path: str, mmap: bool = False) -> Tuple[faiss.Index, Dict[int, str]]:
+    """
+    Reads what save_index wrote. With `mmap` the vectors stay in the file and are paged in
+    on demand; such an index is read-only, see writable_index.
+    """
+    index = faiss.read_index(os.path.join(folder_path, INDEX_FILE), MMAP_FLAG if mmap else 0)
+    with open(os.path.join(folder_path, DOCSTORE_IDS_FILE), "r", encoding="utf-8") as f:
+        index_to_docstore_id = {faiss_id: chunk_id for faiss_id, chunk_id in json.load(f)}
+    return index, index_to_docstore_id
+
+
+def writable_index(folder_path: str) -> faiss.Index:
+    """Reads the index fully into memory, for a store that was memory-mapped and is about
+    to be modified (mapped storage cannot grow or shrink)."""
+    index = faiss.read_index(os.path.join(folder_path, INDEX_FILE))
+    apply_search_params(index, **search_params_from_settings())
+    return index
+
+
+# --- Persistence of training state ---
+def load_meta(folder_path: str) -> Dict:
+    path = os.path.join(folder_path, INDEX_META_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_meta(folder_path: str, meta: Dict):
+    os.makedirs(folder_path, exist_ok=True)
+    path = os.path.join(folder_path, INDEX_META_FILE)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(path + ".tmp", path)
@@ -0,0 +1,675 @@
+# indexing.py
+import os
+import asyncio
+import uuid
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import faiss
+import numpy as np
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+from config import settings
+from state import app_store, index_rwlock
+from bm25_index import BM25IndexRetriever, IncrementalBM25, docstore_lookup, load_or_build_bm25
+from source_index import SourceIndex
+from chunk_store import CHUNK_STORE_FILE, ChunkStore
+from faiss_index import (
+    apply_search_params, build_index, has_stable_ids, index_params_from_settings, index_type_of, is_lossy,
+    Tombstones, load_index, load_meta, make_id_index, needs_rebuild, rebuild_id_index, remove_ids, save_index,
+    save_meta, search_params_from_settings, target_index_type, writable_index,
+)
+from persistence import SnapshotStore, decode_vector, encode_vector
+from dedup import SIGNATURES_FILE, Signature, SignatureIndex, signature
+from pipeline import rebuild_pipeline
+from ollama_gateway import background_work
+from metrics import DEDUP_CHUNKS, span
+
+
+def new_vector_store(embeddings, docstore: ChunkStore, dimension: int) -> FAISS:
+    """
+    An empty FAISS store of the configured index type with stable IDs, so every vector can
+    be removed or looked up without renumbering the rest.
+    """
+    empty = np.empty((0, dimension), dtype=np.float32)
+    index = make_id_index(build_index(target_index_type(0), empty, **index_params_from_settings()))
+    apply_search_params(index, **search_params_from_settings())
+    return FAISS(embedding_function=embeddings, index=index, docstore=docstore, index_to_docstore_id={})
+
+
+def ensure_id_map(vector_store: FAISS) -> bool:
+    """
+    Migrates a store saved with langchain's positional index to stable IDs (the row
+    numbers become the IDs). Returns True if the index was converted.
+    """
+    if has_stable_ids(vector_store.index):
+        return False
+    old_index = vector_store.index
+    vectors = old_index.reconstruct_n(0, old_index.ntotal)
+    index = faiss.IndexIDMap2(faiss.index_factory(old_index.d, "Flat", old_index.metric_type))
+    positions = sorted(vector_store.index_to_docstore_id)
+    index.add_with_ids(vectors[positions], np.array(positions, dtype=np.int64))
+    vector_store.index = index
+    return True
+
+
+def _exact_vectors(vector_store: FAISS, faiss_ids: List[int]) -> np.ndarray:
+    """Original vectors for a rebuild. PQ codes are lossy, so those are re-embedded
+    (served from the embedding cache rather than Ollama)."""
+    if not is_lossy(vector_store.index):
+        return vector_store.index.reconstruct_batch(np.array(faiss_ids, dtype=np.int64))
+    chunk_ids = [vector_store.index_to_docstore_id[faiss_id] for faiss_id in faiss_ids]
+    docs = vector_store.docstore.mget(chunk_ids)
+    texts = [docs[chunk_id].page_content for chunk_id in chunk_ids]
+    vectors = np.array(app_store["embeddings"].embed_documents(texts), dtype=np.float32)
+    if vector_store._normalize_L2:
+        faiss.normalize_L2(vectors)
+    return vectors
+
+
+def _maybe_rebuild_index(vector_store: FAISS) -> bool:
+    """
+    Switches to the configured index type once the corpus is large enough, and retrains
+    IVF indexes as the corpus grows. The new index is built while searches continue on
+    the old one, then swapped in. Callers hold app_store["index_lock"], so no other
+    mutation can interleave.
+    """
+    meta = app_store.setdefault("index_meta", {})
+    tombstones: Tombstones = app_store["tombstones"]
+    with index_rwlock.read():
+        if not needs_rebuild(vector_store.index, meta.get("trained_size", 0), len(tombstones)):
+            return False
+        faiss_ids = sorted(vector_store.index_to_docstore_id)
+        vectors = _exact_vectors(vector_store, faiss_ids)
+        index = rebuild_id_index(vectors, np.array(faiss_ids, dtype=np.int64), vector_store.index.metric_type)
+
+    with index_rwlock.write():
+        vector_store.index = index
+        # Deleted HNSW vectors were left out of the rebuild
+        tombstones.clear()
+        # The new index lives in memory, so a memory-mapped snapshot is no longer needed
+        app_store.pop("mmap_snapshot", None)
+    meta.update({"index_type": index_type_of(index), "trained_size": len(faiss_ids)})
+    print(f"🔨 Rebuilt the FAISS index as {meta['index_type']} over {len(faiss_ids)} vectors.")
+    return True
+
+
+def _load_snapshot(folder_path: str) -> bool:
+    """
+    Loads the vector store, source index and BM25 index saved in `folder_path`. Returns
+    True if the index had to be migrated or a derived index rebuilt, so a fresh snapshot
+    should be written. The snapshot itself is never modified.
+    """
+    print(f"Loading existing vector store from {folder_path}...")
+    chunk_store: ChunkStore = app_store["chunk_store"]
+    if os.path.exists(os.path.join(folder_path, "index.pkl")):
+        # Stores written by langchain's save_local keep the docstore in a pickle. It is read
+        # this one time and moved into the chunk store; snapshots never contain pickles.
+        vector_store = FAISS.load_local(
+            folder_path,
+            app_store["embeddings"],
+            allow_dangerous_deserialization=True
+        )
+        chunk_store.add(vector_store.docstore._dict)
+        vector_store.docstore = chunk_store
+        if ensure_id_map(vector_store):
+            print("🔨 Migrated the FAISS index to stable IDs.")
+        print("🔨 Moved the pickled docstore into the chunk store.")
+        migrated = True
+    else:
+        index, index_to_docstore_id = load_index(folder_path, mmap=settings.FAISS_MMAP)
+        vector_store = FAISS(
+            embedding_function=app_store["embeddings"], index=index,
+            docstore=chunk_store, index_to_docstore_id=index_to_docstore_id
+        )
+        if settings.FAISS_MMAP:
+            app_store["mmap_snapshot"] = folder_path
+        migrated = False
+    apply_search_params(vector_store.index, **search_params_from_settings())
+    app_store["vector_store"] = vector_store
+    app_store["tombstones"] = Tombstones.of(vector_store.index, vector_store.index_to_docstore_id)
+    app_store["index_meta"] = load_meta(folder_path)
+
+    chunk_ids = list(vector_store.index_to_docstore_id.values())
+    source_index = SourceIndex.load(folder_path)
+    if source_index is None or len(source_index.owners) != len(chunk_ids):
+        if chunk_store.has_links():
+            # The chunk store's links can be ahead of the snapshot, by the changes the log
+            # replays next: links to chunks not indexed yet are left for the replay to add,
+            # and chunks left without a document are dropped by _reconcile_chunk_store
+            print("🔨 Building source index from the chunk store links...")
+            indexed = set(chunk_ids)
+            source_index = SourceIndex({
+                source: [chunk_id for chunk_id in linked if chunk_id in indexed]
+                for source, linked in chunk_store.links().items() if indexed.intersection(linked)
+            })
+        else:
+            # A store from before links were recorded: each chunk belongs to the document it came from
+            print("🔨 Building source index from the docstore...")
+            source_index = SourceIndex.from_documents(chunk_store.items(chunk_ids))
+        migrated = True
+    source_index.attach(vector_store.index_to_docstore_id)
+    app_store["source_index"] = source_index
+    app_store["bm25_retriever"], bm25_rebuilt = load_or_build_bm25(vector_store, folder_path)
+    return migrated or bm25_rebuilt
+
+
+def _replay_log(store: SnapshotStore) -> int:
+    """Re-applies the mutations logged since the snapshot. Returns the number replayed."""
+    replayed = 0
+    for record in store.wal.replay():
+        if record["op"] == "add":
+            chunks = record["chunks"]
+            docs = [Document(page_content=chunk["text"], metadata=chunk["metadata"]) for chunk in chunks]
+            vectors = [decode_vector(chunk["vector"]) for chunk in chunks]
+            if chunks:
+                _apply_add(docs, vectors, [chunk["id"] for chunk in chunks], [chunk["faiss_id"] for chunk in chunks])
+            _apply_links(record.get("links", {}))
+            _apply_unlinks(record.get("unlinks", {}))
+        elif record["op"] == "delete":
+            _apply_delete(record["source"])
+        replayed += 1
+    return replayed
+
+
+def _save_snapshot(folder_path: str):
+    vector_store = app_store["vector_store"]
+    save_index(folder_path, vector_store.index, vector_store.index_to_docstore_id)
+    app_store["source_index"].save(folder_path)
+    save_meta(folder_path, app_store.get("index_meta", {}))
+    bm25_retriever = app_store.get("bm25_retriever")
+    if bm25_retriever is not None:
+        bm25_retriever.index.save(folder_path)
+
+
+def _write_snapshot():
+    """Compacts the write-ahead log into a new snapshot. Searches continue meanwhile."""
+    if app_store.get("vector_store") is None:
+        return
+    with index_rwlock.read():
+        app_store["persistence"].write_snapshot(_save_snapshot)
+    with index_rwlock.write():
+        # The snapshot a memory-mapped index was loaded from has just been removed;
+        # the new one holds the same index, so later writes copy it from there.
+        if app_store.get("mmap_snapshot") is not None:
+            app_store["mmap_snapshot"] = app_store["persistence"].snapshot_dir
+    print(f"💾 Wrote knowledge base snapshot {app_store['persistence'].generation}.")
+
+
+def _reconcile_chunk_store() -> bool:
+    """
+    The chunk store lives outside the snapshots, so after a crash it can disagree with
+    the replayed indexes. Chunks only it has (from a store older than write-ahead
+    ordering, or written by hand) are deleted. Indexed chunks it lacks, or that no
+    document has, are dropped from FAISS, the source index and BM25, as searches cannot
+    return them. Its links are then brought in line with the source index. Returns True
+    if the indexes changed, so a fresh snapshot should be written.
+    """
+    chunk_store: ChunkStore = app_store["chunk_store"]
+    vector_store = app_store["vector_store"]
+    known = set(vector_store.index_to_docstore_id.values()) if vector_store is not None else set()
+    stored = set(chunk_store.ids())
+    orphans = [chunk_id for chunk_id in stored if chunk_id not in known]
+    if orphans:
+        chunk_store.delete(orphans)
+        print(f"🧹 Removed {len(orphans)} chunks left by an interrupted upload.")
+
+    source_index: SourceIndex = app_store["source_index"]
+    missing = [chunk_id for chunk_id in known if chunk_id not in stored]
+    unowned = [chunk_id for chunk_id in known if chunk_id in stored and not source_index.sources_of(chunk_id)]
+    dropped: Dict[str, int] = {}
+    for chunk_id in missing:
+        for source in source_index.sources_of(chunk_id):
+            dropped.update(source_index.unlink(source, [chunk_id]))
+    # Chunks no document has are dropped by their FAISS ID directly
+    by_chunk = {chunk_id: faiss_id for faiss_id, chunk_id in vector_store.index_to_docstore_id.items()} if known else {}
+    for chunk_id in missing + unowned:
+        if chunk_id not in dropped:
+            source_index.faiss_ids.pop(chunk_id, None)
+            dropped[chunk_id] = by_chunk[chunk_id]
+    _drop_chunks(dropped)
+    if missing:
+        print(f"🧹 Dropped {len(missing)} indexed chunks missing from the chunk store.")
+    if unowned:
+        print(f"🧹 Dropped {len(unowned)} indexed chunks no document has.")
+
+    linked = {(source, chunk_id) for source, chunk_ids in chunk_store.links().items() for chunk_id in chunk_ids}
+    expected = {(source, chunk_id) for source, chunk_ids in source_index.sources.items() for chunk_id in chunk_ids}
+    if linked != expected:
+        chunk_store.unlink(_by_source(linked - expected))
+        chunk_store.link(_by_source(expected - linked))
+    return bool(dropped)
+
+
+def _by_source(pairs: Iterable[Tuple[str, str]]) -> Dict[str, List[str]]:
+    grouped: Dict[str, List[str]] = {}
+    for source, chunk_id in pairs:
+        grouped.setdefault(source, []).append(chunk_id)
+    return grouped
+
+
+def _sync_signatures():
+    """
+    Brings the duplicate signatures in step with the indexed chunks. Signatures of chunks
+    that are gone (an interrupted upload, a replayed delete) are dropped, and missing ones
+    (replayed uploads, chunks indexed before deduplication) are computed from the text.
+    """
+    signatures: Optional[SignatureIndex] = app_store.get("signatures")
+    if signatures is None:
+        return
+    vector_store = app_store["vector_store"]
+    known = set(vector_store.index_to_docstore_id.values()) if vector_store is not None else set()
+    signatures.remove([chunk_id for chunk_id in signatures.ids() if chunk_id not in known])
+    missing = [chunk_id for chunk_id in known if chunk_id not in signatures]
+    if missing:
+        signatures.add({chunk_id: signature(doc.page_content) for chunk_id, doc in app_store["chunk_store"].items(missing)})
+        print(f"🔨 Computed duplicate signatures for {len(missing)} chunks.")
+
+
+def _ensure_writable(vector_store: FAISS):
+    """Swaps a memory-mapped index for an in-memory copy before its first modification."""
+    folder_path = app_store.pop("mmap_snapshot", None)
+    if folder_path is not None:
+        vector_store.index = writable_index(folder_path)
+
+
+def load_knowledge_base():
+    """
+    Loads the newest snapshot under FAISS_PATH and replays the write-ahead log on top of
+    it. A store saved by the old full-save layout is loaded and converted to a snapshot.
+    """
+    app_store["vector_store"] = None
+    app_store["bm25_retriever"] = None
+    app_store["source_index"] = SourceIndex()
+    app_store["tombstones"] = Tombstones()
+    app_store["index_meta"] = {}
+    app_store.pop("mmap_snapshot", None)
+
+    store = SnapshotStore(settings.FAISS_PATH, fsync=settings.WAL_FSYNC, compact_bytes=settings.WAL_COMPACT_BYTES)
+    app_store["persistence"] = store
+    # Chunk text lives outside the snapshots, kept in step by idempotent replay
+    app_store["chunk_store"] = ChunkStore(
+        os.path.join(settings.FAISS_PATH, CHUNK_STORE_FILE), mmap_bytes=settings.CHUNK_STORE_MMAP_MB * 1024 * 1024
+    )
+    app_store["signatures"] = None
+    if settings.DEDUP_ENABLED:
+        app_store["signatures"] = SignatureIndex(
+            settings.DEDUP_SIMILARITY, settings.DEDUP_MIN_TOKENS, db_path=os.path.join(settings.FAISS_PATH, SIGNATURES_FILE)
+        )
+
+    needs_snapshot = False
+    if store.snapshot_dir:
+        needs_snapshot = _load_snapshot(store.snapshot_dir)
+    elif store.legacy_dir:
+        _load_snapshot(store.legacy_dir)
+        needs_snapshot = True
+
+    replayed = _replay_log(store)
+    if replayed:
+        print(f"🔁 Replayed {replayed} logged changes.")
+    needs_snapshot |= _reconcile_chunk_store()
+    _sync_signatures()
+
+    vector_store = app_store["vector_store"]
+    if vector_store is None:
+        print("⚠️ No vector store found. A new one will be created on first upload.")
+        return
+    # Picks up a changed FAISS_INDEX_TYPE
+    needs_snapshot |= _maybe_rebuild_index(vector_store)
+    if needs_snapshot:
+        _write_snapshot()
+
+    chunk_count = len(vector_store.index_to_docstore_id)
+    if chunk_count:
+        print(f"✅ Retrievers are ready. Loaded {chunk_count} documents.")
+    else:
+        print("⚠️ Vector store loaded but appears empty (no documents in docstore).")
+
+
+def _apply_add(docs: List[Document], vectors: List[List[float]], chunk_ids: List[str], faiss_ids: List[int],
+               signatures: Optional[List[Signature]] = None):
+    """Adds chunks to the in-memory indexes. Callers hold the index write lock (or are replaying)."""
+    source_index: SourceIndex = app_store["source_index"]
+    vector_store = app_store.get("vector_store")
+    if vector_store is None:
+        vector_store = new_vector_store(app_store["embeddings"], app_store["chunk_store"], len(vectors[0]))
+        app_store["vector_store"] = vector_store
+    _ensure_writable(vector_store)
+
+    matrix = np.array(vectors, dtype=np.float32)
+    if vector_store._normalize_L2:
+        faiss.normalize_L2(matrix)
+    vector_store.index.add_with_ids(matrix, np.array(faiss_ids, dtype=np.int64))
+    vector_store.docstore.add({
+        chunk_id: Document(id=chunk_id, page_content=doc.page_content, metadata=doc.metadata)
+        for chunk_id, doc in zip(chunk_ids, docs)
+    })
+    vector_store.index_to_docstore_id.update(zip(faiss_ids, chunk_ids))
+
+    by_source: Dict[str, List[int]] = {}
+    for position, doc in enumerate(docs):
+        by_source.setdefault(doc.metadata.get("source", "N/A"), []).append(position)
+    for source, positions in by_source.items():
+        source_index.add(source, [chunk_ids[i] for i in positions], [faiss_ids[i] for i in positions])
+    app_store["chunk_store"].link({
+        source: [chunk_ids[i] for i in positions] for source, positions in by_source.items()
+    })
+
+    # Update the BM25 index with the new chunks only
+    bm25_retriever = app_store.get("bm25_retriever")
+    if bm25_retriever is None:
+        bm25_retriever = BM25IndexRetriever(index=IncrementalBM25(), get_document=docstore_lookup(vector_store))
+        app_store["bm25_retriever"] = bm25_retriever
+    bm25_retriever.add_documents(chunk_ids, docs)
+
+    index = app_store.get("signatures")
+    if index is not None and signatures is not None:
+        index.add(dict(zip(chunk_ids, signatures)))
+
+
+def _apply_links(links: Dict[str, List[str]]):
+    """Adds stored chunks to the documents that duplicate them. Same locking as _apply_add."""
+    source_index: SourceIndex = app_store["source_index"]
+    for source, chunk_ids in links.items():
+        source_index.link(source, chunk_ids)
+    # Chunks deleted since the link was planned are not linked
+    app_store["chunk_store"].link({
+        source: [chunk_id for chunk_id in chunk_ids if source in source_index.sources_of(chunk_id)]
+        for source, chunk_ids in links.items()
+    })
+
+
+def _apply_unlinks(unlinks: Dict[str, List[str]]) -> int:
+    """Removes chunks from documents, and from the stores once no document has them. Same locking as _apply_add."""
+    source_index: SourceIndex = app_store["source_index"]
+    unlinked, orphans = 0, {}
+    for source, chunk_ids in unlinks.items():
+        unlinked += len(set(chunk_ids).intersection(source_index.sources.get(source, ())))
+        orphans.update(source_index.unlink(source, chunk_ids))
+    app_store["chunk_store"].unlink(unlinks)
+    # One removal for the whole batch, as each can cost a pass over the index
+    _drop_chunks(orphans)
+    return unlinked
+
+
+def _drop_chunks(orphans: Dict[str, int]):
+    """Removes chunks (chunk ID -> FAISS ID) that no document has from the vector store, BM25 and signature indexes."""
+    if not orphans:
+        return
+    vector_store = app_store["vector_store"]
+    ids_to_delete = list(orphans)
+    # During replay the chunks may already be gone from the chunk store
+    found = vector_store.docstore.mget(ids_to_delete)
+    deleted_docs = [found.get(chunk_id) for chunk_id in ids_to_delete]
+    if index_type_of(vector_store.index) != "HNSW":
+        # HNSW only records tombstones, which a memory-mapped index can take
+        _ensure_writable(vector_store)
+
+    # Delete from vector store
+    vector_store.index = remove_ids(vector_store.index, list(orphans.values()), app_store["tombstones"])
+    vector_store.docstore.delete(ids_to_delete)
+    for faiss_id in orphans.values():
+        vector_store.index_to_docstore_id.pop(faiss_id, None)
+
+    # Drop only the deleted chunks from the BM25 index
+    bm25_retriever = app_store.get("bm25_retriever")
+    if bm25_retriever is not None:
+        bm25_retriever.delete(ids_to_delete, deleted_docs)
+        if not len(bm25_retriever.index):
+            app_store["bm25_retriever"] = None
+
+    signatures = app_store.get("signatures")
+    if signatures is not None:
+        signatures.remove(ids_to_delete)
+
+
+def _apply_delete(filename: str) -> int:
+    """Removes a document from the in-memory indexes; chunks other documents share are kept. Same locking as _apply_add."""
+    # The document's chunks come straight from the source index, no docstore scan
+    return _apply_unlinks({filename: app_store["source_index"].chunk_ids(filename)})
+
+
+def _log_mutation(record: Dict):
+    """
+    Appends a mutation to the write-ahead log before it is applied, so nothing searches
+    can see is lost by a crash. Only the change itself is written, so the cost follows
+    the size of the upload; the full indexes are only rewritten when the log is
+    compacted (or the index was rebuilt anyway).
+    """
+    app_store["persistence"].wal.append(record)
+
+
+def _compact_if_needed():
+    """After a mutation: rebuilds the FAISS index if due, and compacts the log once it is large."""
+    store: SnapshotStore = app_store["persistence"]
+    if _maybe_rebuild_index(app_store["vector_store"]) or store.should_compact():
+        _write_snapshot()
+
+
+# --- Deduplication ---
+def new_batch_signatures() -> Optional[SignatureIndex]:
+    """Signatures of the chunks of one upload (or ingest batch), to find duplicates within it. None if dedup is off."""
+    signatures: Optional[SignatureIndex] = app_store.get("signatures")
+    if signatures is None:
+        return None
+    return SignatureIndex(signatures.threshold, signatures.min_tokens)
+
+
+def _find_duplicate(sig: Signature, source: str, batch: SignatureIndex) -> Optional[Tuple[str, str]]:
+    """
+    (chunk ID, "exact" or "near") of the indexed chunk, or else the earlier chunk in the
+    batch, that `sig` duplicates. A near match with a chunk of the same document is an
+    edit of that chunk on re-upload, so it does not count.
+    """
+    match = app_store["signatures"].match(sig)
+    if match is not None and match[1] == "near" and source in app_store["source_index"].sources_of(match[0]):
+        match = None
+    return match or batch.match(sig)
+
+
+def _match_new_chunks(docs: List[Document], batch: SignatureIndex) -> Tuple[List[Signature], List[int]]:
+    """The chunks' signatures, and the positions of those that duplicate nothing indexed or earlier in `batch`."""
+    signatures = [signature(doc.page_content) for doc in docs]
+    new = []
+    # Matching reads the signature and source indexes, which mutations change under the write lock
+    with index_rwlock.read():
+        for position, (doc, sig) in enumerate(zip(docs, signatures)):
+            if _find_duplicate(sig, doc.metadata.get("source", "N/A"), batch) is None:
+                batch.add({str(len(batch)): sig})
+                new.append(position)
+    return signatures, new
+
+
+async def embed_new_chunks(embeddings, docs: List[Document], batch: Optional[SignatureIndex] = None
+                           ) -> Tuple[List[Optional[List[float]]], Optional[List[Signature]]]:
+    """
+    Embeds the chunks that are not duplicates of indexed chunks or of earlier chunks in
+    `batch` (which they are added to). Duplicates get None instead of a vector. Returns
+    the vectors and the chunks' signatures for add_chunks (None if dedup is off).
+    """
+    texts = [doc.page_content for doc in docs]
+    if batch is None:
+        batch = new_batch_signatures()
+    if batch is None:
+        return await embeddings.aembed_documents(texts), None
+    loop = asyncio.get_running_loop()
+    signatures, new = await loop.run_in_executor(app_store["executor"], _match_new_chunks, docs, batch)
+    vectors: List[Optional[List[float]]] = [None] * len(docs)
+    if new:
+        for position, vector in zip(new, await embeddings.aembed_documents([texts[i] for i in new])):
+            vectors[position] = vector
+    return vectors, signatures
+
+
+@dataclass
+class _AddPlan:
+    new: List[int] = field(default_factory=list)  # Positions of the chunks to store
+    new_ids: List[str] = field(default_factory=list)
+    links: Dict[str, List[str]] = field(default_factory=dict)  # source -> stored chunks it gains
+    unlinks: Dict[str, List[str]] = field(default_factory=dict)  # source -> chunks it no longer has
+    counts: Dict[str, int] = field(default_factory=lambda: dict.fromkeys(("new", "exact", "near", "unchanged", "removed"), 0))
+
+
+def _plan_add(docs: List[Document], signatures: List[Signature]) -> _AddPlan:
+    """
+    Decides what an upload changes. Chunks duplicating an indexed chunk, or an earlier
+    one in the batch, are linked to it rather than stored. A re-uploaded document keeps
+    the chunks it still has and loses the rest, so only the changed ones are stored.
+    Callers hold app_store["index_lock"].
+    """
+    source_index: SourceIndex = app_store["source_index"]
+    batch = new_batch_signatures()
+    plan = _AddPlan()
+    kept: Dict[str, Set[str]] = {}  # source -> chunks it has after the upload
+    for position, (doc, sig) in enumerate(zip(docs, signatures)):
+        source = doc.metadata.get("source", "N/A")
+        has = kept.setdefault(source, set())
+        match = _find_duplicate(sig, source, batch)
+        if match is None:
+            chunk_id = str(uuid.uuid4())
+            plan.new.append(position)
+            plan.new_ids.append(chunk_id)
+            batch.add({chunk_id: sig})
+            has.add(chunk_id)
+            plan.counts["new"] += 1
+            continue
+        chunk_id, kind = match
+        if chunk_id in has:
+            # Repeated within the document
+            plan.counts[kind] += 1
+        elif source in source_index.sources_of(chunk_id):
+            # Kept from the previous upload of the document
+            plan.counts["unchanged"] += 1
+        else:
+            plan.links.setdefault(source, []).append(chunk_id)
+            plan.counts[kind] += 1
+        has.add(chunk_id)
+
+    for source, has in kept.items():
+        gone = [chunk_id for chunk_id in source_index.chunk_ids(source) if chunk_id not in has]
+        if gone:
+            plan.unlinks[source] = gone
+            plan.counts["removed"] += len(gone)
+    return plan
+
+
+def _add_chunks_blocking(docs: List[Document], vectors: List[Optional[List[float]]],
+                         signatures: Optional[List[Signature]]) -> Dict[str, int]:
+    source_index: SourceIndex = app_store["source_index"]
+    if app_store.get("signatures") is None:
+        plan = _AddPlan(new=list(range(len(docs))), new_ids=[str(uuid.uuid4()) for _ in docs])
+        plan.counts["new"] = len(docs)
+    else:
+        if signatures is None:
+            signatures = [signature(doc.page_content) for doc in docs]
+        plan = _plan_add(docs, signatures)
+
+    new_docs = [docs[i] for i in plan.new]
+    new_vectors = [vectors[i] for i in plan.new]
+    missing = [i for i, vector in enumerate(new_vectors) if vector is None]
+    if missing:
+        # The chunk they duplicated while being embedded was deleted since
+        embedded = app_store["embeddings"].embed_documents([new_docs[i].page_content for i in missing])
+        for i, vector in zip(missing, embedded):
+            new_vectors[i] = vector
+    if not (new_docs or plan.links or plan.unlinks):
+        return plan.counts
+
+    # Mutations are serialized by app_store["index_lock"], so these IDs stay free until applied
+    faiss_ids = list(range(source_index.next_faiss_id, source_index.next_faiss_id + len(new_docs)))
+    with span("ingest", "persist"):
+        _log_mutation({
+            "op": "add",
+            "chunks": [
+                {"id": chunk_id, "faiss_id": faiss_id, "text": doc.page_content,
+                 "metadata": doc.metadata, "vector": encode_vector(vector)}
+                for chunk_id, faiss_id, doc, vector in zip(plan.new_ids, faiss_ids, new_docs, new_vectors)
+            ],
+            "links": plan.links,
+            "unlinks": plan.unlinks,
+        })
+
+    with span("ingest", "index"), index_rwlock.write():
+        if new_docs:
+            new_signatures = [signatures[i] for i in plan.new] if signatures is not None else None
+            _apply_add(new_docs, new_vectors, plan.new_ids, faiss_ids, new_signatures)
+        _apply_links(plan.links)
+        _apply_unlinks(plan.unlinks)
+    _compact_if_needed()
+    return plan.counts
+
+
+def _delete_source_blocking(filename: str) -> int:
+    if filename not in app_store["source_index"]:
+        return 0
+    _log_mutation({"op": "delete", "source": filename})
+    with index_rwlock.write():
+        deleted = _apply_delete(filename)
+    _compact_if_needed()
+    return deleted
+
+
+def checkpoint():
+    """Folds the write-ahead log into a snapshot on shutdown, so the next start replays
+    nothing and can memory-map the index."""
+    store: SnapshotStore = app_store.get("persistence")
+    if store is None:
+        return
+    if store.wal.size:
+        _write_snapshot()
+    store.close()
+    app_store["chunk_store"].close()
+    if app_store.get("signatures") is not None:
+        app_store["signatures"].close()
+
+
+def _run_as_background(func, *args):
+    # Executor threads do not inherit the caller's context. A mutation re-embeds after its
+    # log record is written (a PQ rebuild, a vanished duplicate), so whoever started it,
+    # those embeddings wait for Ollama rather than being rejected half-applied.
+    token = background_work.set(True)
+    try:
+        return func(*args)
+    finally:
+        background_work.reset(token)
+
+
+async def add_chunks(docs: List[Document], vectors: List[Optional[List[float]]],
+                     signatures: Optional[List[Signature]] = None) -> Dict[str, int]:
+    """
+    Adds chunks embedded by embed_new_chunks to the vector store, source index and BM25
+    index, logs them to the write-ahead log and swaps in a new chat pipeline. Duplicates
+    of indexed chunks are linked instead of stored, and a re-uploaded document only
+    changes by the chunks that differ. Returns how many chunks were new, exact or near
+    duplicates, unchanged, or removed from a re-uploaded document. Mutations are
+    serialized, so concurrent uploads cannot race.
+    """
+    loop = asyncio.get_running_loop()
+    async with app_store["index_lock"]:
+        counts = await loop.run_in_executor(
+            app_store["executor"], _run_as_background, _add_chunks_blocking, docs, vectors, signatures
+        )
+        if counts["new"] or counts["exact"] or counts["near"] or counts["removed"]:
+            rebuild_pipeline()
+            answer_cache = app_store.get("answer_cache")
+            if answer_cache is not None:
+                # New text can change any global answer, and re-uploads change their own
+                answer_cache.invalidate({doc.metadata.get("source", "N/A") for doc in docs}, include_global=True)
+    for result, count in counts.items():
+        if count:
+            DEDUP_CHUNKS.labels(result).inc(count)
+    return counts
+
+
+async def delete_source(filename: str) -> int:
+    """Removes every chunk of a document. Returns the number of chunks deleted."""
+    loop = asyncio.get_running_loop()
+    async with app_store["index_lock"]:
+        deleted = await loop.run_in_executor(app_store["executor"], _run_as_background, _delete_source_blocking, filename)
+        if deleted:
+            rebuild_pipeline()
+            answer_cache = app_store.get("answer_cache")
+            if answer_cache is not None:
+                answer_cache.invalidate({filename})
+    return deleted
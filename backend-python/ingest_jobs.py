@@ -0,0 +1,194 @@
+# ingest_jobs.py
+import time
+import uuid
+import asyncio
+import traceback
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+from config import settings
+from models import IngestJob, JobStage
+from state import app_store
+from analysis import analyze_document, ANALYSIS_CHUNKS
+from extraction import extract_chunks
+from utils import trigger_n8n_webhooks
+from ollama_gateway import background_work
+from metrics import span
+
+INGEST_STAGES = ["extract", "analyze", "embed", "index", "notify"]
+
+
+class IngestQueue:
+    """
+    Background ingestion. Uploads are queued as jobs; a pool of workers extracts and
+    analyzes each file, then a single indexer merges every upload that finished in the
+    same window into one embedding call and one index write.
+    """
+
+    def __init__(self, workers: int = 2, batch_window_ms: int = 200, max_batch_chunks: int = 2000, history: int = 1000):
+        self.workers = workers
+        self.batch_window = batch_window_ms / 1000
+        self.max_batch_chunks = max_batch_chunks
+        self.history = history
+        self.jobs: "OrderedDict[str, IngestJob]" = OrderedDict()
+        self._extract_queue: asyncio.Queue = asyncio.Queue()
+        self._index_queue: asyncio.Queue = asyncio.Queue()
+        self._tasks: List[asyncio.Task] = []
+        self._notify_tasks = set()
+
+    def start(self):
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._indexer()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, filename: str, file_path: str) -> IngestJob:
+        job = IngestJob(
+            job_id=uuid.uuid4().hex,
+            filename=filename,
+            created_at=time.time(),
+            stages={name: JobStage() for name in INGEST_STAGES},
+        )
+        self.jobs[job.job_id] = job
+        self._trim_history()
+        self._extract_queue.put_nowait((job, file_path))
+        return job
+
+    def get(self, job_id: str) -> Optional[IngestJob]:
+        return self.jobs.get(job_id)
+
+    def _trim_history(self):
+        # Drop the oldest finished jobs; queued and running jobs are always kept
+        excess = len(self.jobs) - self.history
+        for job_id in list(self.jobs):
+            if excess <= 0:
+                break
+            if self.jobs[job_id].status in ("completed", "failed"):
+                del self.jobs[job_id]
+                excess -= 1
+
+    @contextmanager
+    def _stage(self, jobs: List[IngestJob], name: str):
+        started = time.perf_counter()
+        for job in jobs:
+            stage = job.stages[name]
+            stage.status, stage.started_at = "running", time.time()
+        try:
+            yield
+        except Exception:
+            for job in jobs:
+                job.stages[name].status = "failed"
+            raise
+        finally:
+            duration = round((time.perf_counter() - started) * 1000, 1)
+            for job in jobs:
+                job.stages[name].duration_ms = duration
+        for job in jobs:
+            job.stages[name].status, job.stages[name].progress = "completed", 1.0
+
+    @staticmethod
+    def _fail(jobs: List[IngestJob], error: Exception):
+        detail = getattr(error, "detail", None) or str(error)
+        for job in jobs:
+            job.status, job.error = "failed", detail
+
+    # --- Stage 1: extraction and analysis, per upload ---
+    async def _worker(self):
+        # Each task has its own context, so this only marks the ingestion's Ollama calls
+        background_work.set(True)
+        while True:
+            job, file_path = await self._extract_queue.get()
+            try:
+                # Jobs queue up while the models and knowledge base are still loading
+                await app_store["components"].wait("pipeline")
+                docs = await self._prepare(job, file_path)
+                await self._index_queue.put((job, docs))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"❌ Ingest job {job.job_id} failed: {e}")
+                print(traceback.format_exc())
+                self._fail([job], e)
+            finally:
+                self._extract_queue.task_done()
+
+    async def _prepare(self, job: IngestJob, file_path: str) -> List[Document]:
+        job.status = "running"
+        docs = []
+        with self._stage([job], "extract"):
+            async for batch in extract_chunks(file_path, job.filename, app_store["process_pool"], settings.PDF_PAGES_PER_TASK):
+                docs.extend(batch)
+                job.chunks = len(docs)
+
+        with self._stage([job], "analyze"):
+            analysis_text = " ".join(doc.page_content for doc in docs[:ANALYSIS_CHUNKS])
+            job.result = await analyze_document(app_store["llm"], analysis_text)
+        return docs
+
+    # --- Stage 2: batched embedding and indexing, across uploads ---
+    async def _collect_batch(self) -> List[Tuple[IngestJob, List[Document]]]:
+        batch = [await self._index_queue.get()]
+        chunk_count = len(batch[0][1])
+        deadline = asyncio.get_running_loop().time() + self.batch_window
+        while chunk_count < self.max_batch_chunks:
+            remaining = deadline - asyncio.get_running_loop().time()
+            if remaining <= 0 and self._index_queue.empty():
+                break
+            try:
+                item = self._index_queue.get_nowait() if remaining <= 0 else await asyncio.wait_for(self._index_queue.get(), remaining)
+            except (asyncio.TimeoutError, asyncio.QueueEmpty):
+                break
+            batch.append(item)
+            chunk_count += len(item[1])
+        return batch
+
+    async def _indexer(self):
+        background_work.set(True)
+        while True:
+            batch = await self._collect_batch()
+            jobs = [job for job, _ in batch]
+            try:
+                await self._index_batch(batch)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"❌ Indexing failed for {len(jobs)} ingest job(s): {e}")
+                print(traceback.format_exc())
+                self._fail(jobs, e)
+            finally:
+                for _ in batch:
+                    self._index_queue.task_done()
+
+    async def _index_batch(self, batch: List[Tuple[IngestJob, List[Document]]]):
+        # Loaded with the knowledge base (workers wait for the pipeline), see main.load_index
+        from indexing import add_chunks, embed_new_chunks
+        jobs = [job for job, _ in batch]
+        all_docs = [doc for _, docs in batch for doc in docs]
+
+        with self._stage(jobs, "embed"), span("ingest", "embed"):
+            # Only chunks that are not duplicates of indexed ones are embedded
+            vectors, signatures = await embed_new_chunks(app_store["embeddings"], all_docs)
+
+        with self._stage(jobs, "index"):
+            counts = await add_chunks(all_docs, vectors, signatures)
+        print(
+            f"✅ Indexed {len(all_docs)} chunks from {len(jobs)} upload(s) in one batch: {counts['new']} new, "
+            f"{counts['exact'] + counts['near']} duplicates, {counts['unchanged']} unchanged, {counts['removed']} removed."
+        )
+
+        for job in jobs:
+            job.status = "completed"
+            task = asyncio.create_task(self._notify(job))
+            self._notify_tasks.add(task)
+            task.add_done_callback(self._notify_tasks.discard)
+
+    async def _notify(self, job: IngestJob):
+        with self._stage([job], "notify"):
+            await trigger_n8n_webhooks(urls=settings.N8N_WEBHOOK_URLS, data=job.result.model_dump())
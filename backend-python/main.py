@@ -1,76 +1,183 @@
 # main.py
 import os
+import asyncio
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from contextlib import asynccontextmanager
 import uvicorn
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from langchain_community.llms import Ollama
-from langchain_ollama import OllamaEmbeddings
-from langchain_community.vectorstores import FAISS
-from langchain_community.retrievers import BM25Retriever
-from langchain_community.cross_encoders import HuggingFaceCrossEncoder
 
 # --- CONFIGURATION ---
 from config import settings
 
 # --- STATE ---
 from state import app_store
+from embedding_cache import CachedEmbeddings
+from ollama_gateway import BatchingEmbeddings, ConcurrencyLimiter, client_kwargs
+from answer_cache import AnswerCache
+from sessions import SessionManager
+from rewrite import QueryRewriter
+from ingest_jobs import IngestQueue
+from metrics import ProfilingMiddleware
+from components import ComponentRegistry
 
 # --- ROUTERS ---
-from routers import documents, chat
+from routers import documents, chat, jobs, metrics, health
+
+# --- COMPONENT LOADERS ---
+# Each runs in a background thread once the components it requires are loaded. Model
+# libraries, faiss and the langchain vector store and chain modules (through indexing and
+# pipeline) are imported here rather than at module level, so the server starts quickly.
+def load_llm():
+    from langchain_ollama import OllamaLLM
+    app_store["llm"] = OllamaLLM(
+        model=settings.LLM_MODEL, temperature=0.2, base_url=settings.OLLAMA_BASE_URL,
+        **client_kwargs(app_store["llm_limiter"], settings.OLLAMA_MAX_CONCURRENT_GENERATIONS)
+    )
+    # Shared by every pipeline, so its rewrite cache and counters survive index changes
+    app_store["query_rewriter"] = QueryRewriter(app_store["llm"], cache_size=settings.REWRITE_CACHE_SIZE)
+
+
+def load_embeddings():
+    from langchain_ollama import OllamaEmbeddings
+    app_store["query_batcher"] = BatchingEmbeddings(
+        OllamaEmbeddings(
+            model=settings.EMBEDDING_MODEL, base_url=settings.OLLAMA_BASE_URL,
+            **client_kwargs(app_store["embedding_limiter"], settings.OLLAMA_MAX_CONCURRENT_EMBEDDINGS)
+        ),
+        window_ms=settings.OLLAMA_EMBED_BATCH_WINDOW_MS, max_batch=settings.OLLAMA_EMBED_MAX_BATCH
+    )
+    embeddings = app_store["query_batcher"]
+    if settings.EMBEDDING_CACHE_PATH:
+        embeddings = CachedEmbeddings(
+            embeddings, settings.EMBEDDING_MODEL, settings.EMBEDDING_CACHE_PATH,
+            max_entries=settings.EMBEDDING_CACHE_MAX_ENTRIES
+        )
+    app_store["embeddings"] = embeddings
+
+
+def load_reranker():
+    # Loads torch and sentence-transformers, the slowest part of startup
+    from langchain_community.cross_encoders import HuggingFaceCrossEncoder
+    from reranking import CrossEncoderRanker
+    reranker_kwargs = {}
+    if settings.RERANKER_BACKEND != "torch":
+        reranker_kwargs["backend"] = settings.RERANKER_BACKEND
+        if settings.RERANKER_MODEL_FILE:
+            reranker_kwargs["model_kwargs"] = {"file_name": settings.RERANKER_MODEL_FILE}
+    app_store["reranker"] = HuggingFaceCrossEncoder(model_name=settings.RERANKER_MODEL, model_kwargs=reranker_kwargs)
+    # Shared by every pipeline, so its score cache survives index changes
+    app_store["ranker"] = CrossEncoderRanker(
+        app_store["reranker"], batch_size=settings.RERANK_BATCH_SIZE, cache_size=settings.RERANK_SCORE_CACHE_SIZE
+    )
+
+
+def load_index():
+    from indexing import load_knowledge_base
+    load_knowledge_base()
+
+
+def build_pipeline():
+    from pipeline import rebuild_pipeline
+    rebuild_pipeline()
+
+
+def warm_up():
+    """Primes the embedding model (loading it into Ollama) and the reranker with one request each."""
+    # Past the embedding cache, which would otherwise answer without calling Ollama
+    app_store["query_batcher"].embed_query("warm up")
+    app_store["reranker"].score([("warm up", "warm up")])
+
 
 # --- FastAPI Lifespan Manager (for Startup and Shutdown) ---
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     print("🚀 Starting up application...")
-    app_store["llm"] = Ollama(model=settings.LLM_MODEL, temperature=0.2)
-    app_store["embeddings"] = OllamaEmbeddings(model=settings.EMBEDDING_MODEL)
-    app_store["reranker"] = HuggingFaceCrossEncoder(model_name=settings.RERANKER_MODEL)
-    app_store["chat_sessions"] = {} # To store memory for each session
+    # Every Ollama call goes through pooled keep-alive clients with a concurrency limit
+    app_store["llm_limiter"] = ConcurrencyLimiter(
+        "generation", settings.OLLAMA_MAX_CONCURRENT_GENERATIONS, settings.OLLAMA_MAX_QUEUE
+    )
+    app_store["embedding_limiter"] = ConcurrencyLimiter(
+        "embedding", settings.OLLAMA_MAX_CONCURRENT_EMBEDDINGS, settings.OLLAMA_MAX_QUEUE
+    )
+    app_store["sessions"] = SessionManager(
+        max_sessions=settings.SESSION_MAX_COUNT,
+        idle_ttl_seconds=settings.SESSION_IDLE_TTL_SECONDS,
+        history_token_budget=settings.SESSION_HISTORY_TOKEN_BUDGET,
+        db_path=settings.SESSION_DB_PATH or None,
+    )
+    if settings.ANSWER_CACHE_MAX_ENTRIES:
+        app_store["answer_cache"] = AnswerCache(
+            max_entries=settings.ANSWER_CACHE_MAX_ENTRIES,
+            ttl_seconds=settings.ANSWER_CACHE_TTL_SECONDS,
+            threshold=settings.ANSWER_CACHE_SIMILARITY,
+        )
+    app_store["executor"] = ThreadPoolExecutor(max_workers=settings.RAG_WORKER_THREADS, thread_name_prefix="rag")
+    app_store["process_pool"] = ProcessPoolExecutor(max_workers=settings.EXTRACTION_WORKERS or None)
+    app_store["index_lock"] = asyncio.Lock() # Serializes index mutations
 
+    # Models, clients and the knowledge base load in the background; requests wait for what they need
+    components = ComponentRegistry()
+    components.register("llm", load_llm)
+    components.register("embeddings", load_embeddings)
+    # Not needed to serve: until the cross-encoder loads, chat keeps the fused retrieval order
+    # (lower answer quality) and /health/ready reports "degraded" rather than waiting for it
+    components.register("reranker", load_reranker, essential=False)
     # Load existing vector store and create retrievers
-    index_file = os.path.join(settings.FAISS_PATH, "index.faiss")
-    if os.path.exists(index_file):
-        print(f"Loading existing vector store from {settings.FAISS_PATH}...")
-        vector_store = FAISS.load_local(
-            settings.FAISS_PATH,
-            app_store["embeddings"],
-            allow_dangerous_deserialization=True
-        )
-        app_store["vector_store"] = vector_store
-        
-        # Ensure we convert to list for BM25
-        if hasattr(vector_store, "docstore") and hasattr(vector_store.docstore, "_dict"):
-             docs_from_vectorstore = list(vector_store.docstore._dict.values())
-             if docs_from_vectorstore:
-                 app_store["bm25_retriever"] = BM25Retriever.from_documents(docs_from_vectorstore)
-                 print(f"✅ Retrievers are ready. Loaded {len(docs_from_vectorstore)} documents.")
-             else:
-                 app_store["bm25_retriever"] = None
-                 print("⚠️ Vector store loaded but appears empty (no documents in docstore).")
-        else:
-             app_store["bm25_retriever"] = None
-             print("⚠️ Vector store loaded but docstore is missing or invalid.")
-    else:
-        app_store["vector_store"] = None
-        app_store["bm25_retriever"] = None
-        print("⚠️ No vector store found. A new one will be created on first upload.")
+    components.register("knowledge_base", load_index, requires=["embeddings"])
+    # Build the chat pipeline once; it is swapped whenever the index changes
+    components.register("pipeline", build_pipeline, requires=["llm", "knowledge_base"])
+    if settings.STARTUP_WARMUP:
+        components.register("warmup", warm_up, requires=["embeddings", "reranker"], essential=False)
+    app_store["components"] = components
+    components.start()
+
+    # Background ingestion workers (they wait for the pipeline before taking jobs)
+    app_store["ingest_queue"] = IngestQueue(
+        workers=settings.INGEST_WORKERS,
+        batch_window_ms=settings.INGEST_BATCH_WINDOW_MS,
+        max_batch_chunks=settings.INGEST_BATCH_MAX_CHUNKS,
+        history=settings.INGEST_JOB_HISTORY,
+    )
+    app_store["ingest_queue"].start()
 
     yield
 
     print("Shutting down application...")
+    await app_store["ingest_queue"].stop()
+    await components.stop()
+    # Nothing to snapshot if the knowledge base never loaded (and its state is not trustworthy)
+    if components.is_ready("knowledge_base"):
+        from indexing import checkpoint
+        async with app_store["index_lock"]:
+            checkpoint()
+    app_store["executor"].shutdown(wait=False, cancel_futures=True)
+    app_store["process_pool"].shutdown(wait=False, cancel_futures=True)
+    app_store["sessions"].close()
+    if "query_batcher" in app_store:
+        app_store["query_batcher"].close()
+    if isinstance(app_store.get("embeddings"), CachedEmbeddings):
+        app_store["embeddings"].close()
     app_store.clear()
 
 # --- FASTAPI APP INITIALIZATION ---
 app = FastAPI(title="Advanced RAG API", lifespan=lifespan)
 app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_credentials=True, allow_methods=["*"], allow_headers=["*"])
+if settings.PROFILE_SAMPLE_RATE > 0:
+    app.add_middleware(
+        ProfilingMiddleware, sample_rate=settings.PROFILE_SAMPLE_RATE, output_dir=settings.PROFILE_DIR,
+        interval_ms=settings.PROFILE_INTERVAL_MS
+    )
 os.makedirs(settings.UPLOAD_DIRECTORY, exist_ok=True)
 app.mount("/files", StaticFiles(directory=settings.UPLOAD_DIRECTORY), name="files")
 
 # --- INCLUDE ROUTERS ---
 app.include_router(documents.router)
 app.include_router(chat.router)
+app.include_router(jobs.router)
+app.include_router(metrics.router)
+app.include_router(health.router)
 
 # --- MAIN EXECUTION ---
 if __name__ == '__main__':
@@ -0,0 +1,199 @@
+# metrics.py
+import os
+import sys
+import time
+import uuid
+import random
+import asyncio
+import threading
+from collections import Counter as StackCounter
+from contextlib import contextmanager
+from typing import Dict, Tuple
+
+from prometheus_client import REGISTRY, Counter, Histogram
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+from state import app_store
+
+# Spans from a few milliseconds (BM25, fusion) up to long generations and large uploads
+_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+STAGE_SECONDS = Histogram(
+    "rag_stage_duration_seconds", "Time spent in each ingest and chat stage.",
+    ["pipeline", "stage"], buckets=_BUCKETS,
+)
+CHAT_REQUESTS = Counter(
+    "rag_chat_requests_total", "Chat requests by outcome: answered, cached, overloaded or failed.",
+    ["outcome"],
+)
+DEDUP_CHUNKS = Counter(
+    "rag_dedup_chunks_total",
+    "Ingested chunks by deduplication result: new, exact, near or unchanged; and removed, "
+    "chunks dropped from re-uploaded documents.",
+    ["result"],
+)
+
+
+def observe(pipeline: str, stage: str, seconds: float):
+    STAGE_SECONDS.labels(pipeline, stage).observe(seconds)
+
+
+@contextmanager
+def span(pipeline: str, stage: str):
+    """Times the enclosed block into the stage histogram."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(pipeline, stage, time.perf_counter() - started)
+
+
+async def timed(pipeline: str, stage: str, awaitable):
+    """Awaits `awaitable` and times it into the stage histogram, for work run as a task."""
+    with span(pipeline, stage):
+        return await awaitable
+
+
+def observe_timings(pipeline: str, timings: Dict[str, float]):
+    """Records a pipeline's per-stage `timings` (`<stage>_ms` milliseconds)."""
+    for key, milliseconds in timings.items():
+        observe(pipeline, key[:-3] if key.endswith("_ms") else key, milliseconds / 1000)
+
+
+class AppStateCollector:
+    """Gauges read from app_store when /metrics is scraped: corpus size, sessions, cache hit rates and Ollama load."""
+
+    def collect(self):
+        corpus = GaugeMetricFamily("rag_corpus_size", "Indexed documents and chunks.", labels=["unit"])
+        source_index = app_store.get("source_index")
+        if source_index is not None:
+            corpus.add_metric(["documents"], len(source_index))
+            corpus.add_metric(["chunks"], source_index.chunk_count())
+            # Chunks counted once per document that has them; the excess over chunks is deduplicated
+            corpus.add_metric(["document_chunks"], source_index.link_count())
+        yield corpus
+
+        sessions = app_store.get("sessions")
+        if sessions is not None:
+            yield GaugeMetricFamily("rag_chat_sessions", "Chat sessions held in memory.", value=len(sessions))
+
+        hit_rates = GaugeMetricFamily(
+            "rag_cache_hit_ratio", "Hit rate of each cache since startup (for rewrite, the share of skipped LLM rewrites).",
+            labels=["cache"]
+        )
+        embeddings = app_store.get("embeddings")
+        if hasattr(embeddings, "hit_rate"):
+            hit_rates.add_metric(["embedding"], embeddings.hit_rate)
+        if app_store.get("answer_cache") is not None:
+            hit_rates.add_metric(["answer"], app_store["answer_cache"].hit_rate)
+        if app_store.get("ranker") is not None:
+            hit_rates.add_metric(["rerank"], app_store["ranker"].stats()["cache_hit_rate"])
+        if app_store.get("query_rewriter") is not None:
+            hit_rates.add_metric(["rewrite"], app_store["query_rewriter"].stats()["skip_rate"])
+        yield hit_rates
+
+        in_flight = GaugeMetricFamily("rag_ollama_in_flight", "Requests in flight to Ollama.", labels=["kind"])
+        queued = GaugeMetricFamily("rag_ollama_queued", "Requests waiting for an Ollama slot.", labels=["kind"])
+        rejected = CounterMetricFamily("rag_ollama_rejected", "Requests rejected because the Ollama queue was full.", labels=["kind"])
+        for key in ("llm_limiter", "embedding_limiter"):
+            limiter = app_store.get(key)
+            if limiter is not None:
+                stats = limiter.stats()
+                in_flight.add_metric([limiter.name], stats["in_flight"])
+                queued.add_metric([limiter.name], stats["queued"])
+                rejected.add_metric([limiter.name], stats["rejected"])
+        yield in_flight
+        yield queued
+        yield rejected
+
+
+REGISTRY.register(AppStateCollector())
+
+
+class StackSampler:
+    """
+    Wall-clock sampling profiler over every thread. A background thread reads the stack of
+    each thread (sys._current_frames) every `interval` seconds and counts identical stacks,
+    so the thread pool, the embedding dispatcher and the event loop are all covered, at a
+    cost set by the interval rather than by how many calls the code makes. Threads that
+    are waiting are sampled too, in the wait.
+    """
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.samples = 0
+        self.stacks: "StackCounter[Tuple[str, ...]]" = StackCounter()
+        self._labels: Dict[object, str] = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            label = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+            self._labels[code] = label
+        return label
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(self._label(frame.f_code))
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.stacks[tuple(reversed(stack))] += 1
+            self.samples += 1
+
+    def write_folded(self, path: str):
+        """Writes the stacks in collapsed format ("thread;outer;...;inner count"), for flamegraph.pl or speedscope."""
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{';'.join(stack)} {count}\n")
+
+
+class ProfilingMiddleware:
+    """
+    Opt-in sampling profiler: a `sample_rate` fraction of HTTP requests is profiled with
+    a StackSampler, through to the end of a streamed response, and one .folded file of
+    sampled stacks per profiled request is written to `output_dir`. Every thread is
+    sampled, so blocking work on the thread pool shows up with the request that caused
+    it, as does anything else running meanwhile. Only one request is profiled at a time.
+    """
+
+    def __init__(self, app, sample_rate: float, output_dir: str, interval_ms: float = 5.0):
+        self.app = app
+        self.sample_rate = sample_rate
+        self.output_dir = output_dir
+        self.interval = interval_ms / 1000
+        self._busy = threading.Lock()
+        os.makedirs(output_dir, exist_ok=True)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or random.random() >= self.sample_rate or not self._busy.acquire(blocking=False):
+            await self.app(scope, receive, send)
+            return
+        sampler = StackSampler(self.interval)
+        try:
+            sampler.start()
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                # Joining the sampler thread and writing the profile block, so neither runs on the loop
+                await asyncio.to_thread(sampler.stop)
+            name = scope["path"].strip("/").replace("/", "_") or "root"
+            filename = f"{time.strftime('%Y%m%d-%H%M%S')}-{name}-{uuid.uuid4().hex[:8]}.folded"
+            await asyncio.to_thread(sampler.write_folded, os.path.join(self.output_dir, filename))
+        finally:
+            self._busy.release()
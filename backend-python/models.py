@@ -1,4 +1,4 @@
-from typing import List, Optional
+from typing import Dict, List, Optional
 from pydantic import BaseModel, Field
 
 class DocumentAnalysis(BaseModel):
@@ -14,3 +14,23 @@ class ChatRequest(BaseModel):
 class ChatResponse(BaseModel):
     answer: str
     sources: List[str] = []
+
+class JobStage(BaseModel):
+    status: str = "pending"  # pending | running | completed | failed
+    progress: float = 0.0
+    started_at: Optional[float] = None
+    duration_ms: Optional[float] = None
+
+class IngestJob(BaseModel):
+    job_id: str
+    filename: str
+    status: str = "queued"  # queued | running | completed | failed
+    created_at: float
+    stages: Dict[str, JobStage] = {}
+    chunks: int = 0
+    result: Optional[DocumentAnalysis] = None
+    error: Optional[str] = None
+
+class JobAccepted(BaseModel):
+    job_id: str
+    status_url: str
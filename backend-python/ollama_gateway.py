@@ -0,0 +1,306 @@
+# ollama_gateway.py
+import time
+import queue
+import asyncio
+import threading
+from collections import deque
+from concurrent.futures import Future
+from contextvars import ContextVar
+from typing import Callable, Deque, Dict, List, Optional, Set
+
+import httpx
+from langchain_core.embeddings import Embeddings
+
+# Set for ingestion work: it waits for a free slot however long the queue is, while
+# interactive chat requests are turned away once the queue is full
+background_work: ContextVar[bool] = ContextVar("ollama_background_work", default=False)
+
+
+class OllamaOverloadedError(Exception):
+    """Raised when too many requests are already waiting for Ollama."""
+
+
+class ConcurrencyLimiter:
+    """
+    Caps the requests in flight to Ollama, for both threads and coroutines. Callers beyond
+    the cap wait in FIFO order; once `max_queue` are waiting, further interactive callers
+    are rejected with OllamaOverloadedError instead of piling up behind them.
+    """
+
+    def __init__(self, name: str, max_concurrency: int, max_queue: int):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self._lock = threading.Lock()
+        self._active = 0
+        self._waiters: Deque[Callable[[], None]] = deque()
+        self.completed = 0
+        self.rejected = 0
+        self.peak_queued = 0
+        self.wait_ms_total = 0.0
+
+    def _try_acquire(self, waiter: Callable[[], None]) -> bool:
+        """Takes a slot, or queues `waiter` to be called when one is handed over."""
+        with self._lock:
+            if self._active < self.max_concurrency and not self._waiters:
+                self._active += 1
+                return True
+            if len(self._waiters) >= self.max_queue and not background_work.get():
+                self.rejected += 1
+                raise OllamaOverloadedError(
+                    f"Ollama {self.name} queue is full ({len(self._waiters)} requests waiting)."
+                )
+            self._waiters.append(waiter)
+            self.peak_queued = max(self.peak_queued, len(self._waiters))
+            return False
+
+    def acquire(self):
+        started = time.perf_counter()
+        event = threading.Event()
+        if not self._try_acquire(event.set):
+            event.wait()
+        self._record_wait(started)
+
+    async def acquire_async(self):
+        started = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def hand_over(future=future):
+            if future.done():
+                # The waiter was cancelled (client went away): pass the slot on
+                self.release()
+            else:
+                future.set_result(None)
+
+        if not self._try_acquire(lambda: loop.call_soon_threadsafe(hand_over)):
+            await future
+        self._record_wait(started)
+
+    def _record_wait(self, started: float):
+        with self._lock:
+            self.wait_ms_total += (time.perf_counter() - started) * 1000
+
+    def release(self):
+        with self._lock:
+            self.completed += 1
+            # A freed slot goes straight to the next waiter, so the count stays the same
+            waiter = self._waiters.popleft() if self._waiters else None
+            if waiter is None:
+                self._active -= 1
+        if waiter is not None:
+            waiter()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                "in_flight": self._active,
+                "queued": len(self._waiters),
+                "peak_queued": self.peak_queued,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "avg_wait_ms": round(self.wait_ms_total / self.completed, 1) if self.completed else 0.0,
+            }
+
+
+class _ReleasingStream(httpx.SyncByteStream):
+    # Holds the slot until the (possibly streamed) response body is closed
+    def __init__(self, stream, release: Callable[[], None]):
+        self._stream = stream
+        self._release = release
+
+    def __iter__(self):
+        yield from self._stream
+
+    def close(self):
+        try:
+            self._stream.close()
+        finally:
+            self._release()
+
+
+class _AsyncReleasingStream(httpx.AsyncByteStream):
+    def __init__(self, stream, release: Callable[[], None]):
+        self._stream = stream
+        self._release = release
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self):
+        try:
+            await self._stream.aclose()
+        finally:
+            self._release()
+
+
+def _once(func: Callable[[], None]) -> Callable[[], None]:
+    called = threading.Event()
+
+    def wrapper():
+        if not called.is_set():
+            called.set()
+            func()
+    return wrapper
+
+
+class LimitedTransport(httpx.HTTPTransport):
+    """Pooled keep-alive transport for the sync Ollama client, gated by a limiter."""
+
+    def __init__(self, limiter: ConcurrencyLimiter, **kwargs):
+        super().__init__(**kwargs)
+        self.limiter = limiter
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        self.limiter.acquire()
+        release = _once(self.limiter.release)
+        try:
+            response = super().handle_request(request)
+        except BaseException:
+            release()
+            raise
+        response.stream = _ReleasingStream(response.stream, release)
+        return response
+
+
+class AsyncLimitedTransport(httpx.AsyncHTTPTransport):
+    """Pooled keep-alive transport for the async Ollama client, gated by a limiter."""
+
+    def __init__(self, limiter: ConcurrencyLimiter, **kwargs):
+        super().__init__(**kwargs)
+        self.limiter = limiter
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        await self.limiter.acquire_async()
+        release = _once(self.limiter.release)
+        try:
+            response = await super().handle_async_request(request)
+        except BaseException:
+            release()
+            raise
+        response.stream = _AsyncReleasingStream(response.stream, release)
+        return response
+
+
+def client_kwargs(limiter: ConcurrencyLimiter, max_connections: int) -> Dict[str, Dict]:
+    """sync_client_kwargs / async_client_kwargs for langchain_ollama's OllamaLLM and OllamaEmbeddings."""
+    limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+    return {
+        "sync_client_kwargs": {"transport": LimitedTransport(limiter, limits=limits)},
+        "async_client_kwargs": {"transport": AsyncLimitedTransport(limiter, limits=limits)},
+    }
+
+
+class BatchingEmbeddings(Embeddings):
+    """
+    Coalesces concurrent single-query embeddings into one embedding call. The first query
+    opens a window of `window_ms`; every query arriving within it (up to `max_batch`) is
+    embedded in the same request. Document embeddings are already batched and pass through.
+
+    aembed_query batches on the event loop and embeds through the async client, so waiting
+    queries hold no threads; embed_query batches on a dispatcher thread for sync callers.
+    """
+
+    def __init__(self, underlying: Embeddings, window_ms: float = 5, max_batch: int = 32):
+        self.underlying = underlying
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self.batches = 0
+        self.queries = 0
+        self._queue: "queue.Queue[Optional[tuple]]" = queue.Queue()
+        # Event loop batch: (text, future) pairs waiting for the window to close
+        self._pending: List[tuple] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._flushing: Set[asyncio.Task] = set()
+        self._thread = threading.Thread(target=self._dispatch, name="embed-batcher", daemon=True)
+        self._thread.start()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.underlying.embed_documents(texts)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self.underlying.aembed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        future: Future = Future()
+        self._queue.put((text, future))
+        return future.result()
+
+    async def aembed_query(self, text: str) -> List[float]:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush_pending()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.window, self._flush_pending)
+        return await future
+
+    def _flush_pending(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.ensure_future(self._aembed_batch(batch))
+            self._flushing.add(task)
+            task.add_done_callback(self._flushing.discard)
+
+    async def _aembed_batch(self, batch: List[tuple]):
+        texts = list(dict.fromkeys(text for text, _ in batch))
+        try:
+            vectors = dict(zip(texts, await self.underlying.aembed_documents(texts)))
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        self.batches += 1
+        self.queries += len(batch)
+        for text, future in batch:
+            # A caller that went away has a cancelled future
+            if not future.done():
+                future.set_result(vectors[text])
+
+    def _dispatch(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._queue.put(None)
+                    break
+                batch.append(item)
+
+            texts = list(dict.fromkeys(text for text, _ in batch))
+            try:
+                vectors = dict(zip(texts, self.underlying.embed_documents(texts)))
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            self.batches += 1
+            self.queries += len(batch)
+            for text, future in batch:
+                future.set_result(vectors[text])
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "query_batches": self.batches,
+            "queries": self.queries,
+            "avg_batch_size": round(self.queries / self.batches, 2) if self.batches else 0.0,
+        }
+
+    def close(self):
+        self._queue.put(None)
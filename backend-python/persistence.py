@@ -0,0 +1,208 @@
+# persistence.py
+import os
+import re
+import json
+import base64
+import shutil
+from typing import Callable, Dict, Iterator, List, Optional
+
+import numpy as np
+
+CURRENT_FILE = "CURRENT"
+SNAPSHOT_PATTERN = re.compile(r"^snapshot-(\d+)(\.tmp)?$")
+WAL_PATTERN = re.compile(r"^wal-(\d+)\.log$")
+# Files written by the old full save_local persistence, directly under FAISS_PATH
+LEGACY_FILES = ("index.faiss", "index.pkl", "bm25_index.json", "source_index.json", "index_meta.json")
+
+
+def encode_vector(vector) -> str:
+    return base64.b64encode(np.asarray(vector, dtype=np.float32).tobytes()).decode("ascii")
+
+
+def decode_vector(data: str) -> List[float]:
+    return np.frombuffer(base64.b64decode(data), dtype=np.float32).tolist()
+
+
+def _fsync_dir(path: str):
+    # Makes renames inside the directory durable; not supported on Windows
+    if os.name == "nt":
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class WriteAheadLog:
+    """
+    Append-only log of index mutations, one JSON record per line. Every append is flushed
+    and fsynced before the mutation is acknowledged. A record cut short by a crash is
+    dropped (and truncated away) when the log is replayed.
+    """
+
+    def __init__(self, path: str, fsync: bool = True):
+        self.path = path
+        self.fsync = fsync
+        self._file = open(path, "ab")
+        self.size = self._file.tell()
+
+    def append(self, record: Dict):
+        line = json.dumps(record, separators=(",", ":")).encode("utf-8") + b"\n"
+        self._file.write(line)
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+        self.size += len(line)
+
+    def replay(self) -> Iterator[Dict]:
+        good_offset = 0
+        with open(self.path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    break
+                good_offset += len(line)
+                yield record
+        if good_offset < self.size:
+            print(f"⚠️ Dropping {self.size - good_offset} bytes of incomplete write-ahead log records.")
+            self._file.truncate(good_offset)
+            self._file.flush()
+            self.size = good_offset
+
+    def close(self):
+        self._file.close()
+
+
+class SnapshotStore:
+    """
+    Crash-safe persistence for the knowledge base under FAISS_PATH:
+
+        CURRENT               name of the active snapshot, replaced atomically
+        snapshot-000007/      a compacted, complete copy of the indexes
+        wal-000007.log        mutations made since snapshot 7
+        chunks.sqlite3        chunk text and metadata (see chunk_store.py), not snapshotted
+
+    Startup loads the snapshot named by CURRENT and replays its log. Compaction writes
+    the next snapshot to a temporary directory, renames it into place, and only then
+    switches CURRENT and starts a new log, so a crash at any point leaves either the
+    old snapshot and log or the new ones intact.
+    """
+
+    def __init__(self, root: str, fsync: bool = True, compact_bytes: int = 64 * 1024 * 1024):
+        self.root = root
+        self.fsync = fsync
+        self.compact_bytes = compact_bytes
+        os.makedirs(root, exist_ok=True)
+        current = self._read_current()
+        if current is not None:
+            self.generation = current
+            self._remove_stale(keep=self.generation)
+        else:
+            # Without a trustworthy CURRENT nothing is deleted; the next snapshot rewrites it
+            self.generation = self._newest_generation()
+            if self.generation:
+                print(f"⚠️ {CURRENT_FILE} is missing or unreadable, using snapshot {self.generation}.")
+        self.wal = WriteAheadLog(self._wal_path(self.generation), fsync)
+
+    def _snapshot_path(self, generation: int) -> str:
+        return os.path.join(self.root, f"snapshot-{generation:06d}")
+
+    def _wal_path(self, generation: int) -> str:
+        return os.path.join(self.root, f"wal-{generation:06d}.log")
+
+    def _read_current(self) -> Optional[int]:
+        """The generation CURRENT names, 0 for a new store, or None if CURRENT is missing or
+        unreadable while snapshots or logs exist."""
+        path = os.path.join(self.root, CURRENT_FILE)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                match = SNAPSHOT_PATTERN.match(f.read().strip())
+        except (OSError, UnicodeDecodeError):
+            match = None
+        if match and not match.group(2) and os.path.isdir(self._snapshot_path(int(match.group(1)))):
+            return int(match.group(1))
+        if not os.path.exists(path) and not any(
+            SNAPSHOT_PATTERN.match(name) or (WAL_PATTERN.match(name) and name != os.path.basename(self._wal_path(0)))
+            for name in os.listdir(self.root)
+        ):
+            # A new store, or one that has only logged changes since it was created
+            return 0
+        return None
+
+    def _newest_generation(self) -> int:
+        """The newest complete snapshot (renamed into place, so fully written), else 0."""
+        generations = [
+            int(match.group(1)) for match in map(SNAPSHOT_PATTERN.match, os.listdir(self.root))
+            if match and not match.group(2) and os.path.isdir(self._snapshot_path(int(match.group(1))))
+        ]
+        return max(generations, default=0)
+
+    def _remove_stale(self, keep: int):
+        """Removes snapshots and logs other than the active generation, e.g. left by an
+        interrupted compaction."""
+        for name in os.listdir(self.root):
+            match = SNAPSHOT_PATTERN.match(name) or WAL_PATTERN.match(name)
+            if not match:
+                continue
+            is_tmp = name.endswith(".tmp")
+            if int(match.group(1)) == keep and not is_tmp:
+                continue
+            path = os.path.join(self.root, name)
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                os.remove(path)
+
+    @property
+    def snapshot_dir(self) -> Optional[str]:
+        path = self._snapshot_path(self.generation)
+        return path if self.generation and os.path.isdir(path) else None
+
+    @property
+    def legacy_dir(self) -> Optional[str]:
+        """FAISS_PATH itself if it still holds a store saved before snapshots existed."""
+        return self.root if os.path.exists(os.path.join(self.root, "index.faiss")) else None
+
+    def should_compact(self) -> bool:
+        return self.wal.size >= self.compact_bytes
+
+    def write_snapshot(self, save: Callable[[str], None]):
+        """Writes a new snapshot with `save(folder)` and makes it current, with an empty log."""
+        generation = self.generation + 1
+        tmp_path = self._snapshot_path(generation) + ".tmp"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        save(tmp_path)
+        if self.fsync:
+            for name in os.listdir(tmp_path):
+                with open(os.path.join(tmp_path, name), "rb") as f:
+                    os.fsync(f.fileno())
+            _fsync_dir(tmp_path)
+        os.rename(tmp_path, self._snapshot_path(generation))
+
+        current_tmp = os.path.join(self.root, CURRENT_FILE + ".tmp")
+        with open(current_tmp, "w", encoding="utf-8") as f:
+            f.write(os.path.basename(self._snapshot_path(generation)))
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+        os.replace(current_tmp, os.path.join(self.root, CURRENT_FILE))
+        if self.fsync:
+            _fsync_dir(self.root)
+
+        # The new snapshot is live; the old one, its log and any legacy files can go
+        self.wal.close()
+        self.generation = generation
+        self.wal = WriteAheadLog(self._wal_path(generation), self.fsync)
+        self._remove_stale(keep=generation)
+        for name in LEGACY_FILES:
+            path = os.path.join(self.root, name)
+            if os.path.exists(path):
+                os.remove(path)
+
+    def close(self):
+        self.wal.close()
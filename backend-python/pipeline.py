@@ -0,0 +1,290 @@
+# pipeline.py
+import time
+import asyncio
+import functools
+from concurrent.futures import Executor
+from typing import Any, AsyncIterator, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from langchain.chains.combine_documents import create_stuff_documents_chain
+from langchain_core.documents import Document
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+from langchain_core.runnables import RunnableConfig
+
+from state import app_store, index_rwlock
+from source_index import search_all_with_distances, search_in_source
+from answer_cache import AnswerCache, history_fingerprint
+from rewrite import CONTEXTUALIZE_Q_SYSTEM_PROMPT, QueryRewriter
+from reranking import CrossEncoderRanker, adaptive_depth, close_matches, dedup, fuse
+from metrics import observe_timings
+from config import settings
+from utils import estimate_tokens
+
+# --- PROMPTS ---
+QA_SYSTEM_PROMPT = (
+    "You are a precise and helpful assistant. Use the following pieces of retrieved context to answer the user's question. "
+    "If the answer is not in the context, strictly state 'I cannot find the answer in the provided documents'. "
+    "Do not make up information. Keep the answer concise and accurate.\n\n"
+    "Context:\n{context}"
+)
+
+QA_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", QA_SYSTEM_PROMPT),
+    MessagesPlaceholder("chat_history"),
+    ("human", "{input}"),
+])
+
+
+class RAGPipeline:
+    """
+    The chat retrieval pipeline, built once and shared by all requests.
+
+    Stages: query rewrite (only when the question refers to history) -> answer cache lookup -> retrieval
+    (hybrid BM25 + vector fused by chunk ID, or scoped) -> cross-encoder rerank -> answer
+    generation. A cache hit skips everything after the lookup. Retrieval and reranking are blocking
+    (FAISS search, CPU-bound scoring) and run on the shared bounded thread pool.
+
+    Per-request options are read from the runnable config, e.g.
+    `config={"configurable": {"filter_source": "report.pdf", "session_id": "abc"}}`.
+    """
+
+    def __init__(self, llm, reranker, vector_store, bm25_retriever, source_index, tombstones=None, executor: Optional[Executor] = None,
+                 answer_cache: Optional[AnswerCache] = None, rewriter: Optional[QueryRewriter] = None,
+                 ranker: Optional[CrossEncoderRanker] = None, search_k: int = 30, top_n: int = 6,
+                 min_candidates: int = 12, max_candidates: int = 40, keyword_score_ratio: float = 0.4,
+                 vector_distance_margin: float = 0.25):
+        self.vector_store = vector_store
+        self.bm25_retriever = bm25_retriever
+        self.source_index = source_index
+        self.tombstones = tombstones
+        self.executor = executor
+        self.answer_cache = answer_cache
+        self.search_k = search_k
+        self.min_candidates = min_candidates
+        self.max_candidates = max_candidates
+        self.keyword_score_ratio = keyword_score_ratio
+        self.vector_distance_margin = vector_distance_margin
+
+        self.rewriter = rewriter or QueryRewriter(llm)
+        self.answer_chain = create_stuff_documents_chain(llm, QA_PROMPT)
+        # Increase top_n to 6 to give the LLM more context
+        self.top_n = top_n
+        if ranker is None and reranker is not None:
+            ranker = CrossEncoderRanker(reranker, top_n=top_n)
+        self.ranker = ranker
+
+        if bm25_retriever is None:
+            print("⚠️ Warning: BM25 Retriever is not available. Falling back to Vector Search only.")
+
+    async def _run_blocking(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+
+    async def rewrite(self, query: str, chat_history: List[Any], session_id: Optional[str] = None) -> Tuple[str, bool]:
+        """Returns a standalone question and whether the LLM had to be called for it."""
+        return await self.rewriter.rewrite(query, chat_history, session_id)
+
+    def _search(self, question: str, filter_source: Optional[str], query_vector: List[float],
+                timings: Dict[str, float]) -> List[Document]:
+        # The query is embedded before this, so the read lock is never held across an Ollama call
+        with index_rwlock.read():
+            started = time.perf_counter()
+            if filter_source:
+                # SCOPED SEARCH: Search only within the specific document's vectors
+                docs = search_in_source(self.vector_store, self.source_index, filter_source, query_vector, self.search_k)
+                timings["faiss_ms"] = _elapsed_ms(started)
+                return docs[:self.max_candidates]
+
+            # GLOBAL SEARCH: Hybrid Search (Vector + Keyword) across all docs, fused by chunk ID
+            vector_hits = search_all_with_distances(self.vector_store, query_vector, self.search_k, self.tombstones)
+            timings["faiss_ms"] = _elapsed_ms(started)
+            if self.bm25_retriever is None:
+                return [doc for doc, _ in vector_hits[:self.max_candidates]]
+
+            started = time.perf_counter()
+            keyword_hits = self.bm25_retriever.search_with_scores(question, self.search_k)
+            timings["bm25_ms"] = _elapsed_ms(started)
+
+            started = time.perf_counter()
+            fused = fuse([[doc for doc, _ in keyword_hits], [doc for doc, _ in vector_hits]], weights=[0.5, 0.5])
+            close = close_matches(keyword_hits, vector_hits, self.keyword_score_ratio, self.vector_distance_margin)
+            docs = adaptive_depth(fused, close, self.min_candidates, self.max_candidates)
+            timings["fusion_ms"] = _elapsed_ms(started)
+            return docs
+
+    async def retrieve(self, question: str, filter_source: Optional[str] = None,
+                       query_vector: Optional[List[float]] = None, timings: Optional[Dict[str, float]] = None) -> List[Document]:
+        """Candidates for reranking. FAISS, BM25 and fusion latencies are added to `timings`."""
+        timings = {} if timings is None else timings
+        if query_vector is None:
+            started = time.perf_counter()
+            query_vector = await self.vector_store.embeddings.aembed_query(question)
+            timings["embed_ms"] = _elapsed_ms(started)
+        return await self._run_blocking(self._search, question, filter_source, query_vector, timings)
+
+    async def rerank(self, question: str, docs: List[Document]) -> List[Document]:
+        if not docs:
+            return []
+        # Pipelines built before the cross-encoder loaded pick it up once it has
+        ranker = self.ranker or app_store.get("ranker")
+        if ranker is None:
+            # Still loading (or failed): fall back to the retrieval order
+            return dedup(docs)[:self.top_n]
+        return await self._run_blocking(ranker.rerank, question, docs)
+
+    async def _prepare_context(self, inputs: Dict[str, Any], config: Optional[RunnableConfig],
+                               timings: Dict[str, float]) -> "_Prepared":
+        """
+        Returns the reranked context, plus either the cached answer on a cache hit, or a
+        callback that caches the answer once it has been generated.
+        """
+        configurable = (config or {}).get("configurable", {})
+        filter_source = configurable.get("filter_source")
+        chat_history = inputs.get("chat_history", [])
+
+        started = time.perf_counter()
+        question, rewritten = await self.rewrite(inputs["input"], chat_history, configurable.get("session_id"))
+        timings["rewrite_ms"] = _elapsed_ms(started)
+
+        query_vector, remember = None, None
+        if self.answer_cache is not None:
+            started = time.perf_counter()
+            # Read before retrieval, so an answer built on a since-changed index is not cached
+            generation = self.answer_cache.generation
+            history = history_fingerprint(chat_history)
+            query_vector = await self.vector_store.embeddings.aembed_query(question)
+            cached = self.answer_cache.lookup(query_vector, filter_source, history)
+            timings["cache_ms"] = _elapsed_ms(started)
+            if cached is not None:
+                return _Prepared(cached.context, cached.answer, None, rewritten)
+            remember = functools.partial(
+                self.answer_cache.put, query_vector, filter_source, generation=generation, history=history
+            )
+
+        started = time.perf_counter()
+        candidates = await self.retrieve(question, filter_source, query_vector, timings)
+        timings["retrieve_ms"] = _elapsed_ms(started)
+
+        started = time.perf_counter()
+        context = await self.rerank(question, candidates)
+        timings["rerank_ms"] = _elapsed_ms(started)
+        # Deduplicated chunks are cited for every document that contains them
+        context = self.source_index.annotate(context)
+        return _Prepared(context, None, remember, rewritten)
+
+    async def ainvoke(self, inputs: Dict[str, Any], config: Optional[RunnableConfig] = None) -> Dict[str, Any]:
+        """
+        Same contract as the create_retrieval_chain chain it replaces: takes `input` and
+        `chat_history`, returns them plus `context` (the reranked documents) and `answer`.
+        Per-stage latencies are returned under `timings`, and `cached` tells whether the
+        answer came from the answer cache.
+        """
+        started, timings = time.perf_counter(), {}
+        context, answer, remember, rewritten = await self._prepare_context(inputs, config, timings)
+        cached = answer is not None
+
+        if not cached:
+            generate_started = time.perf_counter()
+            answer = await self.answer_chain.ainvoke(
+                {"input": inputs["input"], "chat_history": inputs.get("chat_history", []), "context": context},
+                config=config
+            )
+            timings["generate_ms"] = _elapsed_ms(generate_started)
+            if remember is not None:
+                remember(answer, context)
+        timings["total_ms"] = _elapsed_ms(started)
+        observe_timings("chat", timings)
+        return {
+            **inputs, "context": context, "answer": answer, "timings": timings, "cached": cached,
+            "prompt_tokens": _prompt_tokens(inputs, None if cached else context, rewritten),
+        }
+
+    async def astream(self, inputs: Dict[str, Any], config: Optional[RunnableConfig] = None) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        Streaming variant of `ainvoke`. Yields ("context", documents) as soon as reranking
+        finishes, then ("token", text) for each answer chunk, and finally ("done", result)
+        where result holds the full `answer`, the per-stage `timings`, `cached` and
+        `prompt_tokens`. A cached answer is sent as a single token.
+        """
+        started, timings = time.perf_counter(), {}
+        context, answer, remember, rewritten = await self._prepare_context(inputs, config, timings)
+        yield "context", context
+
+        if answer is not None:
+            timings["first_token_ms"] = timings["total_ms"] = _elapsed_ms(started)
+            observe_timings("chat", timings)
+            yield "token", answer
+            yield "done", {"answer": answer, "timings": timings, "cached": True, "prompt_tokens": _prompt_tokens(inputs, None, rewritten)}
+            return
+
+        generate_started = time.perf_counter()
+        answer_parts = []
+        async for token in self.answer_chain.astream(
+            {"input": inputs["input"], "chat_history": inputs.get("chat_history", []), "context": context},
+            config=config
+        ):
+            if not answer_parts:
+                timings["first_token_ms"] = _elapsed_ms(started)
+            answer_parts.append(token)
+            yield "token", token
+
+        timings["generate_ms"] = _elapsed_ms(generate_started)
+        timings["total_ms"] = _elapsed_ms(started)
+        observe_timings("chat", timings)
+        answer = "".join(answer_parts)
+        if remember is not None:
+            remember(answer, context)
+        yield "done", {"answer": answer, "timings": timings, "cached": False, "prompt_tokens": _prompt_tokens(inputs, context, rewritten)}
+
+
+class _Prepared(NamedTuple):
+    context: List[Document]
+    answer: Optional[str]  # Set on an answer cache hit
+    remember: Optional[Callable]  # Caches the generated answer
+    rewritten: bool  # Whether the LLM rewrote the question
+
+
+def _prompt_tokens(inputs: Dict[str, Any], context: Optional[List[Document]], rewritten: bool) -> int:
+    """
+    Estimated prompt tokens sent to the LLM for one question: the rewrite prompt if the
+    LLM rewrote the question, plus the answer prompt unless the answer was cached (None).
+    """
+    history = sum(estimate_tokens(message.content) for message in inputs.get("chat_history", []))
+    question = estimate_tokens(inputs["input"])
+    total = 0
+    if rewritten:
+        total += estimate_tokens(CONTEXTUALIZE_Q_SYSTEM_PROMPT) + history + question
+    if context is not None:
+        total += (estimate_tokens(QA_SYSTEM_PROMPT) + history + question
+                  + sum(estimate_tokens(doc.page_content) for doc in context))
+    return total
+
+
+def _elapsed_ms(started: float) -> float:
+    return round((time.perf_counter() - started) * 1000, 1)
+
+
+def rebuild_pipeline():
+    """
+    Builds a pipeline over the current vector store and BM25 index and swaps it in with a
+    single assignment, so in-flight requests keep using the pipeline they started with.
+    """
+    vector_store = app_store.get("vector_store")
+    if vector_store is None:
+        app_store["rag_pipeline"] = None
+        return
+    app_store["rag_pipeline"] = RAGPipeline(
+        llm=app_store["llm"],
+        reranker=app_store.get("reranker"),
+        vector_store=vector_store,
+        bm25_retriever=app_store.get("bm25_retriever"),
+        source_index=app_store["source_index"],
+        tombstones=app_store.get("tombstones"),
+        executor=app_store.get("executor"),
+        answer_cache=app_store.get("answer_cache"),
+        rewriter=app_store.get("query_rewriter"),
+        ranker=app_store.get("ranker"),
+        min_candidates=settings.RERANK_MIN_CANDIDATES,
+        max_candidates=settings.RERANK_MAX_CANDIDATES,
+        keyword_score_ratio=settings.RERANK_KEYWORD_SCORE_RATIO,
+        vector_distance_margin=settings.RERANK_VECTOR_DISTANCE_MARGIN,
+    )
@@ -0,0 +1,146 @@
+# reranking.py
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Sequence, Set, Tuple
+
+from langchain_community.cross_encoders.base import BaseCrossEncoder
+from langchain_core.documents import Document
+
+# Reciprocal rank fusion constant, the same as EnsembleRetriever's default
+RRF_C = 60
+
+
+def _chunk_key(doc: Document) -> str:
+    # Chunk IDs are unique per stored chunk; fall back to the text for documents without one
+    return doc.id or hashlib.sha1(doc.page_content.encode("utf-8")).hexdigest()
+
+
+def dedup(docs: Sequence[Document]) -> List[Document]:
+    """Drops repeated chunks, keeping the first occurrence of each chunk ID."""
+    seen, unique = set(), []
+    for doc in docs:
+        key = _chunk_key(doc)
+        if key not in seen:
+            seen.add(key)
+            unique.append(doc)
+    return unique
+
+
+def fuse(ranked_lists: Sequence[Sequence[Document]], weights: Sequence[float], c: int = RRF_C) -> List[Tuple[Document, float]]:
+    """
+    Weighted reciprocal rank fusion of several rankings, like EnsembleRetriever, but
+    deduplicated by chunk ID rather than by page content. Returns (doc, score), best first.
+    """
+    scores: Dict[str, float] = {}
+    docs: Dict[str, Document] = {}
+    for ranked, weight in zip(ranked_lists, weights):
+        for rank, doc in enumerate(ranked, start=1):
+            key = _chunk_key(doc)
+            scores[key] = scores.get(key, 0.0) + weight / (c + rank)
+            docs.setdefault(key, doc)
+    return [(docs[key], scores[key]) for key in sorted(scores, key=scores.get, reverse=True)]
+
+
+def close_matches(keyword_hits: Sequence[Tuple[Document, float]], vector_hits: Sequence[Tuple[Document, float]],
+                  keyword_ratio: float, distance_margin: float) -> Set[str]:
+    """
+    Chunk keys of the hits that are close to the best hit of their own retriever: a BM25
+    score of at least `keyword_ratio` times the best, or a vector distance within
+    `distance_margin` (relative) of the nearest. Fusion scores only reflect ranks, so
+    these raw scores are what tells a clear winner from a long tail of similar hits.
+    """
+    keys = set()
+    if keyword_hits:
+        floor = keyword_hits[0][1] * keyword_ratio
+        keys.update(_chunk_key(doc) for doc, score in keyword_hits if score >= floor)
+    if vector_hits:
+        ceiling = vector_hits[0][1] * (1 + distance_margin)
+        keys.update(_chunk_key(doc) for doc, distance in vector_hits if distance <= ceiling)
+    return keys
+
+
+def adaptive_depth(fused: Sequence[Tuple[Document, float]], close: Set[str], min_depth: int,
+                   max_depth: int) -> List[Document]:
+    """
+    The fused candidates worth reranking, in fusion order: those close to the best hit
+    of either retriever (see close_matches), topped up with the best remaining
+    candidates to at least `min_depth`, and at most `max_depth` in total.
+    """
+    spare = max(min_depth - sum(1 for doc, _ in fused if _chunk_key(doc) in close), 0)
+    kept = []
+    for doc, _ in fused:
+        if len(kept) >= max_depth:
+            break
+        if _chunk_key(doc) in close:
+            kept.append(doc)
+        elif spare:
+            kept.append(doc)
+            spare -= 1
+    return kept
+
+
+class CrossEncoderRanker:
+    """
+    Cross-encoder reranking with three savings over scoring every candidate at once:
+    duplicate chunks are scored once, pairs are sorted by length and scored in batches
+    so each batch pads to similar lengths, and (query, chunk ID) scores are cached, so
+    repeated and paged questions only score chunks they have not seen.
+    """
+
+    def __init__(self, model: BaseCrossEncoder, top_n: int = 6, batch_size: int = 16, cache_size: int = 50_000):
+        self.model = model
+        self.top_n = top_n
+        self.batch_size = batch_size
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[Tuple[str, str], float]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.pairs_scored = 0
+        self.pairs_cached = 0
+
+    def score(self, query: str, docs: Sequence[Document]) -> List[float]:
+        query_hash = hashlib.sha1(query.encode("utf-8")).hexdigest()
+        keys = [(query_hash, _chunk_key(doc)) for doc in docs]
+        scores: Dict[Tuple[str, str], float] = {}
+        with self._lock:
+            for key in keys:
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+                    scores[key] = self._cache[key]
+
+        missing = sorted(
+            (position for position, key in enumerate(keys) if key not in scores),
+            key=lambda position: len(docs[position].page_content)
+        )
+        computed = {}
+        for start in range(0, len(missing), self.batch_size):
+            batch = missing[start:start + self.batch_size]
+            batch_scores = self.model.score([(query, docs[position].page_content) for position in batch])
+            for position, value in zip(batch, batch_scores):
+                computed[keys[position]] = float(value)
+
+        with self._lock:
+            self.pairs_scored += len(missing)
+            self.pairs_cached += len(docs) - len(missing)
+            self._cache.update(computed)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        scores.update(computed)
+        return [scores[key] for key in keys]
+
+    def rerank(self, query: str, docs: Sequence[Document]) -> List[Document]:
+        """The `top_n` most relevant distinct chunks, best first."""
+        docs = dedup(docs)
+        if not docs:
+            return []
+        scores = self.score(query, docs)
+        ranked = sorted(zip(docs, scores), key=lambda pair: pair[1], reverse=True)
+        return [doc for doc, _ in ranked[:self.top_n]]
+
+    def stats(self) -> Dict[str, float]:
+        total = self.pairs_scored + self.pairs_cached
+        return {
+            "pairs_scored": self.pairs_scored,
+            "pairs_cached": self.pairs_cached,
+            "cache_hit_rate": round(self.pairs_cached / total, 3) if total else 0.0,
+        }
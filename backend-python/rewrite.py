@@ -0,0 +1,121 @@
+# rewrite.py
+import re
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+
+# Reformulates the user's query into a standalone question if history exists
+CONTEXTUALIZE_Q_SYSTEM_PROMPT = (
+    "Given a chat history and the latest user question "
+    "which might reference context in the chat history, "
+    "formulate a standalone question which can be understood "
+    "without the chat history. Do NOT answer the question, "
+    "just reformulate it if needed and otherwise return it as is."
+)
+
+CONTEXTUALIZE_Q_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", CONTEXTUALIZE_Q_SYSTEM_PROMPT),
+    MessagesPlaceholder("chat_history"),
+    ("human", "{input}"),
+])
+
+# Words that point back at something said earlier
+_REFERRING_WORDS = {
+    "it", "its", "itself", "this", "that", "these", "those", "they", "them", "their", "theirs",
+    "he", "him", "his", "she", "her", "hers", "there", "then", "former", "latter", "same",
+    "above", "previous", "previously", "earlier", "mentioned", "aforementioned", "else", "other", "another",
+    "one", "ones", "such",
+}
+# Openings that continue the previous question rather than stand alone
+_CONTINUATIONS = (
+    "and ", "also ", "but ", "so ", "or ", "then ", "what about", "how about", "why", "why not", "more",
+    "explain", "elaborate", "continue", "go on", "tell me more", "same ", "again", "ok ", "okay ",
+)
+_WORD = re.compile(r"[a-z']+")
+
+
+def refers_to_history(question: str) -> bool:
+    """
+    Cheap check for whether a question depends on earlier turns: it uses a referring word
+    ("it", "those", "the same"), opens as a continuation ("what about ..."), or is too
+    short to stand alone. Self-contained questions skip the LLM rewrite.
+    """
+    text = question.strip().lower()
+    words = _WORD.findall(text)
+    if len(words) <= 3:
+        return True
+    if text.startswith(_CONTINUATIONS):
+        return True
+    return any(word in _REFERRING_WORDS for word in words)
+
+
+class QueryRewriter:
+    """
+    The query-rewrite stage, with fast paths around the LLM call: no rewrite on the first
+    turn, none when the question does not refer to the history, and a cache of rewrites
+    keyed by (session, question, last turn). Counters record how often the LLM call was
+    avoided and the latency that saved, estimated from the average LLM rewrite.
+    """
+
+    def __init__(self, llm, cache_size: int = 10_000):
+        self.chain = CONTEXTUALIZE_Q_PROMPT | llm | StrOutputParser()
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.skipped_no_history = 0
+        self.skipped_standalone = 0
+        self.cache_hits = 0
+        self.llm_calls = 0
+        self.llm_ms_total = 0.0
+
+    @staticmethod
+    def _cache_key(session_id: Optional[str], question: str, chat_history: List[Any]) -> str:
+        last_turn = "\x00".join(str(message.content) for message in chat_history[-2:])
+        raw = f"{session_id}\x00{' '.join(question.lower().split())}\x00{last_turn}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    async def rewrite(self, question: str, chat_history: List[Any], session_id: Optional[str] = None) -> Tuple[str, bool]:
+        """Returns the standalone question and whether the LLM was called to produce it."""
+        if not chat_history:
+            self.skipped_no_history += 1
+            return question, False
+        if not refers_to_history(question):
+            self.skipped_standalone += 1
+            return question, False
+
+        key = self._cache_key(session_id, question, chat_history)
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                self.cache_hits += 1
+                return cached, False
+
+        started = time.perf_counter()
+        rewritten = await self.chain.ainvoke({"input": question, "chat_history": chat_history})
+        with self._lock:
+            self.llm_calls += 1
+            self.llm_ms_total += (time.perf_counter() - started) * 1000
+            self._cache[key] = rewritten
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return rewritten, True
+
+    def stats(self) -> Dict[str, float]:
+        # The first turn never needed a rewrite, so only the other skips count as savings
+        skipped = self.skipped_standalone + self.cache_hits
+        avg_llm_ms = self.llm_ms_total / self.llm_calls if self.llm_calls else 0.0
+        return {
+            "llm_calls": self.llm_calls,
+            "skipped_no_history": self.skipped_no_history,
+            "skipped_standalone": self.skipped_standalone,
+            "cache_hits": self.cache_hits,
+            "skip_rate": skipped / (skipped + self.llm_calls) if skipped + self.llm_calls else 0.0,
+            "avg_llm_ms": round(avg_llm_ms, 1),
+            "estimated_saved_ms": round(avg_llm_ms * skipped, 1),
+        }
@@ -1,130 +1,115 @@
+import json
 import traceback
-from operator import itemgetter
 from fastapi import APIRouter, HTTPException, Depends
-from langchain.retrievers import EnsembleRetriever, ContextualCompressionRetriever
-from langchain.retrievers.document_compressors import CrossEncoderReranker
-from langchain.chains import create_retrieval_chain, create_history_aware_retriever
-from langchain.chains.combine_documents import create_stuff_documents_chain
-from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain_core.runnables import RunnablePassthrough
-from langchain_core.messages import HumanMessage, AIMessage
-from langchain.memory import ConversationBufferMemory
+from fastapi.responses import StreamingResponse
 
 from models import ChatRequest, ChatResponse
 from state import app_store
-from dependencies import get_llm, get_reranker, get_retrievers
-from utils import format_docs
+from dependencies import get_rag_pipeline, get_sessions
+from sessions import SessionManager
+from ollama_gateway import OllamaOverloadedError
+from metrics import CHAT_REQUESTS
+from utils import format_sources
 
 router = APIRouter()
 
-@router.post("/api/chat", response_model=ChatResponse)
-async def chat_with_knowledge_base(request: ChatRequest, llm=Depends(get_llm), reranker=Depends(get_reranker), retrievers=Depends(get_retrievers)):
-    # --- 1. SET UP CONVERSATIONAL MEMORY ---
-    if request.session_id not in app_store["chat_sessions"]:
-        app_store["chat_sessions"][request.session_id] = ConversationBufferMemory(
-            memory_key="chat_history", return_messages=True, output_key='answer'
-        )
-    memory = app_store["chat_sessions"][request.session_id]
-
-    # --- 2. CREATE THE RETRIEVAL PIPELINE (CONDITIONAL) ---
-    if request.filter_source:
-        # SCOPED SEARCH: Search only within the specific document using Metadata Filtering
-        print(f"🔍 Performing Scoped Search in: {request.filter_source}")
-        
-        source_filter = lambda metadata: metadata.get("source") == request.filter_source
-        
-        # Increase initial retrieval to 30 to improve recall
-        base_retriever = app_store["vector_store"].as_retriever(
-            search_kwargs={"k": 30, "filter": source_filter}
-        )
-    else:
-        # GLOBAL SEARCH: Hybrid Search (Vector + Keyword) across all docs
-        print("🔍 Performing Global Search")
-        
-        if retrievers["keyword"]:
-            base_retriever = EnsembleRetriever(
-                retrievers=[retrievers["keyword"], retrievers["vector"]],
-                weights=[0.5, 0.5]
-            )
-        else:
-            print("⚠️ Warning: BM25 Retriever is not available. Falling back to Vector Search only.")
-            base_retriever = retrievers["vector"]
-
-    # Reranking and Context Compression
-    # Increase top_n to 6 to give the LLM more context
-    compressor = CrossEncoderReranker(model=reranker, top_n=6)
-    compression_retriever = ContextualCompressionRetriever(
-        base_compressor=compressor, base_retriever=base_retriever
-    )
-
-    # --- 3. CREATE HISTORY-AWARE RETRIEVER ---
-    # This chain reformulates the user's query into a standalone question if history exists
-    contextualize_q_system_prompt = (
-        "Given a chat history and the latest user question "
-        "which might reference context in the chat history, "
-        "formulate a standalone question which can be understood "
-        "without the chat history. Do NOT answer the question, "
-        "just reformulate it if needed and otherwise return it as is."
-    )
-    
-    contextualize_q_prompt = ChatPromptTemplate.from_messages([
-        ("system", contextualize_q_system_prompt),
-        MessagesPlaceholder("chat_history"),
-        ("human", "{input}"),
-    ])
-    
-    # This retriever will use the "standalone question" to search
-    history_aware_retriever = create_history_aware_retriever(
-        llm, compression_retriever, contextualize_q_prompt
-    )
-
-    # --- 4. DEFINE THE ANSWER GENERATION CHAIN ---
-    qa_system_prompt = (
-        "You are a precise and helpful assistant. Use the following pieces of retrieved context to answer the user's question. "
-        "If the answer is not in the context, strictly state 'I cannot find the answer in the provided documents'. "
-        "Do not make up information. Keep the answer concise and accurate.\n\n"
-        "Context:\n{context}"
-    )
-    
-    qa_prompt = ChatPromptTemplate.from_messages([
-        ("system", qa_system_prompt),
-        MessagesPlaceholder("chat_history"),
-        ("human", "{input}"),
-    ])
-
-    question_answer_chain = create_stuff_documents_chain(llm, qa_prompt)
-    
-    # The final RAG chain
-    rag_chain = create_retrieval_chain(history_aware_retriever, question_answer_chain)
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
 
+@router.post("/api/chat", response_model=ChatResponse)
+async def chat_with_knowledge_base(request: ChatRequest, rag_pipeline=Depends(get_rag_pipeline),
+                                   sessions: SessionManager = Depends(get_sessions)):
     try:
-        # Load conversation history for the prompt
-        chat_history_obj = memory.load_memory_variables({})["chat_history"]
+        # --- 1. LOAD CONVERSATION HISTORY (windowed to the token budget) ---
+        chat_history_obj = await sessions.ahistory(request.session_id)
         
-        # --- 5. INVOKE THE CHAIN AND MANAGE MEMORY ---
-        print(f"❓ Asking: {request.query}")
-        
-        # Invoke the chain
-        response_dict = await rag_chain.ainvoke({
-            "input": request.query,
-            "chat_history": chat_history_obj
-        })
+        # --- 2. INVOKE THE PREBUILT PIPELINE AND MANAGE MEMORY ---
+        # Invoke the pipeline, passing per-request options as runtime config
+        # (per-stage timings go to the /metrics histograms)
+        response_dict = await rag_pipeline.ainvoke(
+            {"input": request.query, "chat_history": chat_history_obj},
+            config={"configurable": {"filter_source": request.filter_source, "session_id": request.session_id}}
+        )
         
         response = response_dict["answer"]
-        
-        print(f"💬 LLM Response: {response}")
 
-        # Save the current interaction to memory
-        memory.save_context({"input": request.query}, {"answer": response})
+        # Save the current interaction to the session
+        await sessions.asave_turn(request.session_id, request.query, response, response_dict["prompt_tokens"])
 
         # Extract sources from the retrieved context (from response_dict["context"])
-        retrieved_docs = response_dict.get("context", [])
-        sources = sorted(list(set(f"{doc.metadata.get('source', 'N/A')}" + (f" (Page {doc.metadata['page']})" if 'page' in doc.metadata else "") for doc in retrieved_docs)))
-        
-        print(f"📚 Sources Found: {sources}")
+        sources = format_sources(response_dict.get("context", []))
+        CHAT_REQUESTS.labels("cached" if response_dict["cached"] else "answered").inc()
 
         return ChatResponse(answer=response, sources=sources)
+    except OllamaOverloadedError as e:
+        CHAT_REQUESTS.labels("overloaded").inc()
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
     except Exception as e:
+        CHAT_REQUESTS.labels("failed").inc()
         print(f"❌ Chat Error: {str(e)}")
         print(traceback.format_exc())
         raise HTTPException(status_code=500, detail=f"Error during chat retrieval: {e}")
+
+
+@router.post("/api/chat/stream")
+async def stream_chat_with_knowledge_base(request: ChatRequest, rag_pipeline=Depends(get_rag_pipeline),
+                                          sessions: SessionManager = Depends(get_sessions)):
+    """
+    Server-Sent Events variant of /api/chat. Emits a `sources` event once reranking is
+    done, a `token` event per answer chunk, then `done` with the full answer and the
+    per-stage timings (rewrite, retrieve, rerank, first token, total). Failures after
+    the stream has started are reported as an `error` event.
+    """
+    chat_history_obj = await sessions.ahistory(request.session_id)
+
+    async def event_stream():
+        try:
+            async for kind, payload in rag_pipeline.astream(
+                {"input": request.query, "chat_history": chat_history_obj},
+                config={"configurable": {"filter_source": request.filter_source, "session_id": request.session_id}}
+            ):
+                if kind == "context":
+                    yield sse_event("sources", {"sources": format_sources(payload)})
+                elif kind == "token":
+                    yield sse_event("token", {"text": payload})
+                elif kind == "done":
+                    # Only a completed answer is saved, a disconnected client leaves no partial turn
+                    await sessions.asave_turn(request.session_id, request.query, payload["answer"], payload["prompt_tokens"])
+                    CHAT_REQUESTS.labels("cached" if payload["cached"] else "answered").inc()
+                    yield sse_event("done", payload)
+        except OllamaOverloadedError as e:
+            CHAT_REQUESTS.labels("overloaded").inc()
+            yield sse_event("error", {"detail": str(e), "status": 503})
+        except Exception as e:
+            CHAT_REQUESTS.labels("failed").inc()
+            print(f"❌ Chat Stream Error: {str(e)}")
+            print(traceback.format_exc())
+            yield sse_event("error", {"detail": f"Error during chat retrieval: {e}"})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@router.get("/api/chat/stats")
+async def chat_stats():
+    """
+    Counters of the chat fast paths (skipped query rewrites, rerank and answer cache hits)
+    and of the Ollama gateway (in-flight and queued requests, rejections, query batching).
+    """
+    answer_cache = app_store.get("answer_cache")
+    return {
+        "ollama": {
+            "generation": app_store["llm_limiter"].stats(),
+            "embedding": app_store["embedding_limiter"].stats(),
+            "query_batching": app_store["query_batcher"].stats() if "query_batcher" in app_store else None,
+        },
+        "rewrite": app_store["query_rewriter"].stats() if "query_rewriter" in app_store else None,
+        "rerank": app_store["ranker"].stats() if "ranker" in app_store else None,
+        "answer_cache": {
+            "entries": len(answer_cache), "hits": answer_cache.hits,
+            "misses": answer_cache.misses, "hit_rate": round(answer_cache.hit_rate, 3),
+        } if answer_cache is not None else None,
+    }
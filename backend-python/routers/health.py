@@ -0,0 +1,33 @@
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+
+from state import app_store
+
+router = APIRouter()
+
+@router.get("/health/live")
+async def liveness():
+    """The process is up and serving requests (components may still be loading)."""
+    return {"status": "alive"}
+
+@router.get("/health/ready")
+async def readiness():
+    """
+    200 once the essential components have loaded (chat works), 503 before that or if one
+    failed; lists each component's load state. Until the others load, e.g. the reranker,
+    the app serves with reduced quality and reports "degraded".
+    """
+    components = app_store.get("components")
+    if components is None:
+        return JSONResponse(status_code=503, content={"status": "starting", "components": {}})
+    statuses = components.status()
+    if components.is_ready():
+        status = "ready" if all(component["state"] == "ready" for component in statuses.values()) else "degraded"
+    elif any(component["state"] == "failed" for component in statuses.values() if component["essential"]):
+        status = "failed"
+    else:
+        status = "loading"
+    return JSONResponse(
+        status_code=200 if status in ("ready", "degraded") else 503,
+        content={"status": status, "components": statuses},
+    )
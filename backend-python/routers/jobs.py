@@ -0,0 +1,34 @@
+import os
+from fastapi import APIRouter, File, UploadFile, HTTPException, Depends
+
+from config import settings
+from models import IngestJob, JobAccepted
+from dependencies import get_ingest_queue
+from extraction import spool_upload, SUPPORTED_EXTENSIONS
+
+router = APIRouter()
+
+@router.post("/api/jobs", response_model=JobAccepted, status_code=202)
+async def submit_ingest_job(file: UploadFile = File(...), ingest_queue=Depends(get_ingest_queue)):
+    """
+    Queues a document for background ingestion and returns immediately. The analysis
+    (the same DocumentAnalysis returned by /api/upload-and-process) becomes the job's
+    result, and the n8n webhooks fire once the document is indexed.
+    """
+    file_extension = os.path.splitext(file.filename)[1].lower()
+    if file_extension not in SUPPORTED_EXTENSIONS:
+        raise HTTPException(status_code=400, detail=f"Unsupported file type: {file_extension}")
+
+    file_path = os.path.join(settings.UPLOAD_DIRECTORY, file.filename)
+    await spool_upload(file, file_path)
+
+    job = ingest_queue.submit(file.filename, file_path)
+    return JobAccepted(job_id=job.job_id, status_url=f"/api/jobs/{job.job_id}")
+
+@router.get("/api/jobs/{job_id}", response_model=IngestJob)
+async def get_ingest_job(job_id: str, ingest_queue=Depends(get_ingest_queue)):
+    """Reports a job's overall status and the progress and duration of each stage."""
+    job = ingest_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job '{job_id}' not found.")
+    return job
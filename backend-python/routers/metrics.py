@@ -0,0 +1,12 @@
+from fastapi import APIRouter, Response
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+
+router = APIRouter()
+
+@router.get("/metrics")
+async def prometheus_metrics():
+    """
+    Prometheus metrics: per-stage latency histograms for ingest and chat, chat outcomes,
+    and gauges for corpus size, sessions, cache hit rates and Ollama load.
+    """
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
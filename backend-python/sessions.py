@@ -0,0 +1,171 @@
+# sessions.py
+import json
+import time
+import asyncio
+import sqlite3
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+
+from utils import estimate_tokens
+
+
+@dataclass
+class ChatSession:
+    session_id: str
+    messages: List[BaseMessage] = field(default_factory=list)
+    last_active: float = field(default_factory=time.time)
+    turns: int = 0
+    prompt_tokens: int = 0  # Estimated tokens sent to the LLM over the whole session
+
+
+def _truncated(message: BaseMessage, token_budget: int) -> BaseMessage:
+    if estimate_tokens(message.content) <= token_budget:
+        return message
+    # estimate_tokens counts ~4 characters per token
+    return message.__class__(content=message.content[:max(token_budget, 0) * 4])
+
+
+def window_history(messages: List[BaseMessage], token_budget: int) -> List[BaseMessage]:
+    """
+    The most recent whole turns (question + answer) whose text fits in `token_budget`.
+    A latest turn that alone exceeds the budget is kept truncated, the question to at
+    most half of it and the answer to the rest, so a follow-up still has its context.
+    """
+    kept, used = [], 0
+    for start in range(len(messages) - 2, -1, -2):
+        turn = messages[start:start + 2]
+        cost = sum(estimate_tokens(message.content) for message in turn)
+        if used + cost > token_budget:
+            break
+        kept[:0] = turn
+        used += cost
+    if not kept and len(messages) >= 2:
+        question = _truncated(messages[-2], token_budget // 2)
+        answer = _truncated(messages[-1], token_budget - estimate_tokens(question.content))
+        kept = [question, answer]
+    return kept
+
+
+def _dump_messages(messages: List[BaseMessage]) -> str:
+    return json.dumps([{"role": message.type, "content": message.content} for message in messages])
+
+
+def _load_messages(data: str) -> List[BaseMessage]:
+    return [
+        HumanMessage(content=item["content"]) if item["role"] == "human" else AIMessage(content=item["content"])
+        for item in json.loads(data)
+    ]
+
+
+class SessionManager:
+    """
+    Chat sessions with bounded memory. Sessions idle for longer than `idle_ttl_seconds`
+    expire, and at most `max_sessions` are held in memory, least recently used first out.
+    With a `db_path`, sessions are also kept in SQLite: they survive restarts, and one
+    evicted from memory is reloaded when its user returns.
+
+    Only as much history as fits in `history_token_budget` is kept and sent to the LLM,
+    so prompts stop growing in long conversations.
+
+    history/save_turn may touch the database; async handlers use ahistory/asave_turn,
+    which run them on the default thread pool instead of the event loop.
+    """
+
+    # How often expired sessions are purged from the database
+    _PURGE_INTERVAL_SECONDS = 60
+
+    def __init__(self, max_sessions: int = 10_000, idle_ttl_seconds: float = 86_400,
+                 history_token_budget: int = 2000, db_path: Optional[str] = None):
+        self.max_sessions = max_sessions
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self.history_token_budget = history_token_budget
+        self._sessions: "OrderedDict[str, ChatSession]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._last_purge = 0.0
+        self._conn = None
+        if db_path:
+            self._conn = sqlite3.connect(db_path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions (session_id TEXT PRIMARY KEY, messages TEXT NOT NULL, "
+                "turns INTEGER NOT NULL, prompt_tokens INTEGER NOT NULL, last_active REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_last_active ON sessions (last_active)")
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def _expire(self, now: float):
+        # The dict is ordered by last activity, so expired sessions are at the front
+        while self._sessions:
+            oldest = next(iter(self._sessions.values()))
+            if now - oldest.last_active <= self.idle_ttl_seconds:
+                break
+            self._sessions.popitem(last=False)
+        if self._conn is not None and now - self._last_purge > self._PURGE_INTERVAL_SECONDS:
+            self._conn.execute("DELETE FROM sessions WHERE last_active < ?", (now - self.idle_ttl_seconds,))
+            self._conn.commit()
+            self._last_purge = now
+
+    def _load(self, session_id: str, now: float) -> Optional[ChatSession]:
+        if self._conn is None:
+            return None
+        row = self._conn.execute(
+            "SELECT messages, turns, prompt_tokens, last_active FROM sessions WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        if row is None or now - row[3] > self.idle_ttl_seconds:
+            return None
+        return ChatSession(session_id, _load_messages(row[0]), row[3], row[1], row[2])
+
+    def _get(self, session_id: str) -> ChatSession:
+        now = time.time()
+        self._expire(now)
+        session = self._sessions.get(session_id) or self._load(session_id, now) or ChatSession(session_id)
+        session.last_active = now
+        self._sessions[session_id] = session
+        self._sessions.move_to_end(session_id)
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+        return session
+
+    def history(self, session_id: str) -> List[BaseMessage]:
+        """The session's recent history, within the token budget, for the prompts."""
+        with self._lock:
+            return window_history(self._get(session_id).messages, self.history_token_budget)
+
+    def save_turn(self, session_id: str, question: str, answer: str, prompt_tokens: int = 0) -> ChatSession:
+        with self._lock:
+            session = self._get(session_id)
+            session.messages = window_history(
+                session.messages + [HumanMessage(content=question), AIMessage(content=answer)],
+                self.history_token_budget
+            )
+            session.turns += 1
+            session.prompt_tokens += prompt_tokens
+            if self._conn is not None:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO sessions (session_id, messages, turns, prompt_tokens, last_active) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (session_id, _dump_messages(session.messages), session.turns, session.prompt_tokens, session.last_active)
+                )
+                self._conn.commit()
+            return session
+
+    async def ahistory(self, session_id: str) -> List[BaseMessage]:
+        return await asyncio.get_running_loop().run_in_executor(None, self.history, session_id)
+
+    async def asave_turn(self, session_id: str, question: str, answer: str, prompt_tokens: int = 0) -> ChatSession:
+        return await asyncio.get_running_loop().run_in_executor(
+            None, self.save_turn, session_id, question, answer, prompt_tokens
+        )
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
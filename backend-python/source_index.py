@@ -0,0 +1,205 @@
+# source_index.py
+import os
+import json
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import faiss
+import numpy as np
+from langchain_core.documents import Document
+
+SOURCE_INDEX_FILE = "source_index.json"
+
+
+class SourceIndex:
+    """
+    Maps each document (its `source` metadata) to its chunk IDs, and each chunk ID to its
+    stable FAISS ID. Listing, deleting and scoped search use this instead of scanning
+    the whole docstore, so their cost follows the size of one document.
+
+    A deduplicated chunk is stored once but belongs to every document that contains it,
+    so a chunk can appear under several sources. It is only removed from the stores once
+    no document has it.
+    """
+
+    def __init__(self, sources: Optional[Dict[str, List[str]]] = None):
+        self.sources: Dict[str, List[str]] = sources or {}
+        self.faiss_ids: Dict[str, int] = {}  # chunk_id -> FAISS ID, derived from the vector store
+        self.next_faiss_id = 0
+        self.owners: Dict[str, Tuple[str, ...]] = {}  # chunk_id -> the sources that have it
+        for source, chunk_ids in self.sources.items():
+            for chunk_id in chunk_ids:
+                self.owners[chunk_id] = self.owners.get(chunk_id, ()) + (source,)
+        self._sorted_sources: Tuple[str, ...] = tuple(sorted(self.sources))
+
+    def __len__(self) -> int:
+        return len(self.sources)
+
+    def __contains__(self, source: str) -> bool:
+        return source in self.sources
+
+    def list_sources(self) -> List[str]:
+        # A snapshot swapped in after each mutation, safe to read while the index is updated
+        return list(self._sorted_sources)
+
+    def chunk_ids(self, source: str) -> List[str]:
+        return list(self.sources.get(source, ()))
+
+    def faiss_ids_for(self, source: str) -> List[int]:
+        return [self.faiss_ids[chunk_id] for chunk_id in self.sources.get(source, ()) if chunk_id in self.faiss_ids]
+
+    def sources_of(self, chunk_id: str) -> Tuple[str, ...]:
+        return self.owners.get(chunk_id, ())
+
+    def add(self, source: str, chunk_ids: Iterable[str], faiss_ids: Iterable[int]):
+        chunk_ids = list(chunk_ids)
+        for chunk_id, faiss_id in zip(chunk_ids, faiss_ids):
+            self.faiss_ids[chunk_id] = faiss_id
+            self.next_faiss_id = max(self.next_faiss_id, faiss_id + 1)
+        self.link(source, chunk_ids)
+
+    def link(self, source: str, chunk_ids: Iterable[str]):
+        """Adds stored chunks to a document. Unknown chunks and ones it already has are skipped."""
+        linked = self.sources.setdefault(source, [])
+        for chunk_id in chunk_ids:
+            owners = self.owners.get(chunk_id, ())
+            if source not in owners and chunk_id in self.faiss_ids:
+                self.owners[chunk_id] = owners + (source,)
+                linked.append(chunk_id)
+        if not linked:
+            del self.sources[source]
+        self._sorted_sources = tuple(sorted(self.sources))
+
+    def unlink(self, source: str, chunk_ids: Iterable[str]) -> Dict[str, int]:
+        """
+        Removes chunks from a document, and the document once it has none left. Returns
+        the chunks no document has any more, with their FAISS IDs, which are forgotten.
+        """
+        unlinked: Set[str] = set(chunk_ids).intersection(self.sources.get(source, ()))
+        if not unlinked:
+            return {}
+        remaining = [chunk_id for chunk_id in self.sources[source] if chunk_id not in unlinked]
+        if remaining:
+            self.sources[source] = remaining
+        else:
+            del self.sources[source]
+        orphans = {}
+        for chunk_id in unlinked:
+            owners = tuple(owner for owner in self.owners[chunk_id] if owner != source)
+            if owners:
+                self.owners[chunk_id] = owners
+            else:
+                del self.owners[chunk_id]
+                orphans[chunk_id] = self.faiss_ids.pop(chunk_id)
+        self._sorted_sources = tuple(sorted(self.sources))
+        return orphans
+
+    def annotate(self, docs: List[Document]) -> List[Document]:
+        """
+        Copies of retrieved chunks with every document that has them in their `sources`
+        metadata. A chunk's own metadata is from the upload that stored it; if that
+        document was deleted since, another owner becomes its `source`.
+        """
+        annotated = []
+        for doc in docs:
+            metadata = dict(doc.metadata)
+            owners = self.sources_of(doc.id) if doc.id else ()
+            if owners:
+                if metadata.get("source") not in owners:
+                    metadata["source"] = owners[0]
+                    metadata.pop("page", None)
+                metadata["sources"] = list(owners)
+            annotated.append(Document(id=doc.id, page_content=doc.page_content, metadata=metadata))
+        return annotated
+
+    def attach(self, index_to_docstore_id: Dict[int, str]):
+        """Rebuilds the chunk_id -> FAISS ID map from the vector store's own mapping."""
+        self.faiss_ids = {chunk_id: int(faiss_id) for faiss_id, chunk_id in index_to_docstore_id.items()}
+        self.next_faiss_id = max(self.faiss_ids.values(), default=-1) + 1
+
+    def chunk_count(self) -> int:
+        return len(self.faiss_ids)
+
+    def link_count(self) -> int:
+        """Chunk references across all documents; above chunk_count() when chunks are shared."""
+        return sum(len(chunk_ids) for chunk_ids in self.sources.values())
+
+    # --- Persistence ---
+    def save(self, folder_path: str):
+        os.makedirs(folder_path, exist_ok=True)
+        path = os.path.join(folder_path, SOURCE_INDEX_FILE)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"sources": self.sources}, f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, folder_path: str) -> Optional["SourceIndex"]:
+        path = os.path.join(folder_path, SOURCE_INDEX_FILE)
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(json.load(f)["sources"])
+
+    @classmethod
+    def from_documents(cls, items: Iterable[Tuple[str, Document]]) -> "SourceIndex":
+        sources: Dict[str, List[str]] = {}
+        for chunk_id, doc in items:
+            sources.setdefault(doc.metadata.get("source", "N/A"), []).append(chunk_id)
+        return cls(sources)
+
+
+def search_all_with_distances(vector_store, query_vector: List[float], k: int,
+                               tombstones=None) -> List[Tuple[Document, float]]:
+    """
+    Nearest-neighbour search over the whole index, as (doc, distance), nearest first.
+    Distances are squared L2, or 1 - inner product for inner product indexes, so lower
+    is closer either way. Unlike langchain's similarity search it skips deleted HNSW
+    vectors (`tombstones`), and chunks missing from the docstore.
+    """
+    query = np.array([query_vector], dtype=np.float32)
+    if vector_store._normalize_L2:
+        faiss.normalize_L2(query)
+    params = tombstones.search_params(vector_store.index) if tombstones is not None else None
+    scores, faiss_ids = vector_store.index.search(query, k, params=params)
+    if vector_store.index.metric_type == faiss.METRIC_INNER_PRODUCT:
+        scores = 1.0 - scores
+    hits = [(vector_store.index_to_docstore_id[faiss_id], float(score))
+            for faiss_id, score in zip(faiss_ids[0], scores[0]) if faiss_id in vector_store.index_to_docstore_id]
+    found = vector_store.docstore.mget([chunk_id for chunk_id, _ in hits])
+    return [(found[chunk_id], distance) for chunk_id, distance in hits if chunk_id in found]
+
+
+def search_all(vector_store, query_vector: List[float], k: int, tombstones=None) -> List[Document]:
+    """Nearest-neighbour search over the whole index, see search_all_with_distances."""
+    return [doc for doc, _ in search_all_with_distances(vector_store, query_vector, k, tombstones)]
+
+
+def search_in_source(vector_store, source_index: SourceIndex, source: str, query_vector: List[float], k: int) -> List[Document]:
+    """
+    Nearest-neighbour search over one document's vectors only. The vectors are fetched
+    by FAISS ID and scored directly, so the cost follows the document's size rather than
+    the corpus, and every chunk of the document is considered however small its share of
+    the corpus. The scores are exact for Flat, HNSW and IVFFlat indexes; IVFPQ stores only
+    compressed codes, so its reconstructed vectors and therefore the ranking are
+    approximate, much like a search of the IVFPQ index itself.
+    """
+    faiss_ids = source_index.faiss_ids_for(source)
+    if not faiss_ids:
+        return []
+    query = np.array([query_vector], dtype=np.float32)
+    if vector_store._normalize_L2:
+        faiss.normalize_L2(query)
+
+    vectors = vector_store.index.reconstruct_batch(np.array(faiss_ids, dtype=np.int64))
+    if vector_store.index.metric_type == faiss.METRIC_INNER_PRODUCT:
+        distances = -(vectors @ query[0])
+    else:
+        distances = ((vectors - query[0]) ** 2).sum(axis=1)
+
+    top = np.argsort(distances)[:k]
+    docs = []
+    for position in top:
+        doc = vector_store.docstore.search(vector_store.index_to_docstore_id[faiss_ids[position]])
+        if isinstance(doc, Document):
+            docs.append(doc)
+    return docs
@@ -1,2 +1,7 @@
 # Global application state
+from utils import ReadWriteLock
+
 app_store = {}
+
+# Guards the FAISS index, docstore and BM25 index against concurrent search and mutation
+index_rwlock = ReadWriteLock()
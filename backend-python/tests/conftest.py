@@ -0,0 +1,90 @@
+# tests/conftest.py
+import os
+import sys
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import settings  # noqa: E402
+from state import app_store  # noqa: E402
+import indexing  # noqa: E402
+
+
+def paragraph(seed: int, words: int = 30) -> str:
+    """Distinct text long enough to take part in near-duplicate detection."""
+    return " ".join(f"term{seed}x{i}" for i in range(words))
+
+
+class KnowledgeBase:
+    """Drives indexing.py the way the routes do, over a temporary FAISS_PATH, without models."""
+
+    def __init__(self, embeddings):
+        self.embeddings = embeddings
+        self.root = settings.FAISS_PATH
+
+    def _run(self, coroutine_function, *args):
+        async def main():
+            # asyncio locks belong to the loop they are first used on
+            app_store["index_lock"] = asyncio.Lock()
+            return await coroutine_function(*args)
+        return asyncio.run(main())
+
+    def add(self, source: str, texts: List[str]) -> Dict[str, int]:
+        docs = [Document(page_content=text, metadata={"source": source}) for text in texts]
+
+        async def add():
+            vectors, signatures = await indexing.embed_new_chunks(self.embeddings, docs)
+            return await indexing.add_chunks(docs, vectors, signatures)
+        return self._run(add)
+
+    def delete(self, source: str) -> int:
+        return self._run(indexing.delete_source, source)
+
+    def texts(self) -> Dict[str, List[str]]:
+        """Each document's chunk texts, read through the source index and chunk store."""
+        source_index = app_store["source_index"]
+        chunk_store = app_store["chunk_store"]
+        return {
+            source: sorted(chunk_store.mget(source_index.chunk_ids(source))[chunk_id].page_content
+                           for chunk_id in source_index.chunk_ids(source))
+            for source in source_index.list_sources()
+        }
+
+    def chunk_count(self) -> int:
+        vector_store = app_store["vector_store"]
+        return 0 if vector_store is None else len(vector_store.index_to_docstore_id)
+
+    def crash(self):
+        """Drops the open files without a checkpoint, as a killed process would."""
+        app_store["persistence"].close()
+        app_store["chunk_store"].close()
+        if app_store.get("signatures") is not None:
+            app_store["signatures"].close()
+
+    def restart(self, clean: bool = False):
+        if clean:
+            indexing.checkpoint()
+        else:
+            self.crash()
+        indexing.load_knowledge_base()
+
+
+@pytest.fixture
+def kb(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(indexing, "rebuild_pipeline", lambda: None)
+    executor = ThreadPoolExecutor(max_workers=2)
+    app_store.clear()
+    app_store.update(embeddings=DeterministicFakeEmbedding(size=16), executor=executor)
+    indexing.load_knowledge_base()
+    knowledge_base = KnowledgeBase(app_store["embeddings"])
+    yield knowledge_base
+    knowledge_base.crash()
+    app_store.clear()
+    executor.shutdown(wait=False)
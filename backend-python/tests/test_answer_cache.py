@@ -0,0 +1,43 @@
+import time
+
+from langchain_core.documents import Document
+from langchain_core.messages import AIMessage, HumanMessage
+
+from answer_cache import AnswerCache, history_fingerprint
+
+
+def test_expired_best_match_falls_through_to_a_fresh_one():
+    cache = AnswerCache(ttl_seconds=60, threshold=0.9)
+    cache.put([1.0, 0.0], None, "stale", [], generation=0)
+    cache.put([0.99, 0.1], None, "fresh", [], generation=0)
+    stale = next(entry for entry in cache._entries.values() if entry.answer == "stale")
+    stale.created_at = time.monotonic() - 120
+
+    hit = cache.lookup([1.0, 0.0], None)
+
+    assert hit is not None and hit.answer == "fresh"
+    assert len(cache) == 1
+
+
+def test_answers_are_not_shared_across_chat_histories():
+    cache = AnswerCache(threshold=0.9)
+    history = history_fingerprint([HumanMessage("What does plan A cost?"), AIMessage("10 EUR.")])
+    cache.put([1.0, 0.0], None, "with history", [], generation=0, history=history)
+
+    assert cache.lookup([1.0, 0.0], None) is None
+    other = history_fingerprint([HumanMessage("What does plan B cost?"), AIMessage("20 EUR.")])
+    assert cache.lookup([1.0, 0.0], None, other) is None
+    assert cache.lookup([1.0, 0.0], None, history).answer == "with history"
+
+
+def test_empty_history_has_no_fingerprint():
+    assert history_fingerprint([]) is None
+
+
+def test_every_owner_of_a_cited_chunk_invalidates_the_answer():
+    cache = AnswerCache(threshold=0.9)
+    shared = Document(page_content="shared", metadata={"source": "a.txt", "sources": ["a.txt", "b.txt"]})
+    cache.put([1.0, 0.0], None, "answer", [shared], generation=0)
+
+    assert cache.invalidate(["b.txt"]) == 1
+    assert cache.lookup([1.0, 0.0], None) is None
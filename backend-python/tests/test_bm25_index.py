@@ -0,0 +1,54 @@
+import pytest
+from rank_bm25 import BM25Okapi
+
+from bm25_index import IncrementalBM25, default_preprocess
+
+CORPUS = {
+    "a": "the cat sat on the mat",
+    "b": "the dog sat on the log",
+    "c": "the cat chased the dog",
+    "d": "a bird sang in the tree",
+    "e": "the mat was red and the log was brown",
+}
+QUERIES = ["the cat", "dog log", "the the mat", "bird", "sat on the red mat", "unknown words"]
+
+
+def assert_matches_okapi(index: IncrementalBM25, corpus: dict):
+    ids = list(corpus)
+    okapi = BM25Okapi([default_preprocess(corpus[chunk_id]) for chunk_id in ids])
+    for query in QUERIES:
+        tokens = default_preprocess(query)
+        expected = dict(zip(ids, okapi.get_scores(tokens)))
+        scores = dict(index.top_n(tokens, len(ids)))
+        # Chunks sharing no term with the query score 0 in BM25Okapi and are left out here
+        for chunk_id, score in expected.items():
+            assert scores.get(chunk_id, 0.0) == pytest.approx(score), (query, chunk_id)
+        # Ranked as BM25Okapi would (ties may come in either order)
+        ranked = [expected[chunk_id] for chunk_id, _ in index.top_n(tokens, len(ids))]
+        assert ranked == sorted(ranked, reverse=True)
+
+
+def build(corpus: dict) -> IncrementalBM25:
+    index = IncrementalBM25()
+    for chunk_id, text in corpus.items():
+        index.add(chunk_id, default_preprocess(text))
+    return index
+
+
+def test_scores_match_bm25_okapi():
+    assert_matches_okapi(build(CORPUS), CORPUS)
+
+
+def test_scores_match_bm25_okapi_after_adds_and_removes():
+    index = build({chunk_id: CORPUS[chunk_id] for chunk_id in "abc"})
+    index.top_n(["the"], 1)  # Caches IDF statistics that the changes below must refresh
+    index.add("d", default_preprocess(CORPUS["d"]))
+    index.add("e", default_preprocess(CORPUS["e"]))
+    assert_matches_okapi(index, CORPUS)
+
+    tokens = {chunk_id: default_preprocess(text) for chunk_id, text in CORPUS.items()}
+    index.remove(["a"], tokens)
+    index.remove(["c"])
+    remaining = {chunk_id: CORPUS[chunk_id] for chunk_id in "bde"}
+    assert_matches_okapi(index, remaining)
+    assert len(index) == 3 and "a" not in index
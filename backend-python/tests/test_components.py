@@ -0,0 +1,58 @@
+import asyncio
+import json
+import threading
+
+from components import ComponentRegistry
+from routers.health import readiness
+from state import app_store
+
+
+def test_ready_without_waiting_for_optional_components():
+    release = threading.Event()
+
+    async def scenario():
+        components = ComponentRegistry()
+        components.register("knowledge_base", lambda: None)
+        components.register("reranker", release.wait, essential=False)
+        app_store["components"] = components
+        components.start()
+        await components.wait("knowledge_base")
+        degraded = await readiness()
+        release.set()
+        await components.wait("reranker")
+        ready = await readiness()
+        await components.stop()
+        return degraded, ready
+
+    try:
+        degraded, ready = asyncio.run(scenario())
+    finally:
+        release.set()
+        app_store.clear()
+
+    assert degraded.status_code == 200
+    assert json.loads(degraded.body)["status"] == "degraded"
+    assert json.loads(degraded.body)["components"]["reranker"]["state"] == "loading"
+    assert json.loads(ready.body)["status"] == "ready"
+
+
+def test_failed_essential_component_is_not_ready():
+    def fail():
+        raise RuntimeError("no index")
+
+    async def scenario():
+        components = ComponentRegistry()
+        components.register("knowledge_base", fail)
+        app_store["components"] = components
+        components.start()
+        await components.stop()
+        return await readiness(), components.is_ready("knowledge_base")
+
+    try:
+        response, knowledge_base_ready = asyncio.run(scenario())
+    finally:
+        app_store.clear()
+
+    assert response.status_code == 503
+    assert json.loads(response.body)["status"] == "failed"
+    assert not knowledge_base_ready
@@ -0,0 +1,124 @@
+import os
+import sqlite3
+
+from langchain_core.documents import Document
+
+import indexing
+from dedup import SignatureIndex, signature, similarity
+from source_index import SOURCE_INDEX_FILE
+from state import app_store
+
+
+def prose(seed: int, count: int = 80) -> str:
+    """Distinct words without digits, so only the numbers a test adds count as numbers."""
+    return " ".join("w" + "".join(chr(ord("a") + int(d)) for d in f"{seed}{i:03d}") for i in range(count))
+
+
+def edited(text: str) -> str:
+    words = text.split()
+    words[len(words) // 2] = "changed"
+    return " ".join(words)
+
+
+def test_signature_normalizes_case_whitespace_and_punctuation():
+    assert signature("Hello,  World!\nAgain.").digest == signature("hello world again").digest
+    assert signature("hello world again").digest != signature("hello world").digest
+
+
+def test_similarity_estimates_shared_shingles():
+    text = prose(1)
+    assert similarity(signature(text), signature(text)) == 1.0
+    assert similarity(signature(text), signature(edited(text))) > 0.85
+    assert similarity(signature(text), signature(prose(2))) < 0.1
+
+
+def test_index_matches_exact_and_near_duplicates():
+    index = SignatureIndex(threshold=0.85, min_tokens=10)
+    text = prose(1) + " total 120 eur due 2024"
+    index.add({"a": signature(text)})
+
+    assert index.match(signature(text.upper())) == ("a", "exact")
+    assert index.match(signature(edited(text))) == ("a", "near")
+    assert index.match(signature(prose(2))) is None
+
+
+def test_near_duplicates_must_have_the_same_numbers():
+    index = SignatureIndex(threshold=0.85, min_tokens=10)
+    index.add({"a": signature(prose(1) + " total 120 eur due 2024")})
+
+    assert index.match(signature(prose(1) + " total 150 eur due 2024")) is None
+    assert index.match(signature(prose(1) + " total 120 eur due 2025")) is None
+    assert index.match(signature(prose(1) + " due 2024 total 120 eur")) is None
+
+
+def test_short_chunks_only_match_exactly():
+    index = SignatureIndex(threshold=0.5, min_tokens=10)
+    index.add({"a": signature("the quick brown fox jumps")})
+
+    assert index.match(signature("the quick brown fox jumps")) == ("a", "exact")
+    assert index.match(signature("the quick brown fox sleeps")) is None
+
+
+def test_index_persists_and_recomputes_signatures_without_numbers(tmp_path):
+    db_path = str(tmp_path / "signatures.sqlite3")
+    index = SignatureIndex(db_path=db_path)
+    index.add({"a": signature(prose(1)), "b": signature(prose(2))})
+    index.remove(["b"])
+    index.close()
+
+    reopened = SignatureIndex(db_path=db_path)
+    assert reopened.ids() == ["a"]
+    assert reopened.match(signature(edited(prose(1)))) == ("a", "near")
+    reopened.close()
+
+    # A database written before numbers were recorded keeps nothing it cannot compare
+    old_path = str(tmp_path / "old.sqlite3")
+    conn = sqlite3.connect(old_path)
+    conn.execute("CREATE TABLE signatures (chunk_id TEXT PRIMARY KEY, digest TEXT NOT NULL, "
+                 "minhash BLOB NOT NULL, tokens INTEGER NOT NULL)")
+    sig = signature(prose(1))
+    conn.execute("INSERT INTO signatures VALUES (?, ?, ?, ?)", ("a", sig.digest, sig.minhash, sig.tokens))
+    conn.commit()
+    conn.close()
+    assert len(SignatureIndex(db_path=old_path)) == 0
+
+
+def test_plan_links_duplicates_and_keeps_near_duplicates_with_other_numbers(kb):
+    kb.add("a.txt", [prose(1) + " price 120 eur", prose(2)])
+
+    signatures = [signature(text) for text in (edited(prose(1)) + " price 120 eur", prose(1) + " price 150 eur", prose(2))]
+    plan = indexing._plan_add([Document(page_content="", metadata={"source": "b.txt"})] * 3, signatures)
+
+    assert plan.new == [1]
+    assert plan.counts == {"new": 1, "exact": 1, "near": 1, "unchanged": 0, "removed": 0}
+    assert sorted(plan.links["b.txt"]) == sorted(app_store["source_index"].chunk_ids("a.txt"))
+
+
+def test_reupload_only_changes_the_chunks_that_differ(kb):
+    kb.add("a.txt", [prose(1), prose(2), prose(3)])
+    kept = set(app_store["source_index"].chunk_ids("a.txt"))
+
+    counts = kb.add("a.txt", [prose(1), edited(prose(2)), prose(4)])
+
+    # The edited chunk is stored again rather than linked to the old version of itself
+    assert counts == {"new": 2, "exact": 0, "near": 0, "unchanged": 1, "removed": 2}
+    assert kb.texts() == {"a.txt": sorted([prose(1), edited(prose(2)), prose(4)])}
+    assert len(kept & set(app_store["source_index"].chunk_ids("a.txt"))) == 1
+    assert kb.chunk_count() == len(app_store["signatures"]) == 3
+
+
+def test_source_index_is_rebuilt_from_the_chunk_store_links(kb):
+    shared = prose(1)
+    kb.add("a.txt", [shared, prose(2)])
+    kb.add("b.txt", [shared, prose(3)])
+    kb.restart(clean=True)
+    kb.delete("a.txt")
+    kb.crash()
+    os.remove(os.path.join(app_store["persistence"].snapshot_dir, SOURCE_INDEX_FILE))
+
+    kb.restart()
+
+    # The shared chunk stays linked to b.txt, and the deleted document does not come back
+    assert kb.texts() == {"b.txt": sorted([shared, prose(3)])}
+    assert kb.chunk_count() == len(app_store["chunk_store"]) == 2
+
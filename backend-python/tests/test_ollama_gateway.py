@@ -0,0 +1,115 @@
+import asyncio
+import threading
+
+import pytest
+from langchain_ollama import OllamaEmbeddings
+
+from benchmarks.fake_ollama import serve
+from indexing import _run_as_background
+from ollama_gateway import (
+    BatchingEmbeddings, ConcurrencyLimiter, OllamaOverloadedError, background_work, client_kwargs,
+)
+
+
+@pytest.fixture
+def fake_ollama():
+    server, state = serve(dimension=8, embed_ms=50)
+    yield f"http://127.0.0.1:{server.server_port}", state
+    server.shutdown()
+
+
+def embeddings_for(base_url: str, limiter: ConcurrencyLimiter) -> OllamaEmbeddings:
+    return OllamaEmbeddings(model="fake", base_url=base_url, **client_kwargs(limiter, limiter.max_concurrency))
+
+
+def test_limiter_hands_slots_over_in_order():
+    limiter = ConcurrencyLimiter("test", max_concurrency=1, max_queue=2)
+    limiter.acquire()
+    order = []
+
+    def wait(name):
+        limiter.acquire()
+        order.append(name)
+        limiter.release()
+
+    first = threading.Thread(target=wait, args=("first",))
+    first.start()
+    while limiter.stats()["queued"] < 1:
+        pass
+    second = threading.Thread(target=wait, args=("second",))
+    second.start()
+    while limiter.stats()["queued"] < 2:
+        pass
+
+    limiter.release()
+    first.join()
+    second.join()
+
+    assert order == ["first", "second"]
+    assert limiter.stats()["in_flight"] == 0
+
+
+def test_full_queue_rejects_interactive_callers_only():
+    limiter = ConcurrencyLimiter("test", max_concurrency=1, max_queue=0)
+    limiter.acquire()
+
+    with pytest.raises(OllamaOverloadedError):
+        limiter.acquire()
+    assert limiter.stats()["rejected"] == 1
+
+    waited = threading.Event()
+
+    def background():
+        background_work.set(True)
+        limiter.acquire()
+        waited.set()
+        limiter.release()
+
+    thread = threading.Thread(target=background)
+    thread.start()
+    limiter.release()
+    thread.join()
+    assert waited.is_set()
+
+
+def test_overloaded_embedding_requests_are_rejected(fake_ollama):
+    base_url, state = fake_ollama
+    limiter = ConcurrencyLimiter("embedding", max_concurrency=1, max_queue=1)
+    embeddings = embeddings_for(base_url, limiter)
+
+    async def embed_concurrently():
+        return await asyncio.gather(
+            *(embeddings.aembed_documents([f"text {i}"]) for i in range(4)), return_exceptions=True
+        )
+
+    results = asyncio.run(embed_concurrently())
+
+    rejected = [result for result in results if isinstance(result, OllamaOverloadedError)]
+    assert len(rejected) == 2
+    assert state.stats()["requests"]["embed"] == 2
+    assert state.stats()["peak_in_flight"] == 1
+
+
+def test_concurrent_queries_are_batched_on_the_event_loop(fake_ollama):
+    base_url, state = fake_ollama
+    underlying = embeddings_for(base_url, ConcurrencyLimiter("embedding", max_concurrency=4, max_queue=64))
+    embeddings = BatchingEmbeddings(underlying, window_ms=20, max_batch=32)
+
+    async def embed_concurrently():
+        return await asyncio.gather(*(embeddings.aembed_query(f"question {i % 5}") for i in range(10)))
+
+    try:
+        vectors = asyncio.run(embed_concurrently())
+    finally:
+        embeddings.close()
+
+    assert state.stats()["requests"]["embed"] == 1
+    assert state.stats()["embedded_texts"] == 5
+    assert embeddings.stats()["queries"] == 10
+    assert vectors[0] == vectors[5] == underlying.embed_query("question 0")
+
+
+def test_index_mutations_run_as_background_work():
+    assert background_work.get() is False
+    assert _run_as_background(background_work.get) is True
+    assert background_work.get() is False
@@ -0,0 +1,142 @@
+# tests/test_persistence.py
+import os
+
+import pytest
+
+import indexing
+from config import settings
+from persistence import CURRENT_FILE, SnapshotStore, WriteAheadLog
+from state import app_store
+from source_index import search_all
+from conftest import paragraph
+
+
+def test_log_is_replayed_after_a_crash(kb):
+    kb.add("a.txt", [paragraph(1), paragraph(2)])
+    kb.add("b.txt", [paragraph(3)])
+    kb.delete("a.txt")
+    kb.restart()
+
+    assert kb.texts() == {"b.txt": [paragraph(3)]}
+    assert kb.chunk_count() == len(app_store["chunk_store"]) == len(app_store["bm25_retriever"].index) == 1
+    assert app_store["persistence"].generation == 0
+
+
+def test_log_is_written_before_the_change_is_applied(kb, monkeypatch):
+    def crash_while_applying(*args, **kwargs):
+        raise RuntimeError("crashed")
+    apply_add = indexing._apply_add
+    monkeypatch.setattr(indexing, "_apply_add", crash_while_applying)
+    with pytest.raises(RuntimeError):
+        kb.add("a.txt", [paragraph(1)])
+    monkeypatch.setattr(indexing, "_apply_add", apply_add)
+
+    kb.restart()
+    assert kb.texts() == {"a.txt": [paragraph(1)]}
+
+
+def test_truncated_log_tail_is_dropped(kb):
+    kb.add("a.txt", [paragraph(1)])
+    wal_path = app_store["persistence"].wal.path
+    kb.crash()
+    good_size = os.path.getsize(wal_path)
+    with open(wal_path, "ab") as f:
+        f.write(b'{"op":"add","chunks":[{"id":"cut-sh')
+
+    indexing.load_knowledge_base()
+    assert kb.texts() == {"a.txt": [paragraph(1)]}
+    assert os.path.getsize(wal_path) == good_size
+
+    # Later records land after the good ones and replay normally
+    kb.add("b.txt", [paragraph(2)])
+    kb.restart()
+    assert kb.texts() == {"a.txt": [paragraph(1)], "b.txt": [paragraph(2)]}
+
+
+def test_replay_stops_at_a_corrupt_record(tmp_path):
+    path = str(tmp_path / "wal.log")
+    wal = WriteAheadLog(path, fsync=False)
+    wal.append({"op": "delete", "source": "a"})
+    wal.close()
+    with open(path, "ab") as f:
+        f.write(b"not json\n")
+
+    wal = WriteAheadLog(path, fsync=False)
+    assert list(wal.replay()) == [{"op": "delete", "source": "a"}]
+    wal.close()
+
+
+def test_missing_current_falls_back_to_the_newest_snapshot(kb):
+    kb.add("a.txt", [paragraph(1)])
+    kb.restart(clean=True)  # Writes snapshot 1
+    kb.add("b.txt", [paragraph(2)])
+    kb.crash()
+    os.remove(os.path.join(kb.root, CURRENT_FILE))
+
+    indexing.load_knowledge_base()
+    assert app_store["persistence"].generation == 1
+    assert kb.texts() == {"a.txt": [paragraph(1)], "b.txt": [paragraph(2)]}
+
+
+@pytest.mark.parametrize("content", [b"", b"\xff\xfe garbage", b"snapshot-000009"])
+def test_unusable_current_deletes_nothing(tmp_path, content):
+    root = tmp_path / "store"
+    for name in ("snapshot-000001", "snapshot-000002"):
+        (root / name).mkdir(parents=True)
+    for name in ("wal-000001.log", "wal-000002.log"):
+        (root / name).write_bytes(b"")
+    (root / CURRENT_FILE).write_bytes(content)
+
+    store = SnapshotStore(str(root), fsync=False)
+    assert store.generation == 2
+    assert {"snapshot-000001", "snapshot-000002", "wal-000001.log", "wal-000002.log"} <= set(os.listdir(root))
+    store.close()
+
+
+def test_loading_never_modifies_the_snapshot(kb):
+    kb.add("a.txt", [paragraph(1)])
+    kb.restart(clean=True)
+    snapshot_dir = app_store["persistence"].snapshot_dir
+    kb.crash()
+    os.remove(os.path.join(snapshot_dir, "bm25_index.json"))
+    before = sorted(os.listdir(snapshot_dir))
+
+    indexing.load_knowledge_base()
+    # The rebuilt BM25 index goes into a new snapshot; the old one was left as it was
+    assert app_store["persistence"].generation == 2
+    assert os.path.exists(os.path.join(app_store["persistence"].snapshot_dir, "bm25_index.json"))
+    assert not os.path.exists(snapshot_dir) or sorted(os.listdir(snapshot_dir)) == before
+    assert kb.texts() == {"a.txt": [paragraph(1)]}
+
+
+def test_indexed_chunks_missing_from_the_chunk_store_are_dropped(kb):
+    kb.add("a.txt", [paragraph(1), paragraph(2)])
+    kb.add("b.txt", [paragraph(3)])
+    kb.restart(clean=True)  # Snapshotted, so replay cannot bring the chunk back
+    lost = app_store["source_index"].chunk_ids("a.txt")[0]
+    # As if a crash hit after the chunk store changed but before the log did
+    app_store["chunk_store"].delete([lost])
+    kb.restart()
+
+    assert kb.texts() == {"a.txt": [paragraph(2)], "b.txt": [paragraph(3)]}
+    assert lost not in app_store["vector_store"].index_to_docstore_id.values()
+    assert lost not in app_store["bm25_retriever"].index
+    assert kb.chunk_count() == len(app_store["chunk_store"]) == 2
+    # Searches only return chunks that exist
+    vector = kb.embeddings.embed_query(paragraph(1))
+    assert len(search_all(app_store["vector_store"], vector, 10)) == 2
+
+
+def test_memory_mapped_index_stays_writable_after_a_snapshot(kb, monkeypatch):
+    monkeypatch.setattr(settings, "FAISS_MMAP", True)
+    kb.add("a.txt", [paragraph(1)])
+    kb.restart(clean=True)
+    kb.crash()
+    os.remove(os.path.join(app_store["persistence"].snapshot_dir, "bm25_index.json"))
+
+    # Loading writes a new snapshot and removes the one the index is mapped from
+    indexing.load_knowledge_base()
+    assert app_store["persistence"].generation == 2
+    kb.add("b.txt", [paragraph(2)])
+    kb.restart()
+    assert kb.texts() == {"a.txt": [paragraph(1)], "b.txt": [paragraph(2)]}
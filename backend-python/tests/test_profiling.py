@@ -0,0 +1,32 @@
+import threading
+import time
+
+from metrics import StackSampler
+
+
+def busy_worker(stop: threading.Event):
+    while not stop.is_set():
+        sum(range(1000))
+
+
+def test_sampler_covers_other_threads(tmp_path):
+    stop = threading.Event()
+    worker = threading.Thread(target=busy_worker, args=(stop,), name="rag_0")
+    sampler = StackSampler(interval=0.001)
+    worker.start()
+    sampler.start()
+    time.sleep(0.1)
+    sampler.stop()
+    stop.set()
+    worker.join()
+
+    worker_samples = sum(count for stack, count in sampler.stacks.items()
+                         if stack[0] == "rag_0" and any(frame.startswith("busy_worker ") for frame in stack))
+    assert sampler.samples > 10
+    assert worker_samples > 0
+    assert not any(stack[0] == "stack-sampler" for stack in sampler.stacks)
+
+    path = tmp_path / "profile.folded"
+    sampler.write_folded(str(path))
+    line = next(line for line in path.read_text().splitlines() if line.startswith("rag_0;"))
+    assert int(line.rsplit(" ", 1)[1]) > 0
@@ -0,0 +1,26 @@
+from langchain_core.documents import Document
+
+from reranking import adaptive_depth, close_matches, fuse
+
+
+def docs(*names):
+    return [Document(page_content=name, id=name) for name in names]
+
+
+def test_close_matches_uses_each_retrievers_own_scores():
+    a, b, c, d = docs("a", "b", "c", "d")
+    keyword_hits = [(a, 10.0), (b, 5.0), (c, 1.0)]
+    vector_hits = [(d, 0.40), (c, 0.45), (b, 0.90)]
+
+    assert close_matches(keyword_hits, vector_hits, keyword_ratio=0.4, distance_margin=0.25) == {"a", "b", "c", "d"}
+    assert close_matches(keyword_hits, vector_hits, keyword_ratio=0.6, distance_margin=0.1) == {"a", "d"}
+
+
+def test_adaptive_depth_keeps_close_matches_in_fusion_order():
+    ranked = docs(*"abcdefgh")
+    fused = fuse([ranked, ranked], weights=[0.5, 0.5])
+
+    assert [doc.id for doc in adaptive_depth(fused, {"b", "f"}, min_depth=0, max_depth=10)] == ["b", "f"]
+    # Topped up with the best of the rest, and capped
+    assert [doc.id for doc in adaptive_depth(fused, {"b", "f"}, min_depth=4, max_depth=10)] == ["a", "b", "c", "f"]
+    assert [doc.id for doc in adaptive_depth(fused, set("abcdefgh"), min_depth=2, max_depth=3)] == ["a", "b", "c"]
@@ -0,0 +1,69 @@
+import asyncio
+
+import pytest
+from langchain_core.language_models import FakeListChatModel
+from langchain_core.messages import AIMessage, HumanMessage
+
+from rewrite import QueryRewriter, refers_to_history
+
+HISTORY = [HumanMessage("What does the premium plan cost?"), AIMessage("It costs 10 EUR a month.")]
+
+
+@pytest.mark.parametrize("question", [
+    "Is it cheaper yearly?",
+    "What about the basic plan?",
+    "And for students?",
+    "Why?",
+    "Tell me more about those limits",
+    "Compare the previous answer with the documentation",
+])
+def test_questions_that_need_the_history(question):
+    assert refers_to_history(question)
+
+
+@pytest.mark.parametrize("question", [
+    "What does the premium plan cost per month?",
+    "How many users can the basic plan support?",
+    "Which documents describe the mock drill procedure?",
+])
+def test_standalone_questions(question):
+    assert not refers_to_history(question)
+
+
+def test_rewrites_are_cached_per_session_and_last_turn():
+    llm = FakeListChatModel(responses=["Is the premium plan cheaper yearly?", "Is the basic plan cheaper yearly?"])
+    rewriter = QueryRewriter(llm)
+
+    async def scenario():
+        return [
+            await rewriter.rewrite("What does the basic plan cost per month?", []),
+            await rewriter.rewrite("What does the basic plan cost per month?", HISTORY, "s1"),
+            await rewriter.rewrite("Is it cheaper yearly?", HISTORY, "s1"),
+            await rewriter.rewrite("is it  cheaper YEARLY?", HISTORY, "s1"),
+            await rewriter.rewrite("Is it cheaper yearly?", HISTORY, "s2"),
+        ]
+    results = asyncio.run(scenario())
+
+    assert results == [
+        ("What does the basic plan cost per month?", False),
+        ("What does the basic plan cost per month?", False),
+        ("Is the premium plan cheaper yearly?", True),
+        ("Is the premium plan cheaper yearly?", False),  # Same question, only spelled differently
+        ("Is the basic plan cheaper yearly?", True),      # Another session has its own entry
+    ]
+    stats = rewriter.stats()
+    assert (stats["skipped_no_history"], stats["skipped_standalone"], stats["cache_hits"], stats["llm_calls"]) == (1, 1, 1, 2)
+    assert stats["skip_rate"] == pytest.approx(2 / 4)
+
+
+def test_rewrite_cache_evicts_the_least_recently_used_entry():
+    llm = FakeListChatModel(responses=["first", "second", "first again"])
+    rewriter = QueryRewriter(llm, cache_size=1)
+
+    async def scenario():
+        await rewriter.rewrite("Is it cheaper?", HISTORY)
+        await rewriter.rewrite("Is it faster?", HISTORY)
+        return await rewriter.rewrite("Is it cheaper?", HISTORY)
+
+    assert asyncio.run(scenario()) == ("first again", True)
+    assert rewriter.cache_hits == 0 and rewriter.llm_calls == 3
@@ -0,0 +1,44 @@
+import asyncio
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+from sessions import SessionManager, window_history
+from utils import estimate_tokens
+
+
+def turn(question: str, answer: str):
+    return [HumanMessage(content=question), AIMessage(content=answer)]
+
+
+def test_window_keeps_the_most_recent_turns_that_fit():
+    messages = turn("a" * 40, "b" * 40) + turn("c" * 40, "d" * 40)
+
+    assert window_history(messages, 25) == messages[2:]
+    assert window_history(messages, 40) == messages
+
+
+def test_window_truncates_a_latest_turn_over_the_budget():
+    messages = turn("short question", "x" * 4000) + turn("what about this?", "y" * 4000)
+
+    kept = window_history(messages, 100)
+
+    assert [message.type for message in kept] == ["human", "ai"]
+    assert kept[0].content == "what about this?"
+    assert kept[1].content.startswith("y")
+    assert sum(estimate_tokens(message.content) for message in kept) <= 100
+
+
+def test_sessions_survive_a_restart(tmp_path):
+    db_path = str(tmp_path / "sessions.sqlite3")
+
+    async def chat(question, answer):
+        sessions = SessionManager(db_path=db_path)
+        await sessions.asave_turn("s1", question, answer)
+        history = await sessions.ahistory("s1")
+        sessions.close()
+        return history
+
+    asyncio.run(chat("first?", "one"))
+    history = asyncio.run(chat("second?", "two"))
+
+    assert [message.content for message in history] == ["first?", "one", "second?", "two"]
@@ -0,0 +1,44 @@
+from source_index import SourceIndex, search_all, search_in_source
+from state import app_store
+from conftest import paragraph
+
+
+def test_sources_map_to_their_chunks_and_faiss_ids():
+    index = SourceIndex()
+    index.add("a.txt", ["a1", "a2"], [0, 1])
+    index.add("b.txt", ["b1"], [2])
+    index.link("b.txt", ["a2", "unknown"])
+
+    assert index.list_sources() == ["a.txt", "b.txt"]
+    assert index.chunk_ids("b.txt") == ["b1", "a2"]
+    assert index.faiss_ids_for("a.txt") == [0, 1]
+    assert index.sources_of("a2") == ("a.txt", "b.txt")
+    assert index.chunk_count() == 3 and index.link_count() == 4
+    assert index.next_faiss_id == 3
+
+
+def test_removing_a_source_forgets_only_the_chunks_nobody_else_has():
+    index = SourceIndex()
+    index.add("a.txt", ["a1", "shared"], [0, 1])
+    index.link("b.txt", ["shared"])
+
+    assert index.unlink("a.txt", index.chunk_ids("a.txt")) == {"a1": 0}
+    assert "a.txt" not in index
+    assert index.sources_of("shared") == ("b.txt",)
+    assert index.faiss_ids_for("b.txt") == [1]
+    assert index.unlink("b.txt", ["shared"]) == {"shared": 1}
+    assert len(index) == 0 and index.chunk_count() == 0
+
+
+def test_scoped_search_matches_a_filtered_full_search(kb):
+    kb.add("a.txt", [paragraph(i) for i in range(6)])
+    kb.add("b.txt", [paragraph(i) for i in range(6, 30)])
+    vector_store, source_index = app_store["vector_store"], app_store["source_index"]
+    in_a = set(source_index.chunk_ids("a.txt"))
+
+    for seed in (0, 3, 10):
+        query = kb.embeddings.embed_query(paragraph(seed))
+        everything = search_all(vector_store, query, kb.chunk_count())
+        expected = [doc.page_content for doc in everything if doc.id in in_a][:4]
+        scoped = search_in_source(vector_store, source_index, "a.txt", query, 4)
+        assert [doc.page_content for doc in scoped] == expected
@@ -1,41 +1,9 @@
-import os
-import io
 import asyncio
+import threading
 import httpx
+from contextlib import contextmanager
 from typing import List
-from PIL import Image
-import pytesseract
-from PyPDF2 import PdfReader
-from fastapi import HTTPException
 from langchain.docstore.document import Document
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-
-def process_and_chunk_text(file_content: bytes, filename: str) -> List[Document]:
-    docs = []
-    file_extension = os.path.splitext(filename)[1].lower()
-    if file_extension == ".pdf":
-        pdf_file = io.BytesIO(file_content)
-        pdf_reader = PdfReader(pdf_file)
-        for i, page in enumerate(pdf_reader.pages):
-            page_text = page.extract_text() or ""
-            if page_text.strip():
-                docs.append(Document(page_content=page_text, metadata={"source": filename, "page": i + 1}))
-    elif file_extension in [".txt", ".md"]:
-        text = file_content.decode("utf-8", errors="ignore")
-        docs.append(Document(page_content=text, metadata={"source": filename}))
-    elif file_extension in [".png", ".jpg", ".jpeg"]:
-         image = Image.open(io.BytesIO(file_content))
-         text = pytesseract.image_to_string(image)
-         if text.strip():
-             docs.append(Document(page_content=text, metadata={"source": filename}))
-    else:
-        raise HTTPException(status_code=400, detail=f"Unsupported file type: {file_extension}")
-
-    if not docs:
-        raise HTTPException(status_code=400, detail=f"Could not extract any text from '{filename}'.")
-
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=150)
-    return text_splitter.split_documents(docs)
 
 async def trigger_n8n_webhooks(urls: List[str], data: dict):
     if not urls: return
@@ -50,3 +18,62 @@ async def trigger_n8n_webhooks(urls: List[str], data: dict):
 
 def format_docs(docs: List[Document]) -> str:
     return "\n\n".join(doc.page_content for doc in docs)
+
+def format_sources(docs: List[Document]) -> List[str]:
+    """
+    Unique, sorted source labels ("file.pdf (Page 3)") for the retrieved chunks. A
+    deduplicated chunk lists every document in its `sources`; the page is only known
+    for the one it was stored from.
+    """
+    labels = set()
+    for doc in docs:
+        source = doc.metadata.get('source', 'N/A')
+        labels.add(source + (f" (Page {doc.metadata['page']})" if 'page' in doc.metadata else ""))
+        labels.update(other for other in doc.metadata.get('sources', ()) if other != source)
+    return sorted(labels)
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count, ~4 characters per token for English text with llama-style tokenizers."""
+    return (len(text) + 3) // 4
+
+class ReadWriteLock:
+    """
+    Lets chat searches (readers) run concurrently on the thread pool while index
+    mutations (writers) get exclusive access. Waiting writers block new readers so
+    a steady stream of queries cannot starve an upload.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._writer = False
+        self._writers_waiting = 0
+
+    @contextmanager
+    def read(self):
+        with self._cond:
+            while self._writer or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self._cond:
+            self._writers_waiting += 1
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._writers_waiting -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()